@@ -0,0 +1,189 @@
+"""
+Vistas de Flask-Admin (/admin)
+
+Se montan con init_admin(app); con ADMIN_MODE=lazy app.py lo hace recién
+en el primer request a /admin, así los workers que sólo cotizan no
+importan ni configuran Flask-Admin al arrancar.
+"""
+from flask_admin import Admin
+from flask_admin.contrib.sqla import ModelView
+from wtforms.validators import NumberRange
+from models import (db, ShippingService, ShippingRate, PriceSurcharge, TrafficFactor, Store,
+                    DeliveryLog, DeliveryLogRollup)
+from services.rate_table import rate_table_cache
+from services.stores import store_table_cache
+
+# Vistas Admin personalizadas
+class RateTableAdminMixin:
+    """Invalida la tabla de tarifas compilada al guardar o eliminar"""
+    
+    def after_model_change(self, form, model, is_created):
+        rate_table_cache.invalidate()
+    
+    def after_model_delete(self, model):
+        rate_table_cache.invalidate()
+
+class ShippingServiceAdmin(RateTableAdminMixin, ModelView):
+    column_list = ('name', 'code', 'active', 'start_hour', 'end_hour')
+    column_labels = {
+        'name': 'Nombre del Servicio',
+        'code': 'Código',
+        'active': 'Activo',
+        'start_hour': 'Hora Inicio (0-23)',
+        'end_hour': 'Hora Fin (0-23)',
+        'description': 'Descripción'
+    }
+    form_columns = ('name', 'code', 'description', 'active', 'start_hour', 'end_hour')
+    column_filters = ('active',)
+    can_export = True
+
+class ShippingRateAdmin(RateTableAdminMixin, ModelView):
+    column_list = ('service_id', 'min_km', 'max_km', 'min_minutes', 'max_minutes', 'price', 'active')
+    column_labels = {
+        'service_id': 'ID Servicio',
+        'min_km': 'KM Mínimo',
+        'max_km': 'KM Máximo',
+        'min_minutes': 'Min. Mínimo',
+        'max_minutes': 'Min. Máximo',
+        'price': 'Precio (CLP)',
+        'active': 'Activo'
+    }
+    form_columns = ('service_id', 'min_km', 'max_km', 'min_minutes', 'max_minutes', 'price', 'active')
+    column_filters = ('service_id', 'active')
+    column_sortable_list = ('min_km', 'max_km', 'price')
+    can_export = True
+
+class PriceSurchargeAdmin(RateTableAdminMixin, ModelView):
+    column_list = ('service_id', 'description', 'start_hour', 'end_hour', 'amount', 'per_km', 'percent', 'active')
+    column_labels = {
+        'service_id': 'ID Servicio (vacío = todos)',
+        'description': 'Descripción',
+        'start_hour': 'Hora Inicio (0-23)',
+        'end_hour': 'Hora Fin (0-24)',
+        'amount': 'Fijo (CLP)',
+        'per_km': 'Por km (CLP)',
+        'percent': 'Porcentaje',
+        'active': 'Activo'
+    }
+    form_columns = ('service_id', 'description', 'start_hour', 'end_hour', 'amount', 'per_km', 'percent', 'active')
+    # Fin 24 = hasta la medianoche (0-24 es todo el día)
+    form_args = {
+        'start_hour': {'validators': [NumberRange(min=0, max=23)]},
+        'end_hour': {'validators': [NumberRange(min=0, max=24)]}
+    }
+    column_filters = ('service_id', 'active')
+
+class TrafficFactorAdmin(RateTableAdminMixin, ModelView):
+    """Factores aprendidos con learn_traffic.py (se pueden corregir a mano)"""
+    column_list = ('hour', 'zone', 'factor', 'samples', 'updated_at')
+    column_labels = {
+        'hour': 'Hora',
+        'zone': 'Zona',
+        'factor': 'Factor',
+        'samples': 'Filas',
+        'updated_at': 'Actualizado'
+    }
+    form_columns = ('hour', 'zone', 'factor')
+    form_args = {
+        'hour': {'validators': [NumberRange(min=0, max=23)]},
+        'factor': {'validators': [NumberRange(min=0.1)]}
+    }
+    column_filters = ('hour', 'zone')
+    column_sortable_list = ('hour', 'factor', 'samples')
+    column_default_sort = 'hour'
+    
+    def on_model_change(self, form, model, is_created):
+        # Zona vacía = factor de la hora para todas las zonas
+        model.zone = model.zone or ''
+
+class StoreAdmin(ModelView):
+    column_list = ('name', 'code', 'address', 'lat', 'lon', 'active')
+    column_labels = {
+        'name': 'Nombre',
+        'code': 'Código',
+        'address': 'Dirección',
+        'lat': 'Latitud',
+        'lon': 'Longitud',
+        'active': 'Activa'
+    }
+    form_columns = ('name', 'code', 'address', 'lat', 'lon', 'active')
+    column_filters = ('active',)
+    can_export = True
+    
+    def after_model_change(self, form, model, is_created):
+        store_table_cache.invalidate()
+    
+    def after_model_delete(self, model):
+        store_table_cache.invalidate()
+
+class DeliveryLogAdmin(ModelView):
+    can_create = False
+    can_edit = False
+    can_delete = True
+    column_list = ('timestamp', 'from_address', 'to_address', 'distance_km', 'service_code', 'calculated_price', 'store_code')
+    column_labels = {
+        'timestamp': 'Fecha/Hora',
+        'from_address': 'Origen',
+        'to_address': 'Destino',
+        'distance_km': 'Distancia (km)',
+        'service_code': 'Servicio',
+        'calculated_price': 'Precio (CLP)',
+        'straight_line_km': 'Línea recta (km)',
+        'rejected_by': 'Rechazado por',
+        'store_code': 'Tienda'
+    }
+    column_filters = ('service_code', 'timestamp', 'rejected_by', 'store_code')
+    column_sortable_list = ('timestamp', 'distance_km', 'calculated_price')
+    can_export = True
+    # El CSV se arma entero en el worker: para rangos grandes, export_logs.py
+    export_max_rows = 10000
+    column_default_sort = ('timestamp', True)
+    # Sin COUNT(*) de toda la tabla en cada página
+    simple_list_pager = True
+
+class DeliveryLogRollupAdmin(ModelView):
+    """Resúmenes del historial (rollup_logs.py): rápidos aunque haya millones de filas"""
+    can_create = False
+    can_edit = False
+    can_delete = False
+    column_list = ('period_start', 'period', 'service_code', 'distance_band_km', 'calculated_price',
+                   'rejected_by', 'route_source', 'quotes', 'revenue', 'avg_distance_km')
+    column_labels = {
+        'period_start': 'Desde (UTC)',
+        'period': 'Período',
+        'service_code': 'Servicio',
+        'distance_band_km': 'Tramo (km)',
+        'calculated_price': 'Precio (CLP)',
+        'rejected_by': 'Rechazado por',
+        'route_source': 'Origen distancia',
+        'quotes': 'Cotizaciones',
+        'revenue': 'Total (CLP)',
+        'avg_distance_km': 'Distancia media (km)'
+    }
+    column_formatters = {
+        'avg_distance_km': lambda view, context, model, name: (
+            round(model.distance_km_sum / model.quotes, 2) if model.quotes else None
+        )
+    }
+    column_filters = ('period', 'period_start', 'service_code', 'distance_band_km', 'rejected_by', 'route_source')
+    column_sortable_list = ('period_start', 'quotes', 'calculated_price', 'distance_band_km')
+    can_export = True
+    column_default_sort = ('period_start', True)
+
+
+def init_admin(app):
+    """Montar Flask-Admin y sus vistas en la app"""
+    admin = Admin(
+        app, 
+        name='Shipping Admin', 
+        template_mode='bootstrap4',
+        url='/admin'
+    )
+    admin.add_view(ShippingServiceAdmin(ShippingService, db.session, name='Servicios'))
+    admin.add_view(ShippingRateAdmin(ShippingRate, db.session, name='Tarifas'))
+    admin.add_view(PriceSurchargeAdmin(PriceSurcharge, db.session, name='Recargos'))
+    admin.add_view(TrafficFactorAdmin(TrafficFactor, db.session, name='Tráfico'))
+    admin.add_view(StoreAdmin(Store, db.session, name='Tiendas'))
+    admin.add_view(DeliveryLogAdmin(DeliveryLog, db.session, name='Historial'))
+    admin.add_view(DeliveryLogRollupAdmin(DeliveryLogRollup, db.session, name='Resumen'))
+    return admin
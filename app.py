@@ -1,75 +1,78 @@
-from flask import Flask, request, jsonify, render_template
-from flask_admin import Admin
-from flask_admin.contrib.sqla import ModelView
-from models import db, ShippingService, ShippingRate, DeliveryLog
-from services.openroute import OpenRouteService
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from models import db
+from services.openroute import ors_stats
+from services.providers import get_provider
+from services.cache import geocode_cache, route_cache
+from services.quotes import parse_quote_request, error_response, price_route, straight_line_precheck, local_route
+from services.coverage import coverage_index
+from services.graph import road_graph
+from services.gazetteer import gazetteer
+from services.distance_field import distance_field
+from services.singleflight import singleflight
+from services.circuit import ors_circuit, ors_local_circuit, osrm_circuit, router_circuit
+from services.fallback import detour_factor, fallback_route
+from services.rate_table import rate_table_cache
+from services.log_writer import delivery_log_writer
+from services.bulk import resolve_origin, bulk_quote
+from services.metrics import metrics
+from services.schema import configure_database
+from services.stores import stores_enabled, select_store
+from services.warmup import startup
 from config import Config
+import json
+import threading
+import time
 import pytz
 from datetime import datetime
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
+configure_database(app)
 
 # ============= FLASK-ADMIN =============
 
-admin = Admin(
-    app, 
-    name='Shipping Admin', 
-    template_mode='bootstrap4',
-    url='/admin'
-)
-
-# Vistas Admin personalizadas
-class ShippingServiceAdmin(ModelView):
-    column_list = ('name', 'code', 'active', 'start_hour', 'end_hour')
-    column_labels = {
-        'name': 'Nombre del Servicio',
-        'code': 'Código',
-        'active': 'Activo',
-        'start_hour': 'Hora Inicio (0-23)',
-        'end_hour': 'Hora Fin (0-23)',
-        'description': 'Descripción'
-    }
-    form_columns = ('name', 'code', 'description', 'active', 'start_hour', 'end_hour')
-    column_filters = ('active',)
-    can_export = True
-
-class ShippingRateAdmin(ModelView):
-    column_list = ('service_id', 'min_km', 'max_km', 'price', 'active')
-    column_labels = {
-        'service_id': 'ID Servicio',
-        'min_km': 'KM Mínimo',
-        'max_km': 'KM Máximo',
-        'price': 'Precio (CLP)',
-        'active': 'Activo'
-    }
-    form_columns = ('service_id', 'min_km', 'max_km', 'price', 'active')
-    column_filters = ('service_id', 'active')
-    column_sortable_list = ('min_km', 'max_km', 'price')
-    can_export = True
-
-class DeliveryLogAdmin(ModelView):
-    can_create = False
-    can_edit = False
-    can_delete = True
-    column_list = ('timestamp', 'from_address', 'to_address', 'distance_km', 'service_code', 'calculated_price')
-    column_labels = {
-        'timestamp': 'Fecha/Hora',
-        'from_address': 'Origen',
-        'to_address': 'Destino',
-        'distance_km': 'Distancia (km)',
-        'service_code': 'Servicio',
-        'calculated_price': 'Precio (CLP)'
-    }
-    column_filters = ('service_code', 'timestamp')
-    column_sortable_list = ('timestamp', 'distance_km', 'calculated_price')
-    can_export = True
-    column_default_sort = ('timestamp', True)
+class LazyAdmin:
+    """
+    Middleware WSGI que monta el admin en el primer request a /admin
+    
+    Flask no admite registrar rutas después del primer request, así que el
+    admin vive en una app Flask aparte (misma configuración y templates) que
+    se crea al primer uso y atiende todo lo que está bajo /admin.
+    """
+    
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self._admin_app = None
+        self._lock = threading.Lock()
+    
+    def admin_app(self):
+        if self._admin_app is None:
+            with self._lock:
+                if self._admin_app is None:
+                    from admin import init_admin
+                    
+                    admin_app = Flask(__name__)
+                    admin_app.config.update(self.app.config)
+                    db.init_app(admin_app)
+                    configure_database(admin_app)
+                    init_admin(admin_app)
+                    self._admin_app = admin_app
+        return self._admin_app
+    
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/admin' or path.startswith('/admin/'):
+            return self.admin_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
 
-admin.add_view(ShippingServiceAdmin(ShippingService, db.session, name='Servicios'))
-admin.add_view(ShippingRateAdmin(ShippingRate, db.session, name='Tarifas'))
-admin.add_view(DeliveryLogAdmin(DeliveryLog, db.session, name='Historial'))
+# ADMIN_MODE: 'eager' (al importar), 'lazy' (primer request a /admin) u 'off'
+if app.config.get('ADMIN_MODE', 'eager') == 'eager':
+    from admin import init_admin
+    init_admin(app)
+elif app.config.get('ADMIN_MODE') == 'lazy':
+    app.wsgi_app = LazyAdmin(app, app.wsgi_app)
 
 # ============= API ENDPOINTS =============
 
@@ -90,167 +93,172 @@ def health():
         "current_time": current_time,
         "timezone": app.config['TIMEZONE'],
         "ors_configured": bool(app.config.get('ORS_API_KEY')),
-        "max_distance_km": app.config['MAX_DELIVERY_DISTANCE_KM']
+        "providers": {
+            "geocoder": app.config.get('GEOCODER_PROVIDER', 'ors'),
+            "router": app.config.get('ROUTER_PROVIDER', 'ors')
+        },
+        "max_distance_km": app.config['MAX_DELIVERY_DISTANCE_KM'],
+        "geocode_cache": geocode_cache.get_stats(),
+        "route_cache": route_cache.get_stats(),
+        "ors": ors_stats.get_stats(),
+        "delivery_log_writer": delivery_log_writer.get_stats(),
+        "coverage_index": coverage_index.get_stats(),
+        "road_graph": road_graph.get_stats(),
+        "gazetteer": gazetteer.get_stats(),
+        "distance_field": distance_field.get_stats(road_graph.get()),
+        "singleflight": singleflight.get_stats(),
+        "ors_circuit": ors_circuit.get_stats(),
+        "ors_local_circuit": ors_local_circuit.get_stats(),
+        "osrm_circuit": osrm_circuit.get_stats(),
+        "fallback": detour_factor.get_stats(),
+        "startup": startup.get_stats()
     }), 200
 
 @app.route('/shipping/services', methods=['GET'])
 def get_services():
     """
     Endpoint para Jumpseller: Lista servicios disponibles
-    """
-    services = ShippingService.query.filter_by(active=True).all()
     
-    available_services = []
-    for service in services:
-        if service.is_available_now(app.config['TIMEZONE']):
-            available_services.append({
-                "service_name": service.name,
-                "service_code": service.code
-            })
+    La respuesta viene pre-serializada de la tabla de tarifas compilada y
+    sólo cambia al empezar una hora (o al editar servicios en el admin);
+    con If-None-Match se responde 304 sin body.
+    """
+    body, etag, seconds_left = rate_table_cache.get().services_response()
     
-    return jsonify({"services": available_services}), 200
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max(1, int(min(seconds_left, app.config.get('SERVICES_MAX_AGE', 60))))
+    return response.make_conditional(request)
 
 @app.route('/shipping/rates', methods=['POST'])
 def calculate_rates():
     """
     Endpoint para Jumpseller: Calcula tarifas de envío
     """
-    data = request.json
-    request_data = data.get('request', {})
+    quote = parse_quote_request(request.json)
+    order_ref = quote['order_ref']
     
-    from_location = request_data.get('from', {})
-    to_location = request_data.get('to', {})
-    order_ref = request_data.get('request_reference', '')
+    # Proveedor de geocodificación y rutas (ORS por defecto)
+    ors = get_provider()
+    store_route = None
     
-    # Inicializar OpenRouteService
-    ors = OpenRouteService()
-    
-    # Variables para almacenar coordenadas
-    from_coords = None
-    to_coords = None
-    from_address = from_location.get('address', 'Origen')
-    to_address = to_location.get('address', 'Destino')
+    # Varias tiendas: se cotiza desde la que más convenga para el destino
+    if stores_enabled():
+        route_error = "No se pudo calcular la distancia"
+        if not quote['to_coords']:
+            if not quote['to_address']:
+                return jsonify(error_response(order_ref, "Faltan direcciones o coordenadas")), 400
+            with metrics.time('geocode'):
+                quote['to_coords'] = ors.geocode(quote['to_address'])
+            if not quote['to_coords']:
+                return jsonify(error_response(order_ref, "No se pudo geocodificar la dirección de destino")), 200
+        
+        with metrics.time('store_selection'):
+            store_route = select_store(ors, quote)
     
     # Opción 1: Si vienen coordenadas, usarlas directamente
-    if from_location.get('latitude') and to_location.get('latitude'):
-        from_coords = {
-            'lat': from_location['latitude'],
-            'lon': from_location['longitude']
-        }
-        to_coords = {
-            'lat': to_location['latitude'],
-            'lon': to_location['longitude']
-        }
-        
-        result = ors.calculate_distance(from_coords, to_coords)
-        
-        if not result:
-            return jsonify({
-                "reference_id": order_ref,
-                "rates": [],
-                "error": "No se pudo calcular la distancia"
-            }), 200
-        
-        distance_km = result['distance_km']
-        duration_minutes = result['duration_minutes']
+    elif quote['from_coords']:
+        route_error = "No se pudo calcular la distancia"
     
-    # Opción 2: Si vienen direcciones, geocodificar primero
+    # Opción 2: Si vienen direcciones, geocodificar primero (en paralelo)
     else:
-        if not from_address or not to_address:
-            return jsonify({
-                "reference_id": order_ref,
-                "rates": [],
-                "error": "Faltan direcciones o coordenadas"
-            }), 400
+        if not quote['from_address'] or not quote['to_address']:
+            return jsonify(error_response(order_ref, "Faltan direcciones o coordenadas")), 400
         
-        result = ors.calculate_from_addresses(from_address, to_address)
+        route_error = "No se pudieron geocodificar las direcciones"
+        with metrics.time('geocode'):
+            quote['from_coords'], quote['to_coords'] = ors.geocode_pair(quote['from_address'], quote['to_address'])
+        
+        if not quote['from_coords']:
+            return jsonify(error_response(order_ref, route_error)), 200
+    
+    # Pre-filtro en línea recta: rechaza sin llamar a ORS
+    rejection = straight_line_precheck(quote)
+    if rejection:
+        return jsonify(rejection), 200
+    
+    with metrics.time('route'):
+        # Campo de distancias / índice de cobertura; ORS sólo si no responden
+        result = store_route or local_route(quote)
         
         if not result:
-            return jsonify({
-                "reference_id": order_ref,
-                "rates": [],
-                "error": "No se pudieron geocodificar las direcciones"
-            }), 200
+            result = ors.calculate_distance(quote['from_coords'], quote['to_coords'])
+            quote['route_source'] = app.config.get('ROUTER_PROVIDER', 'ors')
         
-        distance_km = result['distance_km']
-        duration_minutes = result['duration_minutes']
-        from_coords = result['from_coords']
-        to_coords = result['to_coords']
+        # ORS caído (circuito abierto): tarifa estimada en línea recta x desvío
+        if not result and not router_circuit().is_closed():
+            result = fallback_route(quote)
     
-    # Validar distancia máxima (7 km)
-    max_distance = app.config['MAX_DELIVERY_DISTANCE_KM']
-    if distance_km > max_distance:
-        # Guardar log de consulta rechazada
-        log = DeliveryLog(
-            from_address=from_address,
-            to_address=to_address,
-            from_lat=from_coords['lat'] if from_coords else None,
-            from_lon=from_coords['lon'] if from_coords else None,
-            to_lat=to_coords['lat'] if to_coords else None,
-            to_lon=to_coords['lon'] if to_coords else None,
-            distance_km=distance_km,
-            duration_minutes=duration_minutes,
-            order_reference=order_ref
-        )
-        db.session.add(log)
-        db.session.commit()
-        
-        return jsonify({
-            "reference_id": order_ref,
-            "rates": [],
-            "error": f"Fuera del área de cobertura (máximo {max_distance} km, solicitado {distance_km:.1f} km)"
-        }), 200
+    if not result:
+        return jsonify(error_response(order_ref, route_error)), 200
     
-    # Buscar servicios activos y disponibles
-    services = ShippingService.query.filter_by(active=True).all()
+    response = jsonify(price_route(quote, result))
+    if quote['route_source'] == 'fallback':
+        app.logger.warning(f"Degraded quote {order_ref}: {result['distance_km']} km estimated")
+        response.headers['X-Quote-Degraded'] = 'fallback'
+    return response, 200
+
+@app.route('/shipping/rates/bulk', methods=['POST'])
+def calculate_rates_bulk():
+    """
+    Cotización masiva: un origen y muchos destinos
     
-    rates_response = []
-    for service in services:
-        # Verificar disponibilidad horaria
-        if not service.is_available_now(app.config['TIMEZONE']):
-            continue
-        
-        # Buscar tarifa aplicable para esta distancia
-        applicable_rate = ShippingRate.query.filter(
-            ShippingRate.service_id == service.id,
-            ShippingRate.active == True,
-            ShippingRate.min_km <= distance_km,
-            ShippingRate.max_km > distance_km
-        ).first()
-        
-        if applicable_rate:
-            rates_response.append({
-                "rate_id": f"{service.code}-{applicable_rate.id}",
-                "rate_description": f"{service.name} - {distance_km:.1f} km (≈{duration_minutes:.0f} min)",
-                "service_name": service.name,
-                "service_code": service.code,
-                "total_price": str(applicable_rate.price)
-            })
-            
-            # Guardar log exitoso
-            log = DeliveryLog(
-                from_address=from_address,
-                to_address=to_address,
-                from_lat=from_coords['lat'] if from_coords else None,
-                from_lon=from_coords['lon'] if from_coords else None,
-                to_lat=to_coords['lat'] if to_coords else None,
-                to_lon=to_coords['lon'] if to_coords else None,
-                distance_km=distance_km,
-                duration_minutes=duration_minutes,
-                service_code=service.code,
-                calculated_price=applicable_rate.price,
-                order_reference=order_ref
-            )
-            db.session.add(log)
+    Body: {"from": {...}, "to": [{"id": ..., "address": ...}, ...], "profile": "driving-car"}
+    Respuesta: NDJSON, una línea por destino en el orden recibido
+    """
+    data = request.json or {}
+    origin = data.get('from', {})
+    destinations = data.get('to', [])
+    profile = data.get('profile', 'driving-car')
+    
+    if not isinstance(destinations, list) or not destinations:
+        return jsonify({"error": "Faltan destinos"}), 400
     
-    db.session.commit()
+    max_destinations = app.config['BULK_MAX_DESTINATIONS']
+    if len(destinations) > max_destinations:
+        return jsonify({"error": f"Máximo {max_destinations} destinos por consulta"}), 400
     
-    response = {
-        "reference_id": order_ref,
-        "rates": rates_response
-    }
+    ors = get_provider()
+    from_coords = resolve_origin(ors, origin)
+    if not from_coords:
+        return jsonify({"error": "No se pudo geocodificar el origen"}), 400
     
-    return jsonify(response), 200
+    def generate():
+        for line in bulk_quote(ors, from_coords, destinations, profile):
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# ============= MÉTRICAS =============
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.gauge_add('shipping_requests_in_flight', 1, endpoint=request.endpoint or 'unknown')
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    metrics.inc('shipping_requests_total', endpoint=endpoint, status=response.status_code)
+    metrics.observe('shipping_request_seconds', elapsed, endpoint=endpoint)
+    if endpoint == 'calculate_rates':
+        metrics.observe('shipping_stage_seconds', elapsed, stage='total')
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    metrics.gauge_add('shipping_requests_in_flight', -1, endpoint=request.endpoint or 'unknown')
+    try:
+        metrics.maybe_flush(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_SECONDS', 5))
+    except OSError as e:
+        app.logger.error(f"Metrics flush error: {str(e)}")
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas en formato Prometheus (suma de todos los workers con METRICS_DIR)"""
+    return Response(metrics.render(app.config.get('METRICS_DIR')), mimetype='text/plain; version=0.0.4')
 
 # ============= TEST ENDPOINTS =============
 
@@ -259,7 +267,7 @@ def test_geocode():
     """Endpoint de prueba para geocodificar una dirección"""
     address = request.args.get('address', 'Av. Providencia 1208, Santiago, Chile')
     
-    ors = OpenRouteService()
+    ors = get_provider()
     result = ors.geocode(address)
     
     return jsonify({
@@ -273,7 +281,7 @@ def test_distance():
     from_addr = request.args.get('from', 'Av. Providencia 1208, Santiago, Chile')
     to_addr = request.args.get('to', 'Av. Andrés Bello 2687, Las Condes, Chile')
     
-    ors = OpenRouteService()
+    ors = get_provider()
     result = ors.calculate_from_addresses(from_addr, to_addr)
     
     return jsonify({
@@ -0,0 +1,240 @@
+"""
+Punto de entrada ASGI
+
+POST /shipping/rates se atiende de forma asíncrona (las llamadas a ORS no
+bloquean el worker); el resto de las rutas (admin, /health, ...) se delega
+a la app Flask mediante WsgiToAsgi.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 4010 --workers 2
+"""
+import json
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+from services.circuit import router_circuit
+from services.fallback import fallback_route
+from services.log_writer import delivery_log_writer
+from services.metrics import metrics
+from services.openroute_async import AsyncOpenRouteService
+from services.providers import get_provider, local_geocode
+from services.quotes import parse_quote_request, error_response, price_route, straight_line_precheck, local_route
+from services.stores import stores_enabled, select_store
+
+wsgi_application = WsgiToAsgi(app)
+
+# Cliente ORS asíncrono del proceso (se crea en el evento lifespan)
+ors_client = None
+
+
+def get_ors_client():
+    global ors_client
+    if ors_client is None:
+        ors_client = AsyncOpenRouteService(app)
+    return ors_client
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_json(send, payload, status=200, headers=None):
+    body = app.json.dumps(payload).encode('utf-8') + b'\n'
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode())
+        ] + (headers or [])
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def uses_local_geocoder():
+    return app.config.get('GEOCODER_PROVIDER', 'ors') != 'ors'
+
+
+async def geocode(ors, address):
+    """Geocodificador configurado (GEOCODER_PROVIDER); el cliente ORS asíncrono si no responde"""
+    if uses_local_geocoder():
+        coords = await ors.run_sync(local_geocode, address)
+        if coords:
+            return coords
+    return await ors.geocode(address)
+
+
+async def geocode_pair(ors, from_address, to_address):
+    """Como GazetteerGeocoder.geocode_pair: a ORS sólo las direcciones que no se resuelven localmente"""
+    from_coords = to_coords = None
+    if uses_local_geocoder():
+        from_coords, to_coords = await ors.run_sync(
+            lambda: (local_geocode(from_address), local_geocode(to_address))
+        )
+
+    if from_coords is None and to_coords is None:
+        return await ors.geocode_pair(from_address, to_address)
+    if from_coords is None:
+        from_coords = await ors.geocode(from_address)
+    elif to_coords is None:
+        to_coords = await ors.geocode(to_address)
+
+    if not from_coords or not to_coords:
+        return None, None
+    return from_coords, to_coords
+
+
+async def calculate_rates(scope, receive, send):
+    """
+    Endpoint para Jumpseller: Calcula tarifas de envío (versión asíncrona)
+    """
+    try:
+        data = json.loads(await read_body(receive) or b'null')
+    except ValueError:
+        await send_json(send, {"error": "JSON inválido"}, 400)
+        return
+
+    quote = parse_quote_request(data)
+    order_ref = quote['order_ref']
+    ors = get_ors_client()
+    store_route = None
+
+    # Varias tiendas: se cotiza desde la que más convenga para el destino
+    if await ors.run_sync(stores_enabled):
+        route_error = "No se pudo calcular la distancia"
+        if not quote['to_coords']:
+            if not quote['to_address']:
+                await send_json(send, error_response(order_ref, "Faltan direcciones o coordenadas"), 400)
+                return
+            with metrics.time('geocode'):
+                quote['to_coords'] = await geocode(ors, quote['to_address'])
+            if not quote['to_coords']:
+                await send_json(send, error_response(order_ref, "No se pudo geocodificar la dirección de destino"))
+                return
+
+        # Candidatas y /matrix con el cliente síncrono, en un thread
+        with metrics.time('store_selection'):
+            store_route = await ors.run_sync(lambda: select_store(get_provider(), quote))
+
+    # Opción 1: Si vienen coordenadas, usarlas directamente
+    elif quote['from_coords']:
+        route_error = "No se pudo calcular la distancia"
+
+    # Opción 2: Si vienen direcciones, geocodificar primero (en paralelo)
+    else:
+        if not quote['from_address'] or not quote['to_address']:
+            await send_json(send, error_response(order_ref, "Faltan direcciones o coordenadas"), 400)
+            return
+
+        route_error = "No se pudieron geocodificar las direcciones"
+        with metrics.time('geocode'):
+            quote['from_coords'], quote['to_coords'] = await geocode_pair(
+                ors, quote['from_address'], quote['to_address']
+            )
+
+        if not quote['from_coords']:
+            await send_json(send, error_response(order_ref, route_error))
+            return
+
+    # Pre-filtro en línea recta: rechaza sin llamar a ORS
+    rejection = await ors.run_sync(straight_line_precheck, quote)
+    if rejection:
+        await send_json(send, rejection)
+        return
+
+    with metrics.time('route'):
+        # Campo de distancias / índice de cobertura; ORS sólo si no responden
+        result = store_route or await ors.run_sync(local_route, quote)
+
+        if not result:
+            if app.config.get('ROUTER_PROVIDER', 'ors') == 'ors':
+                result = await ors.calculate_distance(quote['from_coords'], quote['to_coords'])
+            else:
+                # Router local (mismo host): la llamada síncrona es corta
+                result = await ors.run_sync(
+                    lambda: get_provider().calculate_distance(quote['from_coords'], quote['to_coords'])
+                )
+            quote['route_source'] = app.config.get('ROUTER_PROVIDER', 'ors')
+
+        # ORS caído (circuito abierto): tarifa estimada en línea recta x desvío
+        if not result and not await ors.run_sync(lambda: router_circuit().is_closed()):
+            result = await ors.run_sync(fallback_route, quote)
+
+    if not result:
+        await send_json(send, error_response(order_ref, route_error))
+        return
+
+    # Tarifas y log en un thread (SQLAlchemy es síncrono)
+    response = await ors.run_sync(price_route, quote, result)
+
+    headers = []
+    if quote['route_source'] == 'fallback':
+        app.logger.warning(f"Degraded quote {order_ref}: {result['distance_km']} km estimated")
+        headers.append((b'x-quote-degraded', b'fallback'))
+    await send_json(send, response, headers=headers)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_ors_client()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if ors_client is not None:
+                await ors_client.aclose()
+            delivery_log_writer.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+ASYNC_ROUTES = {
+    ('POST', '/shipping/rates'): calculate_rates,
+}
+
+
+async def instrumented(endpoint, handler, scope, receive, send):
+    """Métricas de request para las rutas asíncronas (como los hooks de app.py)"""
+    status = {}
+
+    async def send_with_status(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        await send(message)
+
+    start = time.perf_counter()
+    metrics.gauge_add('shipping_requests_in_flight', 1, endpoint=endpoint)
+    try:
+        await handler(scope, receive, send_with_status)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.gauge_add('shipping_requests_in_flight', -1, endpoint=endpoint)
+        metrics.inc('shipping_requests_total', endpoint=endpoint, status=status.get('code', 500))
+        metrics.observe('shipping_request_seconds', elapsed, endpoint=endpoint)
+        metrics.observe('shipping_stage_seconds', elapsed, stage='total')
+        try:
+            metrics.maybe_flush(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_SECONDS', 5))
+        except OSError as e:
+            app.logger.error(f"Metrics flush error: {str(e)}")
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+        return
+
+    handler = None
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+
+    if handler is not None:
+        await instrumented(handler.__name__, handler, scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,241 @@
+"""
+Servidor local que imita OpenRouteService (geocode, directions y matrix) y,
+en las mismas rutas que osrm-routed, OSRM (/route/v1 y /table/v1)
+
+Permite probar la API (WSGI o ASGI) sin API key ni cuota:
+
+    python bench/fake_ors.py --port 8765 --latency-ms 150
+    ORS_BASE_URL=http://127.0.0.1:8765/v2 uvicorn asgi:application --port 4010
+    ROUTER_PROVIDER=osrm OSRM_BASE_URL=http://127.0.0.1:8765 python app.py
+
+Con --error-rate una fracción de las llamadas responde 503 (o 429 con
+--error-status 429). GET /_stats devuelve las llamadas recibidas por
+operación (`?reset=1` las pone en cero); bench/load_test.py lo usa para
+reportar cuántas llamadas a ORS hizo la API.
+
+Las direcciones se geocodifican de forma determinística a un punto cercano
+a Providencia; las distancias son la distancia haversine por un factor de
+desvío.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+# Centro de la grilla de direcciones falsas (Providencia, Santiago)
+CENTER_LAT = -33.4263
+CENTER_LON = -70.6170
+DETOUR_FACTOR = 1.3
+SPEED_KMH = 25.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def fake_coords(text, radius_km=8.0):
+    """Coordenadas determinísticas para una dirección (mismo texto, mismo punto)"""
+    digest = hashlib.sha1(text.strip().lower().encode('utf-8')).digest()
+    dx = (int.from_bytes(digest[:4], 'big') / 2 ** 32 * 2 - 1) * radius_km
+    dy = (int.from_bytes(digest[4:8], 'big') / 2 ** 32 * 2 - 1) * radius_km
+    lat = CENTER_LAT + dy / 111.32
+    lon = CENTER_LON + dx / (111.32 * math.cos(math.radians(CENTER_LAT)))
+    return lat, lon
+
+
+class CallStats:
+    """Llamadas recibidas por operación y código de respuesta"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def record(self, operation, status):
+        key = f"{operation}:{status}"
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            calls = dict(self.calls)
+            if reset:
+                self.calls.clear()
+        return calls
+
+
+class FakeORSHandler(BaseHTTPRequestHandler):
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    error_rate = 0.0
+    error_status = 503
+    stats = None
+    random = random.Random()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sleep(self):
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay = max(0.0, delay + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+        if delay:
+            time.sleep(delay / 1000)
+
+    def _upstream(self, operation):
+        """Simular latencia y errores; True si ya se respondió con un error"""
+        self._sleep()
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats.record(operation, self.error_status)
+            self._send({'error': 'fake upstream error'}, self.error_status)
+            return True
+        self.stats.record(operation, 200)
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/_stats':
+            reset = parse_qs(url.query).get('reset', ['0'])[0] == '1'
+            self._send(self.stats.snapshot(reset))
+            return
+
+        if url.path.startswith(('/route/v1/', '/table/v1/')):
+            operation = 'osrm_route' if url.path.startswith('/route/v1/') else 'osrm_table'
+            if not self._upstream(operation):
+                self._send(self._osrm(url))
+            return
+
+        if not url.path.endswith('/geocode/search'):
+            self._send({'error': 'not found'}, 404)
+            return
+
+        if self._upstream('geocode'):
+            return
+        text = parse_qs(url.query).get('text', [''])[0]
+        if not text.strip():
+            self._send({'features': []})
+            return
+
+        lat, lon = fake_coords(text)
+        self._send({
+            'features': [{
+                'geometry': {'coordinates': [lon, lat]},
+                'properties': {'label': text}
+            }]
+        })
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if '/matrix/' in self.path:
+            if not self._upstream('matrix'):
+                self._send(self._matrix(body))
+            return
+
+        if '/directions/' not in self.path:
+            self._send({'error': 'not found'}, 404)
+            return
+
+        if self._upstream('directions'):
+            return
+        (lon1, lat1), (lon2, lat2) = body['coordinates'][:2]
+        distance_m = haversine_km(lat1, lon1, lat2, lon2) * DETOUR_FACTOR * 1000
+        self._send({
+            'routes': [{
+                'summary': {
+                    'distance': distance_m,
+                    'duration': distance_m / (SPEED_KMH / 3.6)
+                }
+            }]
+        })
+
+    def _matrix(self, body):
+        locations = body['locations']
+        sources = body.get('sources') or list(range(len(locations)))
+        destinations = body.get('destinations') or list(range(len(locations)))
+
+        distances = []
+        for i in sources:
+            lon1, lat1 = locations[i]
+            distances.append([
+                haversine_km(lat1, lon1, locations[j][1], locations[j][0]) * DETOUR_FACTOR * 1000
+                for j in destinations
+            ])
+
+        return {
+            'distances': distances,
+            'durations': [[d / (SPEED_KMH / 3.6) for d in row] for row in distances]
+        }
+
+
+    def _osrm(self, url):
+        points = [tuple(map(float, pair.split(','))) for pair in unquote(url.path).rsplit('/', 1)[1].split(';')]
+
+        def distance_m(a, b):
+            return haversine_km(a[1], a[0], b[1], b[0]) * DETOUR_FACTOR * 1000
+
+        if url.path.startswith('/route/v1/'):
+            distance = distance_m(points[0], points[1])
+            return {'code': 'Ok', 'routes': [{'distance': distance, 'duration': distance / (SPEED_KMH / 3.6)}]}
+
+        query = parse_qs(url.query)
+        sources = [int(i) for i in query.get('sources', ['0'])[0].split(';')]
+        if 'destinations' in query:
+            targets = [points[int(j)] for j in query['destinations'][0].split(';')]
+        else:
+            targets = points
+        distances = [[distance_m(points[i], point) for point in targets] for i in sources]
+        return {
+            'code': 'Ok',
+            'distances': distances,
+            'durations': [[d / (SPEED_KMH / 3.6) for d in row] for row in distances]
+        }
+
+
+def make_server(host='127.0.0.1', port=8765, latency_ms=0.0, jitter_ms=0.0,
+                error_rate=0.0, error_status=503, seed=None):
+    handler = type('Handler', (FakeORSHandler,), {
+        'latency_ms': latency_ms,
+        'jitter_ms': jitter_ms,
+        'error_rate': error_rate,
+        'error_status': error_status,
+        'stats': CallStats(),
+        'random': random.Random(seed)
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor OpenRouteService falso')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Variación uniforme +/- de la latencia')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de llamadas que fallan (0-1)')
+    parser.add_argument('--error-status', type=int, default=503, help='Código de las llamadas que fallan')
+    parser.add_argument('--seed', type=int, help='Semilla para latencias y errores reproducibles')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency_ms, args.jitter_ms,
+                         args.error_rate, args.error_status, args.seed)
+    print(f"🛰️  ORS falso en http://{args.host}:{args.port}/v2 (latencia {args.latency_ms:.0f} ms, "
+          f"errores {args.error_rate * 100:.0f} %)")
+    server.serve_forever()
@@ -0,0 +1,94 @@
+"""
+Comparar el gazetteer con las direcciones ya geocodificadas del historial
+
+Toma de DeliveryLog direcciones con coordenadas (geocodificadas por ORS o
+enviadas por Jumpseller), las geocodifica con el gazetteer (GAZETTEER_PATH)
+y reporta latencia, error en metros y cuántas se resolverían sin ORS para
+distintos umbrales de confianza:
+
+    python bench/gazetteer_vs_ors.py --limit 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db, DeliveryLog  # noqa: E402
+from services.cache import normalize_address  # noqa: E402
+from services.gazetteer import Gazetteer  # noqa: E402
+from services.geo import haversine_km  # noqa: E402
+
+THRESHOLDS = (0.6, 0.7, 0.8, 0.85, 0.9, 0.95)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load_samples(limit):
+    """Una muestra (dirección, lat, lon) por dirección normalizada, las más recientes primero"""
+    samples = {}
+    for column, lat, lon in (
+        (DeliveryLog.to_address, DeliveryLog.to_lat, DeliveryLog.to_lon),
+        (DeliveryLog.from_address, DeliveryLog.from_lat, DeliveryLog.from_lon),
+    ):
+        query = db.session.query(column, lat, lon).filter(
+            column.isnot(None), lat.isnot(None), lon.isnot(None)
+        ).order_by(DeliveryLog.id.desc())
+
+        for address, address_lat, address_lon in query.yield_per(1000):
+            key = normalize_address(address)
+            if key and key not in samples:
+                samples[key] = (address, address_lat, address_lon)
+                if len(samples) >= limit:
+                    return list(samples.values())
+    return list(samples.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del gazetteer contra el historial')
+    parser.add_argument('--gazetteer', help='Archivo del gazetteer (default: GAZETTEER_PATH)')
+    parser.add_argument('--limit', type=int, default=2000, help='Direcciones distintas a comparar')
+    args = parser.parse_args()
+
+    with app.app_context():
+        gazetteer = Gazetteer.load(args.gazetteer or app.config['GAZETTEER_PATH'])
+        samples = load_samples(args.limit)
+        if not samples:
+            sys.exit("No hay direcciones con coordenadas en DeliveryLog")
+
+        latencies = []
+        results = []  # (confianza, error en metros)
+        unmatched = 0
+        for address, lat, lon in samples:
+            start = time.perf_counter()
+            found = gazetteer.lookup(address)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if found is None:
+                unmatched += 1
+                continue
+            results.append((found['confidence'], haversine_km(lat, lon, found['lat'], found['lon']) * 1000))
+
+        print(f"📊 {len(samples)} direcciones ({gazetteer.streets} calles, {gazetteer.addresses} números)")
+        print(f"   Sin candidato:          {unmatched}")
+        print(f"   Latencia p50/p95/max:   {percentile(latencies, 0.5):.2f} / "
+              f"{percentile(latencies, 0.95):.2f} / {max(latencies):.2f} ms")
+        print(f"   {'Confianza ≥':<12} {'Locales':>8} {'Error p50':>10} {'p95':>8} {'≤100 m':>8}")
+        for threshold in THRESHOLDS:
+            errors = [error for confidence, error in results if confidence >= threshold]
+            if not errors:
+                continue
+            near = sum(1 for error in errors if error <= 100)
+            print(f"   {threshold:<12} {len(errors) / len(samples) * 100:>7.1f}% "
+                  f"{percentile(errors, 0.5):>8.0f} m {percentile(errors, 0.95):>6.0f} m "
+                  f"{near / len(errors) * 100:>7.1f}%")
+
+
+if __name__ == '__main__':
+    main()
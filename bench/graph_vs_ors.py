@@ -0,0 +1,110 @@
+"""
+Comparar el router en proceso (grafo vial) con las rutas reales del historial
+
+Toma de DeliveryLog las consultas con distancia medida por ORS/OSRM, las
+rutea con el grafo (GRAPH_PATH) y reporta latencia, error de distancia y
+cuántas caen en el mismo tramo de tarifa:
+
+    python bench/graph_vs_ors.py --limit 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db, DeliveryLog  # noqa: E402
+from services.graph import RoadGraph  # noqa: E402
+from services.quotes import find_rates  # noqa: E402
+
+# Rutas calculadas por un router de red vial (no estimadas ni del índice)
+ROUTED_SOURCES = ('ors', 'ors-local', 'osrm')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load_samples(limit):
+    query = db.session.query(
+        DeliveryLog.from_lat, DeliveryLog.from_lon, DeliveryLog.to_lat, DeliveryLog.to_lon,
+        DeliveryLog.distance_km, DeliveryLog.duration_minutes
+    ).filter(
+        DeliveryLog.distance_km.isnot(None),
+        DeliveryLog.from_lat.isnot(None),
+        DeliveryLog.to_lat.isnot(None),
+        db.or_(DeliveryLog.route_source.in_(ROUTED_SOURCES), DeliveryLog.route_source.is_(None))
+    ).order_by(DeliveryLog.id.desc())
+
+    # Una muestra por par origen/destino (el historial repite filas por servicio)
+    samples = {}
+    for row in query.yield_per(1000):
+        key = tuple(round(value, 5) for value in row[:4])
+        if key not in samples:
+            samples[key] = row
+            if len(samples) >= limit:
+                break
+    return list(samples.values())
+
+
+def rate_keys(distance_km):
+    return {(service.code, band.rate_id) for service, band, _ in find_rates(distance_km)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del grafo vial contra el historial')
+    parser.add_argument('--graph', help='Archivo del grafo (default: GRAPH_PATH)')
+    parser.add_argument('--limit', type=int, default=1000, help='Pares origen/destino a comparar')
+    args = parser.parse_args()
+
+    with app.app_context():
+        graph = RoadGraph.load(args.graph or app.config['GRAPH_PATH'])
+        snap_m = app.config.get('GRAPH_SNAP_MAX_M', 300)
+        samples = load_samples(args.limit)
+        if not samples:
+            sys.exit("No hay rutas medidas en DeliveryLog")
+
+        latencies = []
+        errors = []
+        same_rates = 0
+        unroutable = 0
+
+        for from_lat, from_lon, to_lat, to_lon, distance_km, _ in samples:
+            start = time.perf_counter()
+            source = graph.nearest_node({'lat': from_lat, 'lon': from_lon}, snap_m)
+            target = graph.nearest_node({'lat': to_lat, 'lon': to_lon}, snap_m)
+            found = graph.route(source, target) if source is not None and target is not None else None
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            if found is None:
+                unroutable += 1
+                continue
+
+            graph_km = found[1] / 1000
+            if distance_km > 0:
+                errors.append((graph_km - distance_km) / distance_km * 100)
+            if rate_keys(graph_km) == rate_keys(distance_km):
+                same_rates += 1
+
+        routed = len(samples) - unroutable
+        abs_errors = [abs(error) for error in errors]
+
+        print(f"📊 {len(samples)} pares ({graph.nodes} nodos, {graph.edges} arcos)")
+        print(f"   Sin ruta en el grafo:   {unroutable}")
+        print(f"   Latencia p50/p95/max:   {percentile(latencies, 0.5):.2f} / "
+              f"{percentile(latencies, 0.95):.2f} / {max(latencies):.2f} ms")
+        if errors:
+            print(f"   Error |%| p50/p95:      {percentile(abs_errors, 0.5):.1f} / {percentile(abs_errors, 0.95):.1f} %")
+            print(f"   Error medio (sesgo):    {statistics.mean(errors):+.1f} %")
+        if routed:
+            print(f"   Mismas tarifas:         {same_rates}/{routed} ({same_rates / routed * 100:.1f} %)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+Prueba de carga de la API de cotizaciones
+
+Envía cotizaciones a /shipping/rates (y una fracción a /shipping/services)
+con N clientes concurrentes y reporta throughput, latencia p50/p95/p99 y,
+si se indica el ORS falso, cuántas llamadas a ORS hizo la API:
+
+    python bench/fake_ors.py --port 8765 --latency-ms 150 --jitter-ms 50
+    ORS_BASE_URL=http://127.0.0.1:8765/v2 gunicorn -w 4 -b :4010 app:app
+    python bench/load_test.py --url http://127.0.0.1:4010 --ors http://127.0.0.1:8765 \\
+        --requests 2000 --concurrency 32 --save gunicorn-4w
+
+La carga es sintética (direcciones de Santiago con popularidad tipo Zipf,
+desde la tienda) o se repite un archivo JSONL con un body de Jumpseller por
+línea (--replay). --compare contrasta el resultado con una línea base
+guardada y termina con código 1 si el throughput, el p95 o las llamadas a ORS
+empeoraron más que --tolerance (el p99 se muestra pero es muy ruidoso).
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from fake_ors import fake_coords
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+COMUNAS = (
+    'Providencia', 'Ñuñoa', 'Las Condes', 'Santiago', 'Vitacura', 'La Reina',
+    'Macul', 'San Miguel', 'Recoleta', 'Independencia', 'Estación Central', 'Lo Barnechea',
+)
+CALLES = (
+    'Av. Providencia', 'Av. Irarrázaval', 'Av. Apoquindo', 'Av. Vicuña Mackenna',
+    'Av. Los Leones', 'Av. Pedro de Valdivia', 'Av. Grecia', 'Av. Tobalaba',
+    'Av. Italia', 'Av. Manuel Montt', 'José Domingo Cañas', 'Eliodoro Yáñez',
+    'Av. Bilbao', 'Suecia', 'Antonio Varas', 'Av. Salvador', 'Lyon', 'Holanda',
+)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ----- Carga -----
+
+def synthetic_workload(count, store_address, unique_addresses, zipf_s, coords_ratio, services_ratio, seed):
+    """
+    Cotizaciones desde la tienda a direcciones de Santiago
+
+    Las direcciones salen de un conjunto de `unique_addresses` con
+    popularidad 1/rango^s (pocas direcciones muy repetidas y una cola larga),
+    como el historial real: así se ejercitan los caches.
+    """
+    rng = random.Random(seed)
+    addresses = [
+        f"{rng.choice(CALLES)} {rng.randint(100, 9999)}, {rng.choice(COMUNAS)}, Santiago"
+        for _ in range(unique_addresses)
+    ]
+    weights = [1 / (rank + 1) ** zipf_s for rank in range(unique_addresses)]
+    store_lat, store_lon = fake_coords(store_address)
+
+    workload = []
+    for i in range(count):
+        if rng.random() < services_ratio:
+            workload.append(('services', None))
+            continue
+
+        to_address = rng.choices(addresses, weights)[0]
+        body = {
+            'request': {
+                'request_reference': f"LOAD-{i}",
+                'from': {'address': store_address},
+                'to': {'address': to_address}
+            }
+        }
+        # Parte de los checkouts ya trae coordenadas (sin geocodificar)
+        if rng.random() < coords_ratio:
+            to_lat, to_lon = fake_coords(to_address)
+            body['request']['from'].update(latitude=store_lat, longitude=store_lon)
+            body['request']['to'].update(latitude=to_lat, longitude=to_lon)
+        workload.append(('rates', body))
+
+    return workload
+
+
+def replay_workload(path, count, services_ratio, seed):
+    """Bodies de Jumpseller desde un JSONL (se repite el archivo si hace falta)"""
+    with open(path, encoding='utf-8') as f:
+        bodies = [json.loads(line) for line in f if line.strip()]
+    if not bodies:
+        sys.exit(f"{path} no tiene payloads")
+
+    rng = random.Random(seed)
+    workload = []
+    for i in range(count or len(bodies)):
+        if rng.random() < services_ratio:
+            workload.append(('services', None))
+        else:
+            workload.append(('rates', bodies[i % len(bodies)]))
+    return workload
+
+
+# ----- Ejecución -----
+
+class Runner:
+    """Clientes concurrentes (una sesión HTTP por hilo) que registran latencias"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.results = []
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, item):
+        endpoint, body = item
+        start = time.perf_counter()
+        degraded = False
+        try:
+            if endpoint == 'services':
+                response = self._session().get(f"{self.base_url}/shipping/services", timeout=self.timeout)
+            else:
+                response = self._session().post(f"{self.base_url}/shipping/rates", json=body, timeout=self.timeout)
+            status = response.status_code
+            degraded = 'X-Quote-Degraded' in response.headers
+        except requests.exceptions.RequestException:
+            status = None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self.results.append((endpoint, status, elapsed_ms, degraded))
+
+    def run(self, workload, concurrency):
+        self.results = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(self.send, workload))
+        return time.perf_counter() - start
+
+
+def ors_calls(ors_url, reset=False):
+    """Llamadas recibidas por el ORS falso ({'operación:código': n}) o None"""
+    if not ors_url:
+        return None
+    try:
+        response = requests.get(f"{ors_url.rstrip('/')}/_stats", params={'reset': int(reset)}, timeout=5)
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def summarize(results, elapsed_s, upstream):
+    report = {'elapsed_s': round(elapsed_s, 3), 'endpoints': {}}
+
+    for endpoint in sorted({result[0] for result in results}):
+        rows = [result for result in results if result[0] == endpoint]
+        latencies = [row[2] for row in rows]
+        report['endpoints'][endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[1] != 200),
+            'degraded': sum(1 for row in rows if row[3]),
+            'throughput_rps': round(len(rows) / elapsed_s, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(max(latencies), 2)
+        }
+
+    report['throughput_rps'] = round(len(results) / elapsed_s, 1)
+    if upstream is not None:
+        quotes = report['endpoints'].get('rates', {}).get('requests', 0)
+        report['upstream_calls'] = upstream
+        report['upstream_per_quote'] = round(sum(upstream.values()) / quotes, 3) if quotes else None
+    return report
+
+
+def print_report(report):
+    print(f"📊 {report['throughput_rps']} req/s en {report['elapsed_s']} s")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"   {endpoint:<9} {stats['requests']:>6} req  {stats['throughput_rps']:>8} req/s  "
+              f"p50/p95/p99 {stats['p50_ms']:.1f} / {stats['p95_ms']:.1f} / {stats['p99_ms']:.1f} ms  "
+              f"errores {stats['errors']}  degradadas {stats['degraded']}")
+    if 'upstream_calls' in report:
+        calls = ', '.join(f"{key}={value}" for key, value in sorted(report['upstream_calls'].items()))
+        print(f"   ORS: {calls or 'sin llamadas'} ({report['upstream_per_quote']} por cotización)")
+
+
+# ----- Líneas base -----
+
+def baseline_path(name):
+    if os.sep in name or name.endswith('.json'):
+        return name
+    return os.path.join(BASELINES_DIR, f"{name}.json")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Imprimir diferencias con la línea base; devuelve las regresiones"""
+    regressions = []
+    print(f"🔍 Comparado con {baseline.get('name')} ({baseline.get('saved_at')}, {baseline.get('git')})")
+
+    old_rps, new_rps = baseline['report']['throughput_rps'], report['throughput_rps']
+    print(f"   throughput      {old_rps:>9} → {new_rps:<9} req/s")
+    if old_rps and new_rps < old_rps * (1 - tolerance):
+        regressions.append(f"throughput {old_rps} → {new_rps} req/s")
+
+    for endpoint, stats in report['endpoints'].items():
+        old = baseline['report']['endpoints'].get(endpoint)
+        if old is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            print(f"   {endpoint:<9} {metric:<6} {old[metric]:>8.1f} → {stats[metric]:<8.1f} ms")
+            if metric == 'p95_ms' and stats[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{endpoint} {metric} {old[metric]} → {stats[metric]} ms")
+
+    old_calls = baseline['report'].get('upstream_per_quote')
+    new_calls = report.get('upstream_per_quote')
+    if old_calls is not None and new_calls is not None:
+        print(f"   ORS por cotización {old_calls:>6} → {new_calls}")
+        if new_calls > old_calls * (1 + tolerance) + 0.01:
+            regressions.append(f"ORS por cotización {old_calls} → {new_calls}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de /shipping/rates')
+    parser.add_argument('--url', default='http://127.0.0.1:4010', help='URL base de la API')
+    parser.add_argument('--ors', help='URL del ORS falso (bench/fake_ors.py) para contar llamadas')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests a enviar')
+    parser.add_argument('--concurrency', type=int, default=16, help='Clientes concurrentes')
+    parser.add_argument('--warmup', type=int, default=0, help='Requests previos que no se miden')
+    parser.add_argument('--timeout', type=float, default=30, help='Timeout por request (s)')
+    parser.add_argument('--replay', help='JSONL con un body de /shipping/rates por línea')
+    parser.add_argument('--store-address', default='Av. Providencia 1234, Providencia, Santiago')
+    parser.add_argument('--unique-addresses', type=int, default=500, help='Direcciones distintas (sintética)')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Exponente de popularidad de las direcciones')
+    parser.add_argument('--coords-ratio', type=float, default=0.0, help='Fracción de payloads con coordenadas')
+    parser.add_argument('--services-ratio', type=float, default=0.1, help='Fracción de GET /shipping/services')
+    parser.add_argument('--seed', type=int, default=1, help='Semilla de la carga')
+    parser.add_argument('--save', metavar='NOMBRE', help='Guardar el resultado como línea base')
+    parser.add_argument('--compare', metavar='NOMBRE', help='Comparar con una línea base guardada')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Empeoramiento tolerado (fracción)')
+    args = parser.parse_args()
+
+    total = args.warmup + args.requests
+    if args.replay:
+        workload = replay_workload(args.replay, total, args.services_ratio, args.seed)
+    else:
+        workload = synthetic_workload(total, args.store_address, args.unique_addresses, args.zipf,
+                                      args.coords_ratio, args.services_ratio, args.seed)
+
+    runner = Runner(args.url, args.timeout)
+    if args.warmup:
+        print(f"🔥 Calentando con {args.warmup} requests...")
+        runner.run(workload[:args.warmup], args.concurrency)
+
+    ors_calls(args.ors, reset=True)
+    print(f"🚀 {len(workload) - args.warmup} requests, {args.concurrency} clientes → {args.url}")
+    elapsed_s = runner.run(workload[args.warmup:], args.concurrency)
+    report = summarize(runner.results, elapsed_s, ors_calls(args.ors))
+    print_report(report)
+
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'name': args.save,
+                'saved_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'git': git_revision(),
+                'args': vars(args),
+                'report': report
+            }, f, indent=2, ensure_ascii=False)
+        print(f"💾 Línea base guardada en {path}")
+
+    if args.compare:
+        with open(baseline_path(args.compare), encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regresiones: " + '; '.join(regressions))
+            sys.exit(1)
+        print("✅ Sin regresiones")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Construir el índice de cobertura alrededor de la tienda
+
+Muestrea una grilla de celdas alrededor del origen y mide con el router
+configurado (ORS /matrix u OSRM /table) la distancia por calle hasta el
+centro de cada celda dentro del radio. El
+resultado se guarda en COVERAGE_INDEX_PATH y los workers lo recargan solos.
+El tamaño de cada llamada a /matrix se controla con ORS_MATRIX_CHUNK.
+
+    python build_coverage_index.py --lat -33.4263 --lon -70.6170 --cell-m 250
+"""
+import argparse
+import math
+import sys
+from array import array
+
+from app import app
+from services.coverage import CoverageIndex
+from services.geo import haversine_km_many
+from services.providers import get_provider
+
+
+def build_index(ors, origin, radius_km, cell_m, profile='driving-car'):
+    size = CoverageIndex.grid_size(radius_km, cell_m)
+    nan = float('nan')
+    index = CoverageIndex(origin, cell_m, size, size, array('f', [nan] * (size * size)),
+                          array('f', [nan] * (size * size)))
+
+    # Sólo las celdas cuyo centro está dentro del radio en línea recta
+    cells = [(row, col) for row in range(size) for col in range(size)]
+    centers = [index.cell_center(row, col) for row, col in cells]
+    straight = haversine_km_many(origin, centers)
+    targets = [(cell, center) for cell, center, km in zip(cells, centers, straight) if km <= radius_km]
+
+    print(f"📐 Grilla {size}x{size} de {cell_m:g} m, {len(targets)} celdas a medir")
+
+    # calculate_matrix divide cada grupo en llamadas de ORS_MATRIX_CHUNK destinos
+    chunk_size = 500
+    done = 0
+    for start in range(0, len(targets), chunk_size):
+        chunk = targets[start:start + chunk_size]
+        routes = ors.calculate_matrix(origin, [center for _, center in chunk], profile, use_cache=False)
+
+        for ((row, col), _), route in zip(chunk, routes):
+            if route:
+                position = row * size + col
+                index.distances[position] = route['distance_km']
+                index.durations[position] = route['duration_minutes']
+
+        done += len(chunk)
+        print(f"   {done}/{len(targets)} celdas", end='\r', file=sys.stderr)
+
+    print(file=sys.stderr)
+    measured = sum(1 for value in index.distances if not math.isnan(value))
+    print(f"✅ {measured} celdas con distancia por calle")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Construir índice de cobertura')
+    parser.add_argument('--lat', type=float, help='Latitud de la tienda (default: STORE_LAT)')
+    parser.add_argument('--lon', type=float, help='Longitud de la tienda (default: STORE_LON)')
+    parser.add_argument('--cell-m', type=float, default=250, help='Tamaño de celda en metros')
+    parser.add_argument('--radius-km', type=float, help='Radio (default: MAX_DELIVERY_DISTANCE_KM + 1)')
+    parser.add_argument('--profile', default='driving-car')
+    parser.add_argument('-o', '--output', help='Archivo de salida (default: COVERAGE_INDEX_PATH)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        config = app.config
+        lat = args.lat if args.lat is not None else config.get('STORE_LAT')
+        lon = args.lon if args.lon is not None else config.get('STORE_LON')
+        if lat is None or lon is None:
+            parser.error('Indica --lat/--lon o configura STORE_LAT/STORE_LON')
+
+        output = args.output or config.get('COVERAGE_INDEX_PATH')
+        if not output:
+            parser.error('Indica --output o configura COVERAGE_INDEX_PATH')
+
+        index = build_index(
+            get_provider(),
+            {'lat': lat, 'lon': lon},
+            args.radius_km or config['MAX_DELIVERY_DISTANCE_KM'] + 1,
+            args.cell_m,
+            args.profile
+        )
+        index.save(output)
+        print(f"💾 Índice guardado en {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Calcular (o refrescar) el campo de distancias desde la tienda
+
+Recorre el grafo vial (GRAPH_PATH, ver build_road_graph.py) desde el origen
+una sola vez y guarda la distancia por calle a cada nodo en
+DISTANCE_FIELD_PATH. Los workers lo recargan solos al cambiar el archivo.
+
+    python build_distance_field.py
+    python build_distance_field.py --if-stale   # p. ej. desde cron
+"""
+import argparse
+import sys
+import time
+
+from app import app
+from services.distance_field import DistanceField, distance_field
+from services.graph import RoadGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calcular campo de distancias desde la tienda')
+    parser.add_argument('--lat', type=float, help='Latitud del origen (default: STORE_LAT)')
+    parser.add_argument('--lon', type=float, help='Longitud del origen (default: STORE_LON)')
+    parser.add_argument('--graph', help='Grafo vial (default: GRAPH_PATH)')
+    parser.add_argument('-o', '--output', help='Archivo de salida (default: DISTANCE_FIELD_PATH)')
+    parser.add_argument('--if-stale', action='store_true', help='Sólo recalcular si el campo actual está desactualizado')
+    args = parser.parse_args()
+
+    with app.app_context():
+        config = app.config
+        lat = args.lat if args.lat is not None else config.get('STORE_LAT')
+        lon = args.lon if args.lon is not None else config.get('STORE_LON')
+        if lat is None or lon is None:
+            parser.error('Indica --lat/--lon o configura STORE_LAT/STORE_LON')
+
+        output = args.output or config.get('DISTANCE_FIELD_PATH')
+        graph_path = args.graph or config.get('GRAPH_PATH')
+        if not output or not graph_path:
+            parser.error('Configura DISTANCE_FIELD_PATH y GRAPH_PATH (o usa --output/--graph)')
+
+        graph = RoadGraph.load(graph_path)
+
+        if args.if_stale:
+            try:
+                current = DistanceField.load(output)
+            except (OSError, ValueError):
+                current = None
+            reasons = distance_field.staleness(current, graph) if current else ['missing']
+            if not reasons:
+                print("✅ Campo de distancias vigente, nada que hacer")
+                return
+            print(f"🔄 Recalculando: {', '.join(reasons)}")
+
+        start = time.perf_counter()
+        try:
+            field = DistanceField.from_graph(graph, {'lat': lat, 'lon': lon}, config.get('GRAPH_SNAP_MAX_M', 300))
+        except ValueError as e:
+            sys.exit(f"❌ {e}")
+
+        field.save(output)
+        print(f"✅ {field.reachable()}/{field.nodes} nodos alcanzables "
+              f"({time.perf_counter() - start:.1f} s)")
+        print(f"💾 Campo guardado en {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Construir el gazetteer para el geocodificador en proceso (GEOCODER_PROVIDER=gazetteer)
+
+Lee un extracto de OpenStreetMap (.osm XML con la librería estándar, o .pbf
+si está instalado `osmium`) y guarda, dentro del radio de reparto, las
+calles con nombre, los números de casa conocidos (addr:street +
+addr:housenumber en nodos y edificios) y las comunas. Los workers lo
+recargan solos al cambiar el archivo.
+
+La comuna de cada calle y dirección es addr:city/addr:suburb si nombra una
+comuna conocida y, si no, la del lugar (place=city/town/suburb/...) más
+cercano: una aproximación de los límites comunales.
+
+    python build_gazetteer.py santiago.osm.pbf --lat -33.4263 --lon -70.6170 --radius-km 10
+"""
+import argparse
+import re
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from collections import Counter
+
+from app import app
+from services.cache import METERS_PER_DEGREE, normalize_address
+from services.gazetteer import Gazetteer
+from services.geo import haversine_km
+
+PLACE_TYPES = ('city', 'town', 'village', 'suburb', 'municipality')
+
+_HOUSENUMBER = re.compile(r'^\s*(\d+)')
+
+
+def housenumber(value):
+    match = _HOUSENUMBER.match(value or '')
+    return int(match.group(1)) if match else None
+
+
+def read_osm_xml(path):
+    """(lugares, direcciones, calles) de un .osm: listas de (tags, [(lat, lon), ...])"""
+    nodes = {}
+    places, addresses, streets = [], [], []
+
+    for _, element in ET.iterparse(path, events=('end',)):
+        if element.tag == 'node':
+            point = (float(element.get('lat')), float(element.get('lon')))
+            nodes[element.get('id')] = point
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            if tags.get('place') in PLACE_TYPES and tags.get('name'):
+                places.append((tags, [point]))
+            if tags.get('addr:street') and tags.get('addr:housenumber'):
+                addresses.append((tags, [point]))
+            element.clear()
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            points = [nodes[nd.get('ref')] for nd in element.iter('nd') if nd.get('ref') in nodes]
+            if points and tags.get('highway') and tags.get('name'):
+                streets.append((tags, points))
+            elif points and tags.get('addr:street') and tags.get('addr:housenumber'):
+                addresses.append((tags, points))
+            element.clear()
+
+    return places, addresses, streets
+
+
+def read_osm_pbf(path):
+    try:
+        import osmium
+    except ImportError:
+        sys.exit("Para leer .pbf instala osmium (pip install osmium) o convierte a .osm con `osmium cat`")
+
+    places, addresses, streets = [], [], []
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            tags = {tag.k: tag.v for tag in n.tags}
+            point = (n.location.lat, n.location.lon)
+            if tags.get('place') in PLACE_TYPES and tags.get('name'):
+                places.append((tags, [point]))
+            if tags.get('addr:street') and tags.get('addr:housenumber'):
+                addresses.append((tags, [point]))
+
+        def way(self, w):
+            tags = {tag.k: tag.v for tag in w.tags}
+            points = [(n.lat, n.lon) for n in w.nodes if n.location.valid()]
+            if points and tags.get('highway') and tags.get('name'):
+                streets.append((tags, points))
+            elif points and tags.get('addr:street') and tags.get('addr:housenumber'):
+                addresses.append((tags, points))
+
+    Handler().apply_file(path, locations=True)
+    return places, addresses, streets
+
+
+def centroid(points):
+    return (sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points))
+
+
+class ComunaLocator:
+    """Comuna de un punto: lugar más cercano, precalculado por celda de ~500 m"""
+
+    def __init__(self, places, cell_m=500):
+        self.places = places  # [(nombre, (lat, lon))]
+        self.keys = [normalize_address(name) for name, _ in places]
+        self.cell = cell_m / METERS_PER_DEGREE
+        self._cells = {}
+
+    def by_tags(self, tags):
+        for tag in ('addr:city', 'addr:suburb', 'is_in:city'):
+            key = normalize_address(tags.get(tag, ''))
+            if key in self.keys:
+                return self.keys.index(key)
+        return None
+
+    def nearest(self, point):
+        if not self.places:
+            return -1
+        cell = (int(point[0] // self.cell), int(point[1] // self.cell))
+        if cell not in self._cells:
+            center = ((cell[0] + 0.5) * self.cell, (cell[1] + 0.5) * self.cell)
+            self._cells[cell] = min(range(len(self.places)),
+                                    key=lambda i: haversine_km(*center, *self.places[i][1]))
+        return self._cells[cell]
+
+    def locate(self, tags, point):
+        found = self.by_tags(tags)
+        return found if found is not None else self.nearest(point)
+
+
+def build_gazetteer(places, addresses, streets, origin, radius_km):
+    def inside(point):
+        return haversine_km(origin['lat'], origin['lon'], *point) <= radius_km
+
+    # Comunas (un lugar por nombre normalizado)
+    comunas = []
+    seen = set()
+    for tags, points in places:
+        key = normalize_address(tags['name'])
+        if key and key not in seen and inside(points[0]):
+            seen.add(key)
+            comunas.append((tags['name'], points[0]))
+    locator = ComunaLocator(comunas)
+
+    # Calles: una entrada por (nombre normalizado, comuna)
+    groups = {}
+
+    def group(name, comuna):
+        key = (normalize_address(name), comuna)
+        if key not in groups:
+            groups[key] = {'names': Counter(), 'points': [], 'numbers': {}}
+        groups[key]['names'][name] += 1
+        return groups[key]
+
+    for tags, points in streets:
+        points = [point for point in points if inside(point)]
+        if not points:
+            continue
+        entry = group(tags['name'], locator.locate(tags, points[len(points) // 2]))
+        entry['points'].extend(points)
+
+    address_count = 0
+    for tags, points in addresses:
+        number = housenumber(tags['addr:housenumber'])
+        point = centroid(points)
+        if number is None or not inside(point):
+            continue
+        entry = group(tags['addr:street'], locator.locate(tags, point))
+        entry['numbers'].setdefault(number, []).append(point)
+        address_count += 1
+
+    groups = {key: entry for key, entry in groups.items() if key[0]}
+    print(f"🏘️  {len(comunas)} comunas, {len(groups)} calles, {address_count} direcciones dentro de {radius_km:g} km")
+
+    street_names = []
+    arrays = {name: array(code) for name, code in (
+        ('street_comuna', 'i'), ('street_lat', 'f'), ('street_lon', 'f'),
+        ('num', 'i'), ('num_lat', 'f'), ('num_lon', 'f'),
+    )}
+    num_ptr = array('i', [0])
+
+    for (_, comuna), entry in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1])):
+        numbered = [centroid(points) for _, points in sorted(entry['numbers'].items())]
+        all_points = entry['points'] or numbered
+        # Punto representativo: el de la calle más cercano a su centro
+        center = centroid(all_points)
+        point = min(all_points, key=lambda p: (p[0] - center[0]) ** 2 + (p[1] - center[1]) ** 2)
+
+        street_names.append(entry['names'].most_common(1)[0][0])
+        arrays['street_comuna'].append(comuna)
+        arrays['street_lat'].append(point[0])
+        arrays['street_lon'].append(point[1])
+        for number, (lat, lon) in zip(sorted(entry['numbers']), numbered):
+            arrays['num'].append(number)
+            arrays['num_lat'].append(lat)
+            arrays['num_lon'].append(lon)
+        num_ptr.append(len(arrays['num']))
+
+    arrays['num_ptr'] = num_ptr
+    meta = {
+        'street_names': street_names,
+        'comuna_names': [name for name, _ in comunas],
+        'origin': origin,
+        'radius_km': radius_km
+    }
+    return Gazetteer(meta, arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Construir gazetteer desde un extracto OSM')
+    parser.add_argument('input', help='Extracto OSM (.osm o .osm.pbf)')
+    parser.add_argument('--lat', type=float, help='Latitud del centro (default: STORE_LAT)')
+    parser.add_argument('--lon', type=float, help='Longitud del centro (default: STORE_LON)')
+    parser.add_argument('--radius-km', type=float, help='Radio (default: MAX_DELIVERY_DISTANCE_KM + 3)')
+    parser.add_argument('-o', '--output', help='Archivo de salida (default: GAZETTEER_PATH)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        config = app.config
+        lat = args.lat if args.lat is not None else config.get('STORE_LAT')
+        lon = args.lon if args.lon is not None else config.get('STORE_LON')
+        if lat is None or lon is None:
+            parser.error('Indica --lat/--lon o configura STORE_LAT/STORE_LON')
+
+        output = args.output or config.get('GAZETTEER_PATH')
+        if not output:
+            parser.error('Configura GAZETTEER_PATH o usa --output')
+
+        radius_km = args.radius_km or config.get('MAX_DELIVERY_DISTANCE_KM', 7) + 3
+        reader = read_osm_pbf if args.input.endswith('.pbf') else read_osm_xml
+        places, addresses, streets = reader(args.input)
+
+        gazetteer = build_gazetteer(places, addresses, streets, {'lat': lat, 'lon': lon}, radius_km)
+        gazetteer.meta['source'] = args.input
+        gazetteer.save(output)
+        print(f"💾 Gazetteer guardado en {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Construir el grafo vial para el router en proceso (ROUTER_PROVIDER=graph)
+
+Lee un extracto de OpenStreetMap (.osm XML con la librería estándar, o .pbf
+si está instalado `osmium`), se queda con las calles transitables en auto
+dentro del radio de reparto y guarda el grafo compacto en GRAPH_PATH. Los
+workers lo recargan solos al cambiar el archivo.
+
+    python build_road_graph.py santiago.osm.pbf --lat -33.4263 --lon -70.6170 --radius-km 10
+"""
+import argparse
+import math
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+
+from app import app
+from services.cache import METERS_PER_DEGREE
+from services.geo import haversine_km
+from services.graph import RoadGraph
+
+# Velocidad (km/h) por tipo de vía cuando no hay maxspeed
+SPEEDS_KMH = {
+    'motorway': 90, 'motorway_link': 45,
+    'trunk': 70, 'trunk_link': 40,
+    'primary': 50, 'primary_link': 35,
+    'secondary': 45, 'secondary_link': 30,
+    'tertiary': 40, 'tertiary_link': 25,
+    'unclassified': 30, 'residential': 25,
+    'living_street': 10, 'service': 15
+}
+
+BLOCKED_ACCESS = ('no', 'private')
+
+
+def way_direction(tags):
+    """1 = sólo sentido de dibujo, -1 = sólo sentido contrario, 0 = doble sentido"""
+    oneway = tags.get('oneway')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags.get('junction') in ('roundabout', 'circular') or tags.get('highway') == 'motorway':
+        return 1
+    return 0
+
+
+def way_speed(tags):
+    """km/h: 80% de maxspeed si viene indicado, si no según el tipo de vía"""
+    try:
+        maxspeed = float(tags.get('maxspeed', '').split()[0])
+    except (ValueError, IndexError):
+        maxspeed = 0
+    return maxspeed * 0.8 if maxspeed > 0 else SPEEDS_KMH[tags['highway']]
+
+
+def is_drivable(tags):
+    return (tags.get('highway') in SPEEDS_KMH
+            and tags.get('access') not in BLOCKED_ACCESS
+            and tags.get('motor_vehicle') not in BLOCKED_ACCESS
+            and tags.get('area') != 'yes')
+
+
+def read_osm_xml(path):
+    """Generar (tags, [(ref, (lat, lon)), ...]) por cada calle transitable"""
+    nodes = {}
+    for _, element in ET.iterparse(path, events=('end',)):
+        if element.tag == 'node':
+            nodes[element.get('id')] = (float(element.get('lat')), float(element.get('lon')))
+            element.clear()
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            if is_drivable(tags):
+                refs = [nd.get('ref') for nd in element.iter('nd')]
+                yield tags, [(ref, nodes[ref]) for ref in refs if ref in nodes]
+            element.clear()
+
+
+def read_osm_pbf(path):
+    try:
+        import osmium
+    except ImportError:
+        sys.exit("Para leer .pbf instala osmium (pip install osmium) o convierte a .osm con `osmium cat`")
+
+    ways = []
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, w):
+            tags = {tag.k: tag.v for tag in w.tags}
+            if is_drivable(tags):
+                ways.append((tags, [(str(n.ref), (n.lat, n.lon)) for n in w.nodes if n.location.valid()]))
+
+    Handler().apply_file(path, locations=True)
+    return ways
+
+
+def strongly_connected(adjacency, reverse, count):
+    """Nodos de la mayor componente fuertemente conexa (Kosaraju iterativo)"""
+    order = []
+    seen = [False] * count
+    for start in range(count):
+        if seen[start]:
+            continue
+        seen[start] = True
+        stack = [(start, iter(adjacency[start]))]
+        while stack:
+            node, neighbors = stack[-1]
+            for nxt in neighbors:
+                if not seen[nxt]:
+                    seen[nxt] = True
+                    stack.append((nxt, iter(adjacency[nxt])))
+                    break
+            else:
+                order.append(node)
+                stack.pop()
+
+    component = [-1] * count
+    sizes = []
+    for start in reversed(order):
+        if component[start] != -1:
+            continue
+        label = len(sizes)
+        component[start] = label
+        stack = [start]
+        size = 0
+        while stack:
+            node = stack.pop()
+            size += 1
+            for nxt in reverse[node]:
+                if component[nxt] == -1:
+                    component[nxt] = label
+                    stack.append(nxt)
+        sizes.append(size)
+
+    largest = max(range(len(sizes)), key=sizes.__getitem__)
+    return [node for node in range(count) if component[node] == largest]
+
+
+def build_graph(ways, origin, radius_km, cell_m=200):
+    # Numerar nodos OSM dentro del radio
+    index = {}
+    coords = []
+    edges = {}
+
+    def node_id(ref, point):
+        if ref not in index:
+            index[ref] = len(coords)
+            coords.append(point)
+        return index[ref]
+
+    for tags, points in ways:
+        direction = way_direction(tags)
+        speed_ms = way_speed(tags) / 3.6
+        for (ref_a, a), (ref_b, b) in zip(points, points[1:]):
+            if (haversine_km(origin['lat'], origin['lon'], *a) > radius_km
+                    or haversine_km(origin['lat'], origin['lon'], *b) > radius_km):
+                continue
+            u = node_id(ref_a, a)
+            v = node_id(ref_b, b)
+            if u == v:
+                continue
+            meters = haversine_km(*a, *b) * 1000
+            seconds = meters / speed_ms
+            pairs = [(u, v), (v, u)] if direction == 0 else [(u, v)] if direction == 1 else [(v, u)]
+            for pair in pairs:
+                # Arcos paralelos: quedarse con el más rápido
+                if pair not in edges or seconds < edges[pair][1]:
+                    edges[pair] = (meters, seconds)
+
+    print(f"🛣️  {len(coords)} nodos y {len(edges)} arcos dentro de {radius_km:g} km")
+
+    # Mayor componente fuertemente conexa (evita destinos sin salida)
+    adjacency = [[] for _ in coords]
+    reverse = [[] for _ in coords]
+    for u, v in edges:
+        adjacency[u].append(v)
+        reverse[v].append(u)
+    keep = strongly_connected(adjacency, reverse, len(coords))
+
+    # Renumerar por celda de la grilla (vecinos cercanos quedan juntos en memoria)
+    lats = [coords[node][0] for node in keep]
+    lons = [coords[node][1] for node in keep]
+    lat0, lon0 = min(lats), min(lons)
+    dlat = cell_m / METERS_PER_DEGREE
+    rows = int((max(lats) - lat0) / dlat) + 1
+    dlon = dlat / math.cos(math.radians(lat0 + rows * dlat / 2))
+    cols = int((max(lons) - lon0) / dlon) + 1
+
+    def cell_of(node):
+        lat, lon = coords[node]
+        return int((lat - lat0) / dlat) * cols + int((lon - lon0) / dlon)
+
+    keep.sort(key=lambda node: (cell_of(node), coords[node]))
+    renumber = {old: new for new, old in enumerate(keep)}
+
+    cell_counts = [0] * (rows * cols + 1)
+    for node in keep:
+        cell_counts[cell_of(node) + 1] += 1
+    cell_ptr = array('i', [0])
+    for count in cell_counts[1:]:
+        cell_ptr.append(cell_ptr[-1] + count)
+
+    kept = [(renumber[u], renumber[v], meters, seconds)
+            for (u, v), (meters, seconds) in edges.items() if u in renumber and v in renumber]
+
+    def csr(key, other):
+        ordered = sorted(kept, key=lambda edge: (edge[key], edge[other]))
+        ptr = array('i', [0] * (len(keep) + 1))
+        for edge in ordered:
+            ptr[edge[key] + 1] += 1
+        for i in range(len(keep)):
+            ptr[i + 1] += ptr[i]
+        return (ptr, array('i', [edge[other] for edge in ordered]),
+                array('f', [edge[2] for edge in ordered]), array('f', [edge[3] for edge in ordered]))
+
+    fwd_ptr, fwd_head, fwd_len, fwd_time = csr(0, 1)
+    rev_ptr, rev_tail, rev_len, rev_time = csr(1, 0)
+
+    meta = {
+        'nodes': len(keep),
+        'edges': len(kept),
+        'cell_m': cell_m,
+        'rows': rows,
+        'cols': cols,
+        'lat0': lat0,
+        'lon0': lon0,
+        'origin': origin,
+        'radius_km': radius_km
+    }
+    arrays = {
+        'lat': array('f', [coords[node][0] for node in keep]),
+        'lon': array('f', [coords[node][1] for node in keep]),
+        'fwd_ptr': fwd_ptr, 'fwd_head': fwd_head, 'fwd_len': fwd_len, 'fwd_time': fwd_time,
+        'rev_ptr': rev_ptr, 'rev_tail': rev_tail, 'rev_len': rev_len, 'rev_time': rev_time,
+        'cell_ptr': cell_ptr
+    }
+    print(f"✅ {len(keep)} nodos y {len(kept)} arcos en la componente principal")
+    return RoadGraph(meta, arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Construir grafo vial desde un extracto OSM')
+    parser.add_argument('input', help='Extracto OSM (.osm o .osm.pbf)')
+    parser.add_argument('--lat', type=float, help='Latitud del centro (default: STORE_LAT)')
+    parser.add_argument('--lon', type=float, help='Longitud del centro (default: STORE_LON)')
+    parser.add_argument('--radius-km', type=float, help='Radio (default: MAX_DELIVERY_DISTANCE_KM + 3)')
+    parser.add_argument('--cell-m', type=float, default=200, help='Celda de la grilla de búsqueda')
+    parser.add_argument('-o', '--output', help='Archivo de salida (default: GRAPH_PATH)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        config = app.config
+        lat = args.lat if args.lat is not None else config.get('STORE_LAT')
+        lon = args.lon if args.lon is not None else config.get('STORE_LON')
+        if lat is None or lon is None:
+            parser.error('Indica --lat/--lon o configura STORE_LAT/STORE_LON')
+
+        output = args.output or config.get('GRAPH_PATH')
+        if not output:
+            parser.error('Indica --output o configura GRAPH_PATH')
+
+        reader = read_osm_pbf if args.input.endswith('.pbf') else read_osm_xml
+        graph = build_graph(
+            reader(args.input),
+            {'lat': lat, 'lon': lon},
+            args.radius_km or config['MAX_DELIVERY_DISTANCE_KM'] + 3,
+            args.cell_m
+        )
+        graph.meta['source'] = args.input
+        graph.save(output)
+        print(f"💾 Grafo guardado en {output}")
+
+
+if __name__ == '__main__':
+    main()
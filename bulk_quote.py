@@ -0,0 +1,79 @@
+"""
+Cotización masiva desde la línea de comandos
+
+Lee destinos desde un CSV (columnas id, address o id, latitude, longitude)
+o un archivo de texto (una dirección por línea) y escribe NDJSON:
+
+    python bulk_quote.py destinos.csv --from "Av. Providencia 1208, Santiago"
+    python bulk_quote.py destinos.txt --from-lat -33.4263 --from-lon -70.6170 -o tarifas.ndjson
+"""
+import argparse
+import csv
+import json
+import sys
+
+from app import app
+from services.bulk import resolve_origin, bulk_quote
+from services.providers import get_provider
+
+
+def read_destinations(path):
+    """Leer destinos desde CSV (con encabezado) o texto plano"""
+    with open(path, newline='', encoding='utf-8') as f:
+        first_line = f.readline()
+        f.seek(0)
+
+        header = [column.strip().lower() for column in first_line.split(',')]
+        if 'address' in header or 'latitude' in header:
+            return [
+                {key: value for key, value in row.items() if value not in (None, '')}
+                for row in csv.DictReader(f)
+            ]
+
+        return [
+            {'id': number, 'address': line.strip()}
+            for number, line in enumerate(f, 1) if line.strip()
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cotizar muchos destinos desde un origen')
+    parser.add_argument('destinations', help='CSV (id,address | id,latitude,longitude) o texto')
+    parser.add_argument('--from', dest='from_address', help='Dirección de origen')
+    parser.add_argument('--from-lat', type=float)
+    parser.add_argument('--from-lon', type=float)
+    parser.add_argument('--profile', default='driving-car')
+    parser.add_argument('-o', '--output', help='Archivo NDJSON de salida (default: stdout)')
+    args = parser.parse_args()
+
+    if args.from_lat is not None and args.from_lon is not None:
+        origin = {'latitude': args.from_lat, 'longitude': args.from_lon}
+    elif args.from_address:
+        origin = {'address': args.from_address}
+    else:
+        parser.error('Indica --from o --from-lat/--from-lon')
+
+    destinations = read_destinations(args.destinations)
+
+    with app.app_context():
+        ors = get_provider()
+        from_coords = resolve_origin(ors, origin)
+        if not from_coords:
+            print("❌ No se pudo geocodificar el origen", file=sys.stderr)
+            sys.exit(1)
+
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        covered = 0
+        try:
+            for line in bulk_quote(ors, from_coords, destinations, args.profile):
+                covered += bool(line['rates'])
+                out.write(json.dumps(line, ensure_ascii=False) + '\n')
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    print(f"✅ {len(destinations)} destinos cotizados, {covered} con cobertura", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,23 @@ from dotenv import load_dotenv
 # Cargar variables de entorno
 load_dotenv()
 
+
+def engine_options(uri):
+    """Opciones del engine de SQLAlchemy según el motor de base de datos"""
+    if uri.startswith('sqlite'):
+        # Con WAL (ver services/schema.py) los lectores no esperan al writer;
+        # entre writers se espera hasta SQLITE_BUSY_TIMEOUT_MS en vez de fallar
+        return {'connect_args': {'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000}}
+    
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '5')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': True
+    }
+
+
 class Config:
     """Configuración de la aplicación"""
     
@@ -14,6 +31,11 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI', 'sqlite:///shipping.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Postgres (postgresql+psycopg2://...): pool por worker. SQLite: WAL
+    # (SQLITE_WAL=false para desactivarlo) y espera ante bloqueos
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_WAL = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+    
     # Flask-Admin
     FLASK_ADMIN_SWATCH = 'cerulean'
     
@@ -22,7 +44,137 @@ class Config:
     
     # OpenRouteService
     ORS_API_KEY = os.getenv('ORS_API_KEY')
-    ORS_BASE_URL = 'https://api.openrouteservice.org/v2'
+    ORS_BASE_URL = os.getenv('ORS_BASE_URL', 'https://api.openrouteservice.org/v2')
+    
+    # Proveedores: GEOCODER_PROVIDER ('ors', 'gazetteer' = gazetteer en proceso
+    # con ORS de respaldo, ver build_gazetteer.py) y ROUTER_PROVIDER ('ors', 'ors-local'
+    # = contenedor ORS en ORS_LOCAL_URL, 'osrm' = osrm-routed en OSRM_BASE_URL,
+    # 'graph' = grafo vial en proceso, ver build_road_graph.py)
+    GEOCODER_PROVIDER = os.getenv('GEOCODER_PROVIDER', 'ors')
+    ROUTER_PROVIDER = os.getenv('ROUTER_PROVIDER', 'ors')
+    ORS_LOCAL_URL = os.getenv('ORS_LOCAL_URL', 'http://localhost:8080/ors/v2')
+    OSRM_BASE_URL = os.getenv('OSRM_BASE_URL', 'http://localhost:5000')
+    OSRM_TIMEOUT = float(os.getenv('OSRM_TIMEOUT', '2'))
+    OSRM_TABLE_CHUNK = int(os.getenv('OSRM_TABLE_CHUNK', '500'))
+    GRAPH_PATH = os.getenv('GRAPH_PATH', 'instance/road.graph')
+    GRAPH_SNAP_MAX_M = float(os.getenv('GRAPH_SNAP_MAX_M', '300'))
+    GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', 'instance/gazetteer.idx')
+    GAZETTEER_MIN_CONFIDENCE = float(os.getenv('GAZETTEER_MIN_CONFIDENCE', '0.8'))
+    
+    # Campo de distancias desde la tienda sobre el grafo vial (build_distance_field.py);
+    # vacío = deshabilitado. Se reporta como desactualizado en /health pasado MAX_AGE
+    DISTANCE_FIELD_PATH = os.getenv('DISTANCE_FIELD_PATH', 'instance/distance.field')
+    DISTANCE_FIELD_MAX_AGE_HOURS = float(os.getenv('DISTANCE_FIELD_MAX_AGE_HOURS', '168'))
+    
+    # Cliente HTTP de ORS (pool de conexiones, timeouts en segundos, reintentos)
+    ORS_POOL_SIZE = int(os.getenv('ORS_POOL_SIZE', '10'))
+    ORS_CONNECT_TIMEOUT = float(os.getenv('ORS_CONNECT_TIMEOUT', '3'))
+    ORS_READ_TIMEOUT = float(os.getenv('ORS_READ_TIMEOUT', '10'))
+    ORS_MAX_RETRIES = int(os.getenv('ORS_MAX_RETRIES', '2'))
+    ORS_BACKOFF_FACTOR = float(os.getenv('ORS_BACKOFF_FACTOR', '0.3'))
+    ORS_GEOCODE_WORKERS = int(os.getenv('ORS_GEOCODE_WORKERS', '8'))
+    ORS_MATRIX_CHUNK = int(os.getenv('ORS_MATRIX_CHUNK', '49'))  # destinos por llamada a /matrix
+    ORS_ASYNC_MAX_CONNECTIONS = int(os.getenv('ORS_ASYNC_MAX_CONNECTIONS', '100'))
+    
+    # Cache de geocodificación (LRU en memoria + tabla geocode_cache)
+    GEOCODE_CACHE_ENABLED = os.getenv('GEOCODE_CACHE_ENABLED', 'true').lower() == 'true'
+    GEOCODE_CACHE_TTL_DAYS = int(os.getenv('GEOCODE_CACHE_TTL_DAYS', '30'))
+    GEOCODE_CACHE_LRU_SIZE = int(os.getenv('GEOCODE_CACHE_LRU_SIZE', '1024'))
+    GEOCODE_CACHE_MAX_ROWS = int(os.getenv('GEOCODE_CACHE_MAX_ROWS', '50000'))
+    
+    # Cache de rutas por celdas de ROUTE_CACHE_GRID_M metros
+    # ROUTE_CACHE_BACKEND: 'memory' (por worker) o 'database' (compartido)
+    ROUTE_CACHE_ENABLED = os.getenv('ROUTE_CACHE_ENABLED', 'true').lower() == 'true'
+    ROUTE_CACHE_GRID_M = float(os.getenv('ROUTE_CACHE_GRID_M', '10'))
+    ROUTE_CACHE_TTL_HOURS = int(os.getenv('ROUTE_CACHE_TTL_HOURS', '24'))
+    ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', '4096'))
+    ROUTE_CACHE_BACKEND = os.getenv('ROUTE_CACHE_BACKEND', 'memory')
+    ROUTE_CACHE_MAX_ROWS = int(os.getenv('ROUTE_CACHE_MAX_ROWS', '200000'))
+    
+    # Single-flight: llamadas idénticas en curso comparten resultado.
+    # SINGLEFLIGHT_SHARED=true coordina también entre workers (lock de archivo);
+    # conviene junto con ROUTE_CACHE_BACKEND=database
+    SINGLEFLIGHT_SHARED = os.getenv('SINGLEFLIGHT_SHARED', 'false').lower() == 'true'
+    SINGLEFLIGHT_LOCK_DIR = os.getenv('SINGLEFLIGHT_LOCK_DIR', '/tmp/shipping-singleflight')
+    SINGLEFLIGHT_LOCK_STRIPES = int(os.getenv('SINGLEFLIGHT_LOCK_STRIPES', '64'))
+    
+    # Circuit breaker de ORS: se abre tras N fallos consecutivos (error, 429/5xx
+    # o llamada más lenta que CIRCUIT_SLOW_MS) y reintenta tras CIRCUIT_OPEN_SECONDS
+    CIRCUIT_ENABLED = os.getenv('CIRCUIT_ENABLED', 'true').lower() == 'true'
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+    CIRCUIT_SLOW_MS = float(os.getenv('CIRCUIT_SLOW_MS', '3000'))
+    CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+    
+    # Cotización degradada con el circuito abierto: 'haversine' (línea recta x
+    # factor de desvío) u 'off'. Sin FALLBACK_DETOUR_FACTOR se calibra con DeliveryLog
+    FALLBACK_MODE = os.getenv('FALLBACK_MODE', 'haversine')
+    FALLBACK_DETOUR_FACTOR = float(os.getenv('FALLBACK_DETOUR_FACTOR')) if os.getenv('FALLBACK_DETOUR_FACTOR') else None
+    FALLBACK_SPEED_KMH = float(os.getenv('FALLBACK_SPEED_KMH', '25'))
+    
+    # Tabla de tarifas compilada en memoria (segundos entre chequeos de versión)
+    RATE_TABLE_CHECK_SECONDS = float(os.getenv('RATE_TABLE_CHECK_SECONDS', '10'))
+    
+    # Zonas (celdas de destino) de los factores de tráfico (learn_traffic.py)
+    TRAFFIC_ZONE_M = float(os.getenv('TRAFFIC_ZONE_M', '2000'))
+    
+    # /shipping/services: segundos que Jumpseller/proxies pueden reutilizar
+    # la respuesta (nunca más allá del próximo cambio de horario)
+    SERVICES_MAX_AGE = int(os.getenv('SERVICES_MAX_AGE', '60'))
+    
+    # Escritura de DeliveryLog: 'async' (cola + inserciones en bloque) o 'sync'
+    LOG_WRITER_MODE = os.getenv('LOG_WRITER_MODE', 'async')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '200'))
+    LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '1.0'))
+    LOG_OVERFLOW_POLICY = os.getenv('LOG_OVERFLOW_POLICY', 'drop')  # 'drop' o 'block'
+    LOG_BLOCK_TIMEOUT = float(os.getenv('LOG_BLOCK_TIMEOUT', '1.0'))
+    
+    # Resúmenes y retención del historial (rollup_logs.py). Por defecto
+    # LOG_RETENTION_DAYS=0 conserva todas las filas; con N > 0 se borran las de
+    # más de N días, archivadas antes en LOG_ARCHIVE_DIR (vacío = sin archivar)
+    ROLLUP_LOOKBACK_HOURS = int(os.getenv('ROLLUP_LOOKBACK_HOURS', '2'))
+    LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '0'))
+    LOG_ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR', 'instance/log_archive')
+    LOG_RETENTION_BATCH = int(os.getenv('LOG_RETENTION_BATCH', '5000'))
+    
+    # Exportación incremental de DeliveryLog para análisis (export_logs.py).
+    # Con EXPORT_DIR, rollup_logs.py también exporta y la retención no borra
+    # filas que aún no se exportaron
+    EXPORT_DIR = os.getenv('EXPORT_DIR', '')
+    EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'ndjson')  # 'ndjson' o 'parquet' (requiere pyarrow)
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '5000'))
+    EXPORT_LAG_SECONDS = int(os.getenv('EXPORT_LAG_SECONDS', '300'))
+    
+    # Tienda (origen habitual de las cotizaciones)
+    STORE_LAT = float(os.getenv('STORE_LAT')) if os.getenv('STORE_LAT') else None
+    STORE_LON = float(os.getenv('STORE_LON')) if os.getenv('STORE_LON') else None
+    STORE_MATCH_RADIUS_M = float(os.getenv('STORE_MATCH_RADIUS_M', '50'))
+    
+    # Varias tiendas (tabla `stores`, editable en el admin): STORE_SELECTION
+    # 'price' (la tarifa más barata), 'duration' (la más rápida) u 'off' (el
+    # origen que envía Jumpseller). Se rutean a lo más STORE_CANDIDATES tiendas
+    STORE_SELECTION = os.getenv('STORE_SELECTION', 'off')
+    STORE_CANDIDATES = int(os.getenv('STORE_CANDIDATES', '5'))
+    
+    # Índice de cobertura precalculado (build_coverage_index.py); vacío = deshabilitado
+    COVERAGE_INDEX_PATH = os.getenv('COVERAGE_INDEX_PATH', 'instance/coverage.idx')
+    COVERAGE_MARGIN_KM = float(os.getenv('COVERAGE_MARGIN_KM', '0.1'))
+    
+    # Métricas (/metrics): con METRICS_DIR cada worker escribe su estado ahí
+    # cada METRICS_FLUSH_SECONDS y /metrics suma todos los workers
+    METRICS_DIR = os.getenv('METRICS_DIR', '')
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+    
+    # Arranque (gunicorn.conf.py): conexiones keep-alive a abrir por worker y
+    # filas recientes de DeliveryLog cuyas direcciones se cargan al LRU de geocodificación.
+    # ADMIN_MODE: 'eager', 'lazy' (se monta en el primer request a /admin) u 'off'
+    WARMUP_CONNECTIONS = int(os.getenv('WARMUP_CONNECTIONS', '2'))
+    WARMUP_RECENT_LOGS = int(os.getenv('WARMUP_RECENT_LOGS', '500'))
+    ADMIN_MODE = os.getenv('ADMIN_MODE', 'eager')
     
     # Límites de servicio
     MAX_DELIVERY_DISTANCE_KM = float(os.getenv('MAX_DELIVERY_DISTANCE_KM', '7'))
+    BULK_MAX_DESTINATIONS = int(os.getenv('BULK_MAX_DESTINATIONS', '5000'))
+    
+    # Rechazar sin llamar a ORS si la distancia en línea recta supera el máximo
+    PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'true').lower() == 'true'
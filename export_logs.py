@@ -0,0 +1,56 @@
+"""
+Exportar el historial de cotizaciones a archivos por día para análisis
+
+Lee `delivery_logs` por lotes (paginación por id, memoria acotada) y
+escribe NDJSON comprimido o Parquet (requiere pyarrow) particionado por día
+local, listo para DuckDB, pandas o Spark fuera del servidor:
+
+    <dir>/delivery_logs/date=AAAA-MM-DD/part-<primer id>-<último id>.ndjson.gz
+
+Cada ejecución exporta sólo las filas nuevas desde la marca guardada en
+<dir>/delivery_logs/_watermark.json. Pensado para cron (o dejar EXPORT_DIR
+configurado y que lo haga rollup_logs.py):
+
+    python export_logs.py --dir /data/exports
+    python export_logs.py --dir /data/exports --format parquet --since-id 0 --force   # todo de nuevo
+"""
+import argparse
+import sys
+import time
+
+from app import app
+from services.export import export_logs, read_watermark
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar DeliveryLog a archivos por día')
+    parser.add_argument('--dir', help='Directorio de salida (default: EXPORT_DIR)')
+    parser.add_argument('--format', choices=('ndjson', 'parquet'), help='Formato (default: EXPORT_FORMAT)')
+    parser.add_argument('--since-id', type=int, help='Exportar desde este id en vez de la última marca')
+    parser.add_argument('--force', action='store_true',
+                        help='Con --since-id anterior a la marca: borrar y reemplazar los archivos desde ese id')
+    args = parser.parse_args()
+
+    with app.app_context():
+        directory = args.dir or app.config.get('EXPORT_DIR')
+        if not directory:
+            sys.exit("Indica --dir o define EXPORT_DIR")
+
+        watermark = read_watermark(directory)
+        if watermark and args.since_id is None:
+            print(f"📌 Última exportación: id {watermark['last_id']} ({watermark['exported_at']})")
+
+        start = time.perf_counter()
+        try:
+            result = export_logs(directory, args.format, args.since_id, args.force)
+        except ValueError as e:
+            sys.exit(str(e))
+
+        print(f"📦 {result['rows']} filas exportadas en {len(result['files'])} archivos "
+              f"({time.perf_counter() - start:.1f} s), marca en id {result['last_id']}")
+        for path in result['files']:
+            print(f"   {path}")
+
+
+if __name__ == '__main__':
+    main()
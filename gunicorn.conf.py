@@ -0,0 +1,49 @@
+"""
+Configuración de gunicorn con arranque en caliente
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Con preload_app (GUNICORN_PRELOAD=true) el maestro importa la app y carga
+tabla de tarifas y archivos precalculados una sola vez; los workers nacen
+por fork con todo en memoria compartida y sólo abren sus conexiones y
+cargan el LRU de geocodificación (services/warmup.py). Los tiempos de
+cada fase quedan en el log, en /health y en /metrics.
+"""
+import os
+import time
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:4010')
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = '-'
+errorlog = '-'
+
+_started = time.monotonic()
+
+
+def when_ready(server):
+    # Con preload_app la app ya está importada y los workers aún no existen
+    if preload_app:
+        from app import app
+        from services.warmup import preload
+
+        timings = preload(app)
+        server.log.info(f"Preload: {timings}")
+    server.log.info(f"Master ready in {time.monotonic() - _started:.2f} s (preload_app={preload_app})")
+
+
+def post_fork(server, worker):
+    # Métricas y contadores propios del worker, sin lo que registró el maestro
+    from services.metrics import metrics
+
+    metrics.reset_process()
+
+
+def post_worker_init(worker):
+    from app import app
+    from services.warmup import warm_worker
+
+    timings = warm_worker(app)
+    worker.log.info(f"Worker {worker.pid} warm in {timings['total']:.2f} s: {timings}")
@@ -0,0 +1,70 @@
+"""
+Aprender factores de tráfico por hora y zona desde el historial
+
+Compara el ritmo (minutos por km) de las cotizaciones de cada hora local y
+de cada zona de destino (celdas de TRAFFIC_ZONE_M metros) con el ritmo
+típico, y guarda los factores en `traffic_factors`. Al tarifar, la duración
+del router se multiplica por el factor de la hora/zona (tramos por
+duración y descripción de la tarifa).
+
+Las duraciones de ORS no consideran tráfico: los factores sólo se alejan de
+1 con duraciones reales. Se pueden sumar viajes reales en NDJSON con las
+columnas de DeliveryLog (--archive, acepta comodines):
+
+    python learn_traffic.py --days 60 --dry-run
+    python learn_traffic.py --archive 'viajes/*.ndjson.gz' --min-samples 30
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from app import app
+from models import db, TrafficFactor
+from services.rate_table import rate_table_cache
+from services.replay import group_quotes, iter_log_rows, learn_traffic_factors
+from services.schema import upgrade_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aprender factores de tráfico desde DeliveryLog')
+    parser.add_argument('--days', type=int, default=60, help='Días de historial a usar')
+    parser.add_argument('--archive', action='append', default=[], help='NDJSON adicional (repetible)')
+    parser.add_argument('--min-samples', type=int, default=20, help='Filas mínimas por hora/zona')
+    parser.add_argument('--prior', type=int, default=50, help='Filas "virtuales" con factor 1 (suavizado)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar los factores sin guardarlos')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade_schema()
+        # Las zonas se tarifan con TRAFFIC_ZONE_M: se aprenden con la misma grilla
+        zone_m = app.config.get('TRAFFIC_ZONE_M', 2000)
+        since = datetime.utcnow() - timedelta(days=args.days)
+
+        quotes = group_quotes(iter_log_rows(since, archives=args.archive))
+        baseline, factors = learn_traffic_factors(
+            quotes, app.config['TIMEZONE'], zone_m, args.min_samples, args.prior
+        )
+        if baseline is None:
+            print("⚠️  No hay cotizaciones con distancia y duración en el período")
+            return
+
+        hourly = {f['hour']: f for f in factors if not f['zone']}
+        zones = sum(1 for f in factors if f['zone'])
+        print(f"🚦 Ritmo típico {baseline:.2f} min/km; {len(hourly)} horas y {zones} hora/zona con factor")
+        for hour in range(24):
+            if hour in hourly:
+                print(f"   {hour:02d}:00  x{hourly[hour]['factor']:.3f}  ({hourly[hour]['samples']} filas)")
+
+        if args.dry_run:
+            return
+
+        TrafficFactor.query.delete()
+        db.session.add_all(TrafficFactor(
+            hour=f['hour'], zone=f['zone'], factor=f['factor'], samples=f['samples']
+        ) for f in factors)
+        db.session.commit()
+        rate_table_cache.invalidate()
+        print(f"💾 {len(factors)} factores guardados en traffic_factors")
+
+
+if __name__ == '__main__':
+    main()
@@ -46,6 +46,10 @@ class ShippingService(db.Model):
 class ShippingRate(db.Model):
     """Tarifas por rango de kilómetros"""
     __tablename__ = 'shipping_rates'
+    __table_args__ = (
+        # Compilación de la tabla de tarifas y filtros del admin
+        db.Index('ix_shipping_rates_lookup', 'service_id', 'active', 'min_km', 'max_km'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     service_id = db.Column(db.Integer, db.ForeignKey('shipping_services.id'), nullable=False)
@@ -54,6 +58,11 @@ class ShippingRate(db.Model):
     min_km = db.Column(db.Float, nullable=False)
     max_km = db.Column(db.Float, nullable=False)
     
+    # Rango opcional de duración en minutos (ya ajustada por tráfico); sin
+    # valores el tramo aplica a cualquier duración
+    min_minutes = db.Column(db.Float)
+    max_minutes = db.Column(db.Float)
+    
     # Precio fijo para este rango (pesos chilenos)
     price = db.Column(db.Integer, nullable=False)
     
@@ -67,12 +76,79 @@ class ShippingRate(db.Model):
         return f'<Rate {self.min_km}-{self.max_km}km: ${self.price}>'
 
 
+class PriceSurcharge(db.Model):
+    """Recargo por horario sobre el precio del tramo (p. ej. hora punta)"""
+    __tablename__ = 'price_surcharges'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Servicio al que aplica (None = todos)
+    service_id = db.Column(db.Integer, db.ForeignKey('shipping_services.id'))
+    description = db.Column(db.String(200))
+    
+    # Horario local [start_hour, end_hour); si start_hour > end_hour cruza la medianoche
+    start_hour = db.Column(db.Integer, nullable=False)
+    end_hour = db.Column(db.Integer, nullable=False)
+    
+    # Recargo: fijo (CLP) + por km (CLP/km) + porcentaje del precio del tramo
+    amount = db.Column(db.Integer, default=0)
+    per_km = db.Column(db.Integer, default=0)
+    percent = db.Column(db.Float, default=0)
+    
+    active = db.Column(db.Boolean, default=True)
+    
+    def __repr__(self):
+        return f'<Surcharge {self.start_hour}-{self.end_hour}h>'
+
+
+class TrafficFactor(db.Model):
+    """Factor de tráfico por hora y zona, aprendido del historial (learn_traffic.py)"""
+    __tablename__ = 'traffic_factors'
+    __table_args__ = (
+        db.UniqueConstraint('hour', 'zone', name='uq_traffic_factors_hour_zone'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Hora local (0-23) y celda de destino ('metros:fila:columna', '' = todas las zonas de esa hora)
+    hour = db.Column(db.Integer, nullable=False)
+    zone = db.Column(db.String(30), nullable=False, default='')
+    
+    # Ritmo (min/km) de la hora y zona relativo al típico, y filas usadas
+    factor = db.Column(db.Float, nullable=False, default=1.0)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TrafficFactor {self.hour}h {self.zone}: {self.factor}>'
+
+
+class Store(db.Model):
+    """Tiendas (dark stores) desde las que se puede despachar"""
+    __tablename__ = 'stores'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    code = db.Column(db.String(50), nullable=False, unique=True)
+    address = db.Column(db.String(500))
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    active = db.Column(db.Boolean, default=True)
+    
+    def __repr__(self):
+        return f'<Store {self.code}>'
+
+
 class DeliveryLog(db.Model):
     """Log de consultas de envío para análisis"""
     __tablename__ = 'delivery_logs'
+    __table_args__ = (
+        # Filtro por servicio del admin, ordenado por fecha
+        db.Index('ix_delivery_logs_service_code_timestamp', 'service_code', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Ubicaciones
     from_address = db.Column(db.String(500))
@@ -83,13 +159,137 @@ class DeliveryLog(db.Model):
     to_lon = db.Column(db.Float)
     
     # Resultado
-    distance_km = db.Column(db.Float)
+    distance_km = db.Column(db.Float, index=True)
     duration_minutes = db.Column(db.Float)
     service_code = db.Column(db.String(50))
     calculated_price = db.Column(db.Integer)
     
+    # Pre-filtro en línea recta: distancia haversine y etapa que rechazó
+    # la consulta ('haversine' = sin llamar a ORS, 'route' = por distancia real)
+    straight_line_km = db.Column(db.Float)
+    rejected_by = db.Column(db.String(20))
+    
+    # Origen de la distancia: el router configurado ('ors', 'osrm', ...),
+    # 'field' / 'coverage' (datos precalculados de la tienda) o 'fallback'
+    # (estimada con ORS caído)
+    route_source = db.Column(db.String(20))
+    
+    # Tienda elegida para despachar (None = origen enviado por Jumpseller)
+    store_code = db.Column(db.String(50))
+    
     # Referencia de Jumpseller
     order_reference = db.Column(db.String(100))
     
     def __repr__(self):
         return f'<Log {self.timestamp}: {self.distance_km}km>'
+
+
+class DeliveryLogRollup(db.Model):
+    """Resumen de DeliveryLog por hora o por día (ver rollup_logs.py)"""
+    __tablename__ = 'delivery_log_rollups'
+    __table_args__ = (
+        db.Index('ix_delivery_log_rollups_period', 'period', 'period_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # 'hour' o 'day'; inicio del período en UTC (los días son días locales
+    # de TIMEZONE, así que empiezan a la medianoche local expresada en UTC)
+    period = db.Column(db.String(10), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    
+    # Dimensiones: distance_band_km es la parte entera de la distancia
+    service_code = db.Column(db.String(50))
+    distance_band_km = db.Column(db.Integer)
+    calculated_price = db.Column(db.Integer)
+    rejected_by = db.Column(db.String(20))
+    route_source = db.Column(db.String(20))
+    
+    # Medidas
+    quotes = db.Column(db.Integer, nullable=False, default=0)
+    distance_km_sum = db.Column(db.Float, nullable=False, default=0)
+    duration_minutes_sum = db.Column(db.Float, nullable=False, default=0)
+    
+    @property
+    def revenue(self):
+        return (self.calculated_price or 0) * self.quotes
+    
+    def __repr__(self):
+        return f'<Rollup {self.period} {self.period_start}: {self.quotes}>'
+
+
+class GeocodeCacheEntry(db.Model):
+    """Cache persistente de geocodificación (compartido entre workers)"""
+    __tablename__ = 'geocode_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    address_key = db.Column(db.String(500), nullable=False, unique=True, index=True)
+    address = db.Column(db.String(500))
+    
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    formatted_address = db.Column(db.String(500))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'lat': self.lat,
+            'lon': self.lon,
+            'formatted_address': self.formatted_address
+        }
+    
+    def __repr__(self):
+        return f'<GeocodeCache {self.address_key}>'
+
+
+class RouteCacheEntry(db.Model):
+    """Cache compartido de rutas por par de celdas (origen, destino)"""
+    __tablename__ = 'route_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    route_key = db.Column(db.String(120), nullable=False, unique=True, index=True)
+    profile = db.Column(db.String(30))
+    
+    distance_km = db.Column(db.Float, nullable=False)
+    duration_minutes = db.Column(db.Float, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'distance_km': self.distance_km,
+            'duration_minutes': self.duration_minutes
+        }
+    
+    def __repr__(self):
+        return f'<RouteCache {self.route_key}: {self.distance_km}km>'
+
+
+class CacheVersion(db.Model):
+    """Versión de datos cacheados en memoria por los workers (tarifas, etc.)"""
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @classmethod
+    def get(cls, name):
+        """Versión actual (0 si nunca se ha invalidado)"""
+        entry = db.session.get(cls, name)
+        return entry.version if entry else 0
+    
+    @classmethod
+    def bump(cls, name):
+        """Incrementar versión para que los demás workers recompilen"""
+        entry = db.session.get(cls, name)
+        if entry is None:
+            entry = cls(name=name, version=0)
+            db.session.add(entry)
+        entry.version += 1
+        db.session.commit()
+        return entry.version
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}: {self.version}>'
@@ -0,0 +1,90 @@
+"""
+Re-tarifar el historial con otras reglas de precio para compararlas
+
+Toma las cotizaciones de DeliveryLog (y de archivos NDJSON del archivo de
+retención, --archive) y las tarifa de nuevo, con la misma distancia y
+duración, con las reglas vigentes y con cada archivo de reglas indicado.
+Los archivos de reglas tienen el formato de --export-rules (servicios,
+tramos, recargos y factores de tráfico):
+
+    python replay_pricing.py --export-rules reglas.json
+    python replay_pricing.py --since 2026-09-01 --rules punta=reglas_punta.json
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from app import app
+from services.pricing import load_rules
+from services.rate_table import RateTable
+from services.replay import group_quotes, iter_log_rows, replay_quotes
+
+
+def named_rules(value):
+    name, _, path = value.partition('=')
+    if not path:
+        raise argparse.ArgumentTypeError('Usa nombre=archivo.json')
+    return name, path
+
+
+def print_report(summaries):
+    print(f"   {'Reglas':<14} {'Cotiz.':>8} {'Con tarifa':>10} {'Sin tarifa':>10} {'Fuera':>7} "
+          f"{'Más barata prom.':>16} {'Cambian':>8} {'Δ prom.':>8}")
+    for name, s in summaries.items():
+        average = s['cheapest_total'] / s['priced'] if s['priced'] else 0
+        delta = s['delta_total'] / s['priced'] if s['priced'] else 0
+        print(f"   {name:<14} {s['quotes']:>8} {s['priced']:>10} {s['no_rates']:>10} {s['out_of_range']:>7} "
+              f"{average:>16.0f} {s['changed']:>8} {delta:>+8.0f}")
+
+    print("\n   Por servicio (cotizaciones / precio promedio)")
+    codes = sorted({code for s in summaries.values() for code in s['by_service']})
+    print(f"   {'Servicio':<20} " + '   '.join(f"{name:>16}" for name in summaries))
+    for code in codes:
+        cells = []
+        for s in summaries.values():
+            count, total = s['by_service'].get(code, (0, 0))
+            cells.append(f"{count:>7} / {total / count if count else 0:>6.0f}")
+        print(f"   {code:<20} " + '   '.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Comparar reglas de precio sobre el historial')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='Desde esta fecha/hora (UTC)')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='Hasta esta fecha/hora (UTC)')
+    parser.add_argument('--archive', action='append', default=[], help='NDJSON adicional (repetible)')
+    parser.add_argument('--rules', type=named_rules, action='append', default=[],
+                        help='Reglas alternativas: nombre=archivo.json (repetible)')
+    parser.add_argument('--export-rules', help='Guardar las reglas vigentes en este archivo y salir')
+    parser.add_argument('--json', action='store_true', help='Resultado en JSON')
+    args = parser.parse_args()
+
+    with app.app_context():
+        config = app.config
+        current = load_rules()
+        if args.export_rules:
+            with open(args.export_rules, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+            print(f"💾 Reglas vigentes guardadas en {args.export_rules}")
+            return
+
+        tables = {'vigentes': RateTable.from_rules(current, config['TIMEZONE'])}
+        for name, path in args.rules:
+            with open(path, encoding='utf-8') as f:
+                tables[name] = RateTable.from_rules(json.load(f), config['TIMEZONE'])
+
+        start = time.perf_counter()
+        quotes = group_quotes(iter_log_rows(args.since, args.until, args.archive))
+        summaries = replay_quotes(quotes, tables, config['TIMEZONE'], config['MAX_DELIVERY_DISTANCE_KM'])
+        elapsed = time.perf_counter() - start
+
+        if args.json:
+            print(json.dumps(summaries, ensure_ascii=False, indent=2))
+            return
+
+        print(f"🔁 {summaries['historial']['quotes']} cotizaciones re-tarifadas en {elapsed:.1f} s")
+        print_report(summaries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Resumir el historial de cotizaciones y aplicar la retención
+
+Agrega las filas de DeliveryLog en resúmenes por hora y por día (servicio,
+tramo de distancia, precio, etapa que rechazó y origen de la distancia),
+que son los que muestra el admin. Con EXPORT_DIR exporta las filas nuevas
+(ver export_logs.py). La retención está desactivada por defecto
+(LOG_RETENTION_DAYS=0); con LOG_RETENTION_DAYS=N borra las filas de más de N
+días, guardándolas antes en LOG_ARCHIVE_DIR. Pensado para cron, p. ej. cada
+15 minutos:
+
+    python rollup_logs.py
+    python rollup_logs.py --since 2026-01-01   # recalcular desde una fecha
+"""
+import argparse
+import time
+from datetime import datetime
+
+from app import app
+from services.export import export_logs
+from services.rollup import apply_retention, rollup_logs
+from services.schema import upgrade_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumir DeliveryLog y aplicar retención')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='Recalcular desde esta fecha/hora (UTC)')
+    parser.add_argument('--no-retention', action='store_true', help='Sólo resumir, sin borrar filas')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade_schema()
+
+        start = time.perf_counter()
+        result = rollup_logs(args.since)
+        print(f"📊 {result['hours']} horas y {result['days']} días resumidos ({time.perf_counter() - start:.1f} s)")
+
+        if app.config.get('EXPORT_DIR'):
+            try:
+                result = export_logs()
+                print(f"📦 {result['rows']} filas exportadas en {len(result['files'])} archivos")
+            except Exception as e:
+                # Sin exportar, la retención tampoco borra esas filas
+                app.logger.error(f"Export error: {str(e)}")
+
+        if not args.no_retention:
+            deleted = apply_retention()
+            if deleted:
+                archive = app.config.get('LOG_ARCHIVE_DIR')
+                print(f"🗑️  {deleted} filas borradas" + (f" (archivadas en {archive})" if archive else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,16 @@
 from app import app, db
 from models import ShippingService, ShippingRate
+from services.rate_table import rate_table_cache
+from services.schema import upgrade_schema
 
 def seed_database():
     """Poblar base de datos con servicios y tarifas exactas"""
     with app.app_context():
+        # Crear tablas y columnas que falten
+        added = upgrade_schema()
+        if added:
+            print(f"🔧 Columnas agregadas: {', '.join(added)}")
+        
         # Limpiar datos anteriores
         ShippingRate.query.delete()
         ShippingService.query.delete()
@@ -57,6 +64,9 @@ def seed_database():
         
         db.session.commit()
         
+        # Avisar a los workers en ejecución que recompilen las tarifas
+        rate_table_cache.invalidate()
+        
         print("\n✅ Base de datos inicializada correctamente")
         print("\n" + "="*70)
         print("📦 SERVICIOS CREADOS:")
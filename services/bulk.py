@@ -0,0 +1,161 @@
+from flask import current_app
+
+from services.geo import haversine_km_many
+from services.quotes import find_rates, format_rate, out_of_coverage_message, precomputed_route
+from services.rate_table import rate_table_cache
+
+
+def location_coords(location):
+    """{'latitude', 'longitude'} de Jumpseller -> {'lat', 'lon'} (o None, también si no son números)"""
+    if location.get('latitude') and location.get('longitude'):
+        try:
+            return {'lat': float(location['latitude']), 'lon': float(location['longitude'])}
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def valid_destination(destination):
+    """Un destino es un dict con dirección o con coordenadas"""
+    if not isinstance(destination, dict):
+        return False
+    return bool(location_coords(destination) or isinstance(destination.get('address'), str) and destination['address'])
+
+
+def resolve_origin(ors, origin):
+    """
+    Coordenadas del origen de una cotización masiva
+
+    Args:
+        origin (dict): {'address': str} o {'latitude': float, 'longitude': float}
+
+    Returns:
+        dict: {'lat', 'lon'} o None si no se pudo geocodificar
+    """
+    if not isinstance(origin, dict):
+        return None
+    coords = location_coords(origin)
+    if coords:
+        return coords
+    if origin.get('address'):
+        return ors.geocode(origin['address'])
+    return None
+
+
+def bulk_quote(ors, from_coords, destinations, profile='driving-car'):
+    """
+    Cotizar muchos destinos desde un mismo origen
+
+    Se procesa en bloques de ORS_MATRIX_CHUNK destinos: las direcciones
+    del bloque se geocodifican (una sola vez cada una) y las distancias se
+    piden a /matrix, omitiendo los que ya quedan fuera de cobertura en línea
+    recta. Los resultados se generan bloque a bloque, en el orden de
+    entrada, así que la primera línea sale sin esperar a todo el lote. Los
+    destinos inválidos reciben una línea con 'error'. No se registran en
+    DeliveryLog (no son cotizaciones de checkout).
+
+    Args:
+        ors: Proveedor de geocodificación y rutas (get_provider())
+        from_coords (dict): {'lat', 'lon'} del origen
+        destinations (list): dicts con 'id' opcional y 'address' o
+            'latitude'/'longitude'
+        profile (str): Perfil de ruta
+
+    Yields:
+        dict: {'id', 'address', 'lat', 'lon', 'distance_km',
+               'duration_minutes', 'rates', 'error'?}
+    """
+    max_distance = current_app.config['MAX_DELIVERY_DISTANCE_KM']
+    chunk_size = current_app.config.get('ORS_MATRIX_CHUNK', 49)
+    table = rate_table_cache.get()
+    hour = table.current_hour()
+
+    geocoded = {}
+
+    for start in range(0, len(destinations), chunk_size):
+        chunk = destinations[start:start + chunk_size]
+
+        addresses = [d['address'] for d in chunk
+                     if valid_destination(d) and not location_coords(d) and d['address'] not in geocoded]
+        if addresses:
+            geocoded.update(ors.geocode_many(addresses))
+
+        lines = []
+        routable = []
+        for index, destination in enumerate(chunk, start):
+            if not valid_destination(destination):
+                lines.append({
+                    'id': destination.get('id', index) if isinstance(destination, dict) else index,
+                    'address': None,
+                    'lat': None,
+                    'lon': None,
+                    'distance_km': None,
+                    'duration_minutes': None,
+                    'rates': [],
+                    'error': "Destino inválido: falta dirección o coordenadas"
+                })
+                continue
+
+            coords = location_coords(destination) or geocoded.get(destination.get('address'))
+            line = {
+                'id': destination.get('id', index),
+                'address': destination.get('address'),
+                'lat': coords['lat'] if coords else None,
+                'lon': coords['lon'] if coords else None,
+                'distance_km': None,
+                'duration_minutes': None,
+                'rates': []
+            }
+            if coords:
+                routable.append((line, coords))
+            else:
+                line['error'] = "No se pudo geocodificar la dirección"
+            lines.append(line)
+
+        # Pre-filtro en línea recta: los lejanos no se envían a /matrix
+        if routable and current_app.config.get('PREFILTER_ENABLED', True):
+            straight = haversine_km_many(from_coords, [coords for _, coords in routable])
+            nearby = []
+            for (line, coords), straight_km in zip(routable, straight):
+                if straight_km > max_distance:
+                    line['error'] = out_of_coverage_message(straight_km, straight_line=True)
+                else:
+                    nearby.append((line, coords))
+            routable = nearby
+
+        # Campo de distancias / índice de cobertura antes de /matrix
+        resolved = []
+        remote = []
+        for line, coords in routable:
+            route, _ = precomputed_route(from_coords, coords, table)
+            if route:
+                resolved.append((line, route))
+            else:
+                remote.append((line, coords))
+
+        # Sin cache de rutas: destinos casi siempre únicos, leer/escribir cada
+        # uno serían miles de consultas y vaciarían el LRU de las cotizaciones
+        routes = ors.calculate_matrix(from_coords, [coords for _, coords in remote], profile, use_cache=False)
+        resolved.extend(zip((line for line, _ in remote), routes))
+
+        for line, route in resolved:
+            if not route:
+                line['error'] = "No se pudo calcular la distancia"
+                continue
+
+            distance_km = route['distance_km']
+            duration_minutes = route['duration_minutes']
+            line['distance_km'] = distance_km
+            line['duration_minutes'] = duration_minutes
+
+            if distance_km > max_distance:
+                line['error'] = out_of_coverage_message(distance_km)
+                continue
+
+            traffic_minutes = table.traffic.adjust(duration_minutes, {'lat': line['lat'], 'lon': line['lon']}, hour)
+            line['rates'] = [
+                format_rate(service, band, price, distance_km, traffic_minutes)
+                for service, band, price in find_rates(distance_km, table, hour, traffic_minutes)
+            ]
+
+        yield from lines
@@ -0,0 +1,452 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, GeocodeCacheEntry, RouteCacheEntry
+from services.metrics import metrics
+
+
+class LRUCache:
+    """Cache LRU en memoria con expiración (TTL), seguro entre threads"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl  # segundos (None = sin expiración)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ============= NORMALIZACIÓN DE DIRECCIONES =============
+
+# Sufijos que no cambian la ubicación: región, país, "comuna de ..."
+_ADDRESS_SUFFIXES = (
+    'chile',
+    'region metropolitana de santiago',
+    'region metropolitana',
+    'rm',
+    'provincia de santiago',
+)
+
+_ADDRESS_ABBREVIATIONS = {
+    'avenida': 'av',
+    'avda': 'av',
+    'pasaje': 'pje',
+    'psje': 'pje',
+    'calle': '',
+    'numero': '',
+    'nro': '',
+    'n': '',
+}
+
+
+def normalize_address(address):
+    """
+    Normalizar dirección para usarla como clave de cache
+
+    Quita tildes, mayúsculas, puntuación y espacios repetidos, y descarta
+    sufijos como ", Región Metropolitana, Chile" o el prefijo "Comuna de".
+
+    Args:
+        address (str): Dirección libre
+
+    Returns:
+        str: Clave normalizada ('' si la dirección está vacía)
+    """
+    if not address:
+        return ''
+
+    text = unicodedata.normalize('NFKD', address)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+    parts = []
+    for part in text.split(','):
+        part = re.sub(r'[^a-z0-9]+', ' ', part).strip()
+        part = re.sub(r'^comuna (de )?', '', part)
+        if part and part not in _ADDRESS_SUFFIXES:
+            words = [_ADDRESS_ABBREVIATIONS.get(w, w) for w in part.split()]
+            parts.append(' '.join(w for w in words if w))
+
+    return ', '.join(p for p in parts if p)
+
+
+# ============= CACHE DE GEOCODIFICACIÓN =============
+
+class GeocodeCache:
+    """
+    Cache de geocodificación en dos niveles
+
+    1. LRU en memoria por worker
+    2. Tabla `geocode_cache` compartida por todos los workers
+    """
+
+    def __init__(self):
+        self._lru = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def _memory(self):
+        if self._lru is None:
+            config = current_app.config
+            self._lru = LRUCache(
+                maxsize=config.get('GEOCODE_CACHE_LRU_SIZE', 1024),
+                ttl=config.get('GEOCODE_CACHE_TTL_DAYS', 30) * 86400
+            )
+        return self._lru
+
+    def _count(self, key, record_stats=True):
+        if not record_stats:
+            return
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, address, record_stats=True):
+        """Buscar dirección en cache. Retorna dict de coordenadas o None"""
+        if not current_app.config.get('GEOCODE_CACHE_ENABLED', True):
+            return None
+
+        key = normalize_address(address)
+        if not key:
+            return None
+
+        lru = self._memory()
+        result = lru.get(key)
+        if result is not None:
+            self._count('memory_hits', record_stats)
+            return dict(result)
+
+        try:
+            entry = GeocodeCacheEntry.query.filter_by(address_key=key).first()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Geocode cache read error: {str(e)}")
+            entry = None
+
+        if entry is not None:
+            ttl_days = current_app.config.get('GEOCODE_CACHE_TTL_DAYS', 30)
+            if entry.created_at >= datetime.utcnow() - timedelta(days=ttl_days):
+                result = entry.to_dict()
+                lru.set(key, result)
+                self._count('db_hits', record_stats)
+                return dict(result)
+
+        self._count('misses', record_stats)
+        return None
+
+    def preload(self, addresses, chunk_size=500):
+        """
+        Cargar al LRU las entradas vigentes de la tabla para estas direcciones
+
+        Una consulta IN por bloque en vez de una por dirección; no cuenta en
+        las estadísticas. Retorna cuántas direcciones quedaron en memoria.
+        """
+        if not current_app.config.get('GEOCODE_CACHE_ENABLED', True):
+            return 0
+
+        keys = list(dict.fromkeys(key for key in map(normalize_address, addresses) if key))
+        cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('GEOCODE_CACHE_TTL_DAYS', 30))
+        lru = self._memory()
+        loaded = 0
+
+        for i in range(0, len(keys), chunk_size):
+            try:
+                entries = GeocodeCacheEntry.query.filter(
+                    GeocodeCacheEntry.address_key.in_(keys[i:i + chunk_size]),
+                    GeocodeCacheEntry.created_at >= cutoff
+                ).all()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Geocode cache preload error: {str(e)}")
+                break
+
+            for entry in entries:
+                lru.set(entry.address_key, entry.to_dict())
+            loaded += len(entries)
+
+        return loaded
+
+    def set(self, address, result):
+        """Guardar resultado de geocodificación en ambos niveles"""
+        if not current_app.config.get('GEOCODE_CACHE_ENABLED', True):
+            return
+
+        key = normalize_address(address)
+        if not key or not result:
+            return
+
+        self._memory().set(key, dict(result))
+
+        try:
+            entry = GeocodeCacheEntry.query.filter_by(address_key=key).first()
+            if entry is None:
+                entry = GeocodeCacheEntry(address_key=key)
+                db.session.add(entry)
+            entry.address = address[:500]
+            entry.lat = result['lat']
+            entry.lon = result['lon']
+            entry.formatted_address = result.get('formatted_address')
+            entry.created_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Geocode cache write error: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % 100 == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Eliminar entradas vencidas y recortar la tabla al máximo configurado"""
+        config = current_app.config
+        cutoff = datetime.utcnow() - timedelta(days=config.get('GEOCODE_CACHE_TTL_DAYS', 30))
+        max_rows = config.get('GEOCODE_CACHE_MAX_ROWS', 50000)
+
+        try:
+            deleted = GeocodeCacheEntry.query.filter(
+                GeocodeCacheEntry.created_at < cutoff
+            ).delete(synchronize_session=False)
+
+            total = GeocodeCacheEntry.query.count()
+            if total > max_rows:
+                oldest = db.session.query(GeocodeCacheEntry.id).order_by(
+                    GeocodeCacheEntry.created_at
+                ).limit(total - max_rows).subquery()
+                deleted += GeocodeCacheEntry.query.filter(
+                    GeocodeCacheEntry.id.in_(db.select(oldest.c.id))
+                ).delete(synchronize_session=False)
+
+            db.session.commit()
+            return deleted
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Geocode cache purge error: {str(e)}")
+            return 0
+
+    def get_stats(self):
+        """Contadores de aciertos/fallos de este worker"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = sum(stats.values())
+        hits = stats['memory_hits'] + stats['db_hits']
+        stats['hit_ratio'] = round(hits / lookups, 3) if lookups else None
+        stats['memory_size'] = len(self._lru) if self._lru is not None else 0
+        return stats
+
+
+geocode_cache = GeocodeCache()
+metrics.add_collector(lambda: [
+    ('shipping_cache_lookups_total', {'cache': 'geocode', 'result': key}, value)
+    for key, value in dict(geocode_cache.stats).items()
+], stats=[geocode_cache.stats])
+
+
+# ============= CACHE DE RUTAS =============
+
+METERS_PER_DEGREE = 111320.0
+
+
+def snap_coords(coords, grid_m=10):
+    """
+    Ajustar coordenadas a una grilla de `grid_m` metros
+
+    Args:
+        coords (dict): {'lat': float, 'lon': float}
+        grid_m (float): Tamaño de celda en metros
+
+    Returns:
+        tuple: (fila, columna) enteros de la celda
+    """
+    lat = float(coords['lat'])
+    lon = float(coords['lon'])
+    lat_step = grid_m / METERS_PER_DEGREE
+    row = round(lat / lat_step)
+    # El ancho de un grado de longitud depende de la latitud de la celda
+    lon_step = lat_step / max(math.cos(math.radians(row * lat_step)), 0.01)
+    return row, round(lon / lon_step)
+
+
+class RouteCache:
+    """
+    Memoización de rutas (distancia/duración) por par de coordenadas
+
+    La clave es (perfil, celda origen, celda destino) con celdas de
+    ROUTE_CACHE_GRID_M metros. Con ROUTE_CACHE_BACKEND='database' los
+    resultados se comparten entre workers mediante la tabla `route_cache`.
+    """
+
+    def __init__(self):
+        self._lru = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def _memory(self):
+        if self._lru is None:
+            config = current_app.config
+            self._lru = LRUCache(
+                maxsize=config.get('ROUTE_CACHE_SIZE', 4096),
+                ttl=config.get('ROUTE_CACHE_TTL_HOURS', 24) * 3600
+            )
+        return self._lru
+
+    def _count(self, key, record_stats=True):
+        if not record_stats:
+            return
+        with self._lock:
+            self.stats[key] += 1
+
+    def make_key(self, from_coords, to_coords, profile='driving-car'):
+        grid_m = current_app.config.get('ROUTE_CACHE_GRID_M', 10)
+        a = snap_coords(from_coords, grid_m)
+        b = snap_coords(to_coords, grid_m)
+        return f"{profile}:{grid_m:g}:{a[0]}:{a[1]}:{b[0]}:{b[1]}"
+
+    def _use_database(self):
+        return current_app.config.get('ROUTE_CACHE_BACKEND', 'memory') == 'database'
+
+    def get(self, from_coords, to_coords, profile='driving-car', record_stats=True):
+        """Retorna {'distance_km', 'duration_minutes'} o None"""
+        if not current_app.config.get('ROUTE_CACHE_ENABLED', True):
+            return None
+
+        key = self.make_key(from_coords, to_coords, profile)
+        lru = self._memory()
+        result = lru.get(key)
+        if result is not None:
+            self._count('memory_hits', record_stats)
+            return dict(result)
+
+        if self._use_database():
+            try:
+                entry = RouteCacheEntry.query.filter_by(route_key=key).first()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Route cache read error: {str(e)}")
+                entry = None
+
+            ttl_hours = current_app.config.get('ROUTE_CACHE_TTL_HOURS', 24)
+            if entry is not None and entry.created_at >= datetime.utcnow() - timedelta(hours=ttl_hours):
+                result = entry.to_dict()
+                lru.set(key, result)
+                self._count('db_hits', record_stats)
+                return dict(result)
+
+        self._count('misses', record_stats)
+        return None
+
+    def set(self, from_coords, to_coords, result, profile='driving-car'):
+        """Guardar distancia/duración de una ruta"""
+        if not current_app.config.get('ROUTE_CACHE_ENABLED', True) or not result:
+            return
+
+        key = self.make_key(from_coords, to_coords, profile)
+        value = {
+            'distance_km': result['distance_km'],
+            'duration_minutes': result['duration_minutes']
+        }
+        self._memory().set(key, value)
+
+        if not self._use_database():
+            return
+
+        try:
+            entry = RouteCacheEntry.query.filter_by(route_key=key).first()
+            if entry is None:
+                entry = RouteCacheEntry(route_key=key, profile=profile)
+                db.session.add(entry)
+            entry.distance_km = value['distance_km']
+            entry.duration_minutes = value['duration_minutes']
+            entry.created_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Route cache write error: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % 100 == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Eliminar rutas vencidas de la tabla compartida y recortarla al máximo configurado"""
+        config = current_app.config
+        cutoff = datetime.utcnow() - timedelta(hours=config.get('ROUTE_CACHE_TTL_HOURS', 24))
+        max_rows = config.get('ROUTE_CACHE_MAX_ROWS', 200000)
+
+        try:
+            deleted = RouteCacheEntry.query.filter(
+                RouteCacheEntry.created_at < cutoff
+            ).delete(synchronize_session=False)
+
+            total = RouteCacheEntry.query.count()
+            if total > max_rows:
+                oldest = db.session.query(RouteCacheEntry.id).order_by(
+                    RouteCacheEntry.created_at
+                ).limit(total - max_rows).subquery()
+                deleted += RouteCacheEntry.query.filter(
+                    RouteCacheEntry.id.in_(db.select(oldest.c.id))
+                ).delete(synchronize_session=False)
+
+            db.session.commit()
+            return deleted
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Route cache purge error: {str(e)}")
+            return 0
+
+    def get_stats(self):
+        """Contadores de aciertos/fallos de este worker"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = sum(stats.values())
+        hits = stats['memory_hits'] + stats['db_hits']
+        stats['hit_ratio'] = round(hits / lookups, 3) if lookups else None
+        stats['memory_size'] = len(self._lru) if self._lru is not None else 0
+        return stats
+
+
+route_cache = RouteCache()
+metrics.add_collector(lambda: [
+    ('shipping_cache_lookups_total', {'cache': 'route', 'result': key}, value)
+    for key, value in dict(route_cache.stats).items()
+], stats=[route_cache.stats])
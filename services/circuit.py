@@ -0,0 +1,162 @@
+import threading
+import time
+
+from flask import current_app
+
+from services.metrics import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """ORS no disponible: el circuito está abierto y la llamada no se intenta"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de un servidor ORS (por worker y por servidor)
+
+    Tras CIRCUIT_FAILURE_THRESHOLD fallos consecutivos (errores de red,
+    429/5xx o llamadas más lentas que CIRCUIT_SLOW_MS) el circuito se abre y
+    las llamadas fallan de inmediato durante CIRCUIT_OPEN_SECONDS. Luego pasa
+    a semiabierto: se deja pasar una llamada de prueba; si responde bien se
+    cierra, si no vuelve a abrirse.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self.stats = {'opened': 0, 'rejected': 0, 'slow_calls': 0}
+
+    def allow(self):
+        """True si la llamada puede ir a ORS"""
+        config = current_app.config
+        if not config.get('CIRCUIT_ENABLED', True):
+            return True
+
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < config.get('CIRCUIT_OPEN_SECONDS', 30):
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+
+            # Semiabierto: una sola llamada de prueba a la vez
+            if self._probe_in_flight:
+                self.stats['rejected'] += 1
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, elapsed_ms, status=None):
+        """
+        Registrar el resultado de una llamada
+
+        Args:
+            elapsed_ms (float): Duración de la llamada
+            status (int): Código HTTP, o None si falló la conexión
+        """
+        config = current_app.config
+        if not config.get('CIRCUIT_ENABLED', True):
+            return
+
+        slow = elapsed_ms > config.get('CIRCUIT_SLOW_MS', 3000)
+        failed = status is None or status == 429 or status >= 500 or slow
+
+        with self._lock:
+            if slow:
+                self.stats['slow_calls'] += 1
+
+            if not failed:
+                if self.state != CLOSED:
+                    current_app.logger.info(f"Circuit {self.name} closed")
+                self.state = CLOSED
+                self.failures = 0
+                self._probe_in_flight = False
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= config.get('CIRCUIT_FAILURE_THRESHOLD', 5):
+                if self.state != OPEN:
+                    self.stats['opened'] += 1
+                    current_app.logger.warning(
+                        f"Circuit {self.name} open after {self.failures} failures"
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def is_closed(self):
+        if not current_app.config.get('CIRCUIT_ENABLED', True):
+            return True
+        with self._lock:
+            return self.state == CLOSED
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self.failures
+            if self.state == OPEN:
+                stats['open_for_s'] = round(time.monotonic() - self.opened_at, 1)
+        return stats
+
+
+class NoCircuit:
+    """Router en proceso (ROUTER_PROVIDER=graph): no hay servidor que pueda caerse"""
+
+    name = 'graph'
+    state = CLOSED
+
+    def allow(self):
+        return True
+
+    def record(self, elapsed_ms, status=None):
+        pass
+
+    def is_closed(self):
+        return True
+
+    def get_stats(self):
+        return {'state': CLOSED}
+
+
+ors_circuit = CircuitBreaker('ors')
+# ORS propio (ROUTER_PROVIDER=ors-local) y OSRM: sus fallos no deben cortar
+# el ORS público (geocodificación) ni al revés
+ors_local_circuit = CircuitBreaker('ors-local')
+osrm_circuit = CircuitBreaker('osrm')
+CIRCUITS = (ors_circuit, ors_local_circuit, osrm_circuit)
+
+# ROUTER_PROVIDER -> circuito del router
+ROUTER_CIRCUITS = {
+    'ors': ors_circuit,
+    'ors-local': ors_local_circuit,
+    'osrm': osrm_circuit,
+    'graph': NoCircuit(),
+}
+
+
+def router_circuit():
+    """Circuito del router configurado (decide el modo degradado)"""
+    return ROUTER_CIRCUITS.get(current_app.config.get('ROUTER_PROVIDER', 'ors'), ors_circuit)
+
+
+metrics.add_collector(lambda: [
+    ('shipping_circuit_state', {'circuit': circuit.name, 'state': state}, int(circuit.state == state))
+    for circuit in CIRCUITS
+    for state in (CLOSED, OPEN, HALF_OPEN)
+] + [
+    ('shipping_circuit_opened_total', {'circuit': circuit.name}, circuit.stats['opened'])
+    for circuit in CIRCUITS
+], stats=[circuit.stats for circuit in CIRCUITS])
@@ -0,0 +1,205 @@
+import json
+import math
+import os
+import struct
+from array import array
+from datetime import datetime
+
+from flask import current_app
+
+from services.cache import METERS_PER_DEGREE
+from services.files import ReloadingFile
+from services.geo import straight_line_km
+
+MAGIC = b'COVIDX1\n'
+
+
+class CoverageIndex:
+    """
+    Índice de cobertura precalculado alrededor de la tienda
+
+    Grilla de celdas de `cell_m` metros centrada en el origen. Cada celda
+    guarda la distancia (km) y duración (min) por calle desde el origen a su
+    centro, medidas con ORS al construir el índice (NaN = sin dato).
+
+    Una consulta se responde desde el índice sólo si la celda y sus ocho
+    vecinas caen en el mismo tramo de tarifa (con un margen); cerca de los
+    límites entre tramos se devuelve None para consultar ORS en vivo.
+    """
+
+    def __init__(self, origin, cell_m, rows, cols, distances, durations, built_at=None):
+        self.origin = origin
+        self.cell_m = cell_m
+        self.rows = rows
+        self.cols = cols
+        self.distances = distances
+        self.durations = durations
+        self.built_at = built_at
+
+        self.dlat = cell_m / METERS_PER_DEGREE
+        self.dlon = self.dlat / math.cos(math.radians(origin['lat']))
+        # Esquina sur-oeste de la grilla (el origen queda en la celda central)
+        self.lat0 = origin['lat'] - (rows / 2) * self.dlat
+        self.lon0 = origin['lon'] - (cols / 2) * self.dlon
+
+    # ----- Geometría de la grilla -----
+
+    @staticmethod
+    def grid_size(radius_km, cell_m):
+        """Filas/columnas necesarias para cubrir un radio (número impar)"""
+        half = int(math.ceil(radius_km * 1000 / cell_m))
+        return 2 * half + 1
+
+    def cell_of(self, coords):
+        row = int(math.floor((float(coords['lat']) - self.lat0) / self.dlat))
+        col = int(math.floor((float(coords['lon']) - self.lon0) / self.dlon))
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+    def cell_center(self, row, col):
+        return {
+            'lat': self.lat0 + (row + 0.5) * self.dlat,
+            'lon': self.lon0 + (col + 0.5) * self.dlon
+        }
+
+    def value(self, row, col):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            index = row * self.cols + col
+            return self.distances[index], self.durations[index]
+        return math.nan, math.nan
+
+    # ----- Consulta -----
+
+    def matches_origin(self, coords, radius_m):
+        return straight_line_km(self.origin, coords) * 1000 <= radius_m
+
+    def lookup(self, to_coords, boundaries, margin_km=0.1):
+        """
+        Distancia/duración desde el origen del índice, si es inequívoca
+
+        Args:
+            to_coords (dict): {'lat', 'lon'} del destino
+            boundaries (list): Límites de tramos de tarifa (km), ordenados
+            margin_km (float): Distancia mínima a un límite para confiar
+
+        Returns:
+            dict: {'distance_km', 'duration_minutes'} o None (consultar ORS)
+        """
+        cell = self.cell_of(to_coords)
+        if cell is None:
+            return None
+
+        row, col = cell
+        distance, duration = self.value(row, col)
+        if math.isnan(distance):
+            return None
+
+        low = high = distance
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                neighbor, _ = self.value(row + dr, col + dc)
+                if math.isnan(neighbor):
+                    return None
+                low = min(low, neighbor)
+                high = max(high, neighbor)
+
+        low -= margin_km
+        high += margin_km
+        for boundary in boundaries:
+            if low < boundary <= high:
+                return None
+
+        return {
+            'distance_km': round(distance, 2),
+            'duration_minutes': round(duration, 1)
+        }
+
+    # ----- Archivo -----
+
+    def save(self, path):
+        header = json.dumps({
+            'origin': self.origin,
+            'cell_m': self.cell_m,
+            'rows': self.rows,
+            'cols': self.cols,
+            'built_at': self.built_at or datetime.utcnow().isoformat()
+        }).encode('utf-8')
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(array('f', self.distances).tobytes())
+            f.write(array('f', self.durations).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} no es un índice de cobertura")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len))
+
+            size = header['rows'] * header['cols']
+            distances = array('f')
+            distances.frombytes(f.read(size * 4))
+            durations = array('f')
+            durations.frombytes(f.read(size * 4))
+
+        return cls(header['origin'], header['cell_m'], header['rows'], header['cols'],
+                   distances, durations, header.get('built_at'))
+
+
+def rate_boundaries(table, max_distance_km):
+    """Límites de tramo de todas las tarifas activas + distancia máxima"""
+    boundaries = {max_distance_km}
+    for service in table.services:
+        for band in service.bands:
+            boundaries.add(band.min_km)
+            boundaries.add(band.max_km)
+    return sorted(boundaries)
+
+
+class CoverageIndexLoader(ReloadingFile):
+    """Carga perezosa del índice (por worker), recargando si cambia el archivo"""
+
+    def __init__(self):
+        super().__init__('COVERAGE_INDEX_PATH', CoverageIndex.load, 'Coverage index')
+
+    def lookup(self, from_coords, to_coords, table):
+        """
+        Ruta desde el índice si el origen es la tienda y el destino no está
+        cerca de un límite de tramo. Retorna None para consultar ORS.
+        """
+        index = self.get()
+        if index is None:
+            return None
+
+        # Las distancias y duraciones del índice son aproximadas por celda:
+        # no sirven si el precio depende de los minutos o de cada km
+        if table.needs_exact_route:
+            return None
+
+        config = current_app.config
+        if not index.matches_origin(from_coords, config.get('STORE_MATCH_RADIUS_M', 50)):
+            return None
+
+        boundaries = rate_boundaries(table, config['MAX_DELIVERY_DISTANCE_KM'])
+        return index.lookup(to_coords, boundaries, config.get('COVERAGE_MARGIN_KM', 0.1))
+
+    def get_stats(self):
+        index = self._value
+        if index is None:
+            return None
+        return {
+            'origin': index.origin,
+            'cell_m': index.cell_m,
+            'cells': index.rows * index.cols,
+            'built_at': index.built_at
+        }
+
+
+coverage_index = CoverageIndexLoader()
@@ -0,0 +1,144 @@
+import math
+from datetime import datetime
+
+from flask import current_app
+
+from services.files import ReloadingFile, read_sections, write_sections
+from services.geo import straight_line_km
+from services.graph import NodeGrid, route_result
+
+MAGIC = b'DISTFLD1'
+
+SECTIONS = (
+    ('lat', 'f'), ('lon', 'f'), ('cell_ptr', 'i'),
+    ('seconds', 'f'), ('meters', 'f'),
+)
+
+
+class DistanceField(NodeGrid):
+    """
+    Distancia por calle desde la tienda a cada nodo del grafo vial
+
+    Es el árbol de caminos más rápidos desde el origen, calculado una vez
+    (build_distance_field.py) sobre el grafo de build_road_graph.py. Guarda
+    sus propios nodos y grilla, así que responde sin cargar el grafo: una
+    cotización desde la tienda se resuelve buscando el nodo más cercano al
+    destino y leyendo su distancia.
+    """
+
+    @classmethod
+    def from_graph(cls, graph, origin, snap_m=300):
+        source = graph.nearest_node(origin, snap_m)
+        if source is None:
+            raise ValueError("El origen no está cerca de ninguna calle del grafo")
+
+        seconds, meters = graph.shortest_path_tree(source)
+        meta = {
+            'nodes': graph.nodes,
+            'cell_m': graph.cell_m,
+            'rows': graph.rows,
+            'cols': graph.cols,
+            'lat0': graph.lat0,
+            'lon0': graph.lon0,
+            'origin': origin,
+            'source_node': source,
+            'graph_built_at': graph.meta.get('built_at'),
+            'graph_source': graph.meta.get('source')
+        }
+        arrays = {
+            'lat': graph.lat, 'lon': graph.lon, 'cell_ptr': graph.cell_ptr,
+            'seconds': seconds, 'meters': meters
+        }
+        return cls(meta, arrays)
+
+    def save(self, path):
+        self.meta = write_sections(path, MAGIC, self.meta, SECTIONS,
+                                   {name: getattr(self, name) for name, _ in SECTIONS})
+
+    @classmethod
+    def load(cls, path):
+        return cls(*read_sections(path, MAGIC, SECTIONS))
+
+    @property
+    def origin(self):
+        return self.meta['origin']
+
+    def reachable(self):
+        return sum(1 for value in self.meters if not math.isnan(value))
+
+    def lookup(self, to_coords, snap_m=300):
+        """
+        Distancia/duración desde el origen del campo hasta un destino
+
+        Returns:
+            dict: {'distance_km', 'duration_minutes'} o None si el destino
+            no está cerca del grafo o no es alcanzable
+        """
+        node = self.nearest_node(to_coords, snap_m)
+        if node is None:
+            return None
+
+        meters = self.meters[node]
+        if math.isnan(meters):
+            return None
+        return route_result(self.seconds[node], meters)
+
+
+class DistanceFieldLoader(ReloadingFile):
+    """Carga perezosa del campo de distancias (por worker)"""
+
+    def __init__(self):
+        super().__init__('DISTANCE_FIELD_PATH', DistanceField.load, 'Distance field')
+
+    def lookup(self, from_coords, to_coords):
+        """Ruta desde el campo si el origen es el del campo; None para rutear"""
+        field = self.get()
+        if field is None:
+            return None
+
+        config = current_app.config
+        if straight_line_km(field.origin, from_coords) * 1000 > config.get('STORE_MATCH_RADIUS_M', 50):
+            return None
+
+        return field.lookup(to_coords, config.get('GRAPH_SNAP_MAX_M', 300))
+
+    def staleness(self, field, graph=None):
+        """Motivos por los que conviene recalcular el campo (lista vacía = vigente)"""
+        config = current_app.config
+        reasons = []
+
+        built_at = datetime.fromisoformat(field.meta['built_at'])
+        max_age_hours = config.get('DISTANCE_FIELD_MAX_AGE_HOURS', 24 * 7)
+        if (datetime.utcnow() - built_at).total_seconds() > max_age_hours * 3600:
+            reasons.append(f"older than {max_age_hours:g} h")
+
+        if graph is not None and graph.meta.get('built_at') != field.meta.get('graph_built_at'):
+            reasons.append("road graph rebuilt since")
+
+        store_lat, store_lon = config.get('STORE_LAT'), config.get('STORE_LON')
+        if store_lat is not None and store_lon is not None:
+            store = {'lat': store_lat, 'lon': store_lon}
+            if straight_line_km(field.origin, store) * 1000 > config.get('STORE_MATCH_RADIUS_M', 50):
+                reasons.append("store moved (STORE_LAT/STORE_LON)")
+
+        return reasons
+
+    def get_stats(self, graph=None):
+        field = self.get()
+        if field is None:
+            return None
+
+        built_at = field.meta.get('built_at')
+        age = datetime.utcnow() - datetime.fromisoformat(built_at)
+        reasons = self.staleness(field, graph)
+        return {
+            'origin': field.origin,
+            'nodes': field.nodes,
+            'built_at': built_at,
+            'age_hours': round(age.total_seconds() / 3600, 1),
+            'stale': bool(reasons),
+            'stale_reasons': reasons
+        }
+
+
+distance_field = DistanceFieldLoader()
@@ -0,0 +1,291 @@
+import glob
+import gzip
+import json
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytz
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, DeliveryLog
+
+DATASET = 'delivery_logs'
+WATERMARK_FILE = '_watermark.json'
+PART_PATTERN = re.compile(r'part-(\d+)-(\d+)\.')
+
+# Días con archivo abierto a la vez (cada uno con su buffer de compresión);
+# las filas llegan ordenadas por id, casi por fecha, así que normalmente sólo
+# el día actual y el anterior están abiertos
+MAX_OPEN_DAYS = 16
+
+
+def dataset_dir(directory):
+    return os.path.join(directory, DATASET)
+
+
+def read_watermark(directory):
+    """Marca de la última exportación ({'last_id', 'exported_at', ...}) o None"""
+    path = os.path.join(dataset_dir(directory), WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def export_watermark(directory):
+    """Último id exportado (0 si nunca se ha exportado)"""
+    watermark = read_watermark(directory)
+    return watermark['last_id'] if watermark else 0
+
+
+def write_watermark(directory, watermark):
+    path = os.path.join(dataset_dir(directory), WATERMARK_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, path)
+
+
+class NdjsonWriter:
+    """Un archivo .ndjson.gz; se escribe como .tmp y se renombra al cerrar"""
+
+    extension = 'ndjson.gz'
+
+    def __init__(self, tmp_path, columns):
+        self.tmp_path = tmp_path
+        self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+
+    def write(self, records):
+        for record in records:
+            record['timestamp'] = record['timestamp'].isoformat()
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self, path):
+        self.file.close()
+        os.replace(self.tmp_path, path)
+
+
+class ParquetWriter:
+    """Un archivo .parquet (zstd), un row group por lote"""
+
+    extension = 'parquet'
+
+    def __init__(self, tmp_path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {int: pa.int64(), float: pa.float64(), str: pa.string(), datetime: pa.timestamp('us')}
+        self.pa = pa
+        self.schema = pa.schema([(column.name, types[column.type.python_type]) for column in columns])
+        self.tmp_path = tmp_path
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+
+    def write(self, records):
+        self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+
+    def close(self, path):
+        self.writer.close()
+        os.replace(self.tmp_path, path)
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'parquet': ParquetWriter}
+
+
+def check_format(file_format):
+    """Validar el formato; parquet necesita pyarrow (opcional)"""
+    if file_format not in WRITERS:
+        raise ValueError(f"Formato de exportación desconocido: {file_format}")
+    if file_format == 'parquet':
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ValueError("EXPORT_FORMAT=parquet requiere pyarrow (pip install pyarrow)")
+
+
+class DayFiles:
+    """
+    Archivos abiertos por día local: date=AAAA-MM-DD/part-<primer id>-<último id>.<ext>
+
+    El rango de ids en el nombre permite encontrar (y borrar) los archivos
+    que quedan por encima de la marca: los de una exportación interrumpida
+    o los que se reemplazan al re-exportar desde un id anterior.
+    """
+
+    def __init__(self, directory, writer_class, columns, tz):
+        self.directory = dataset_dir(directory)
+        self.writer_class = writer_class
+        self.columns = columns
+        self.tz = tz
+        self.open = OrderedDict()
+        self.files = []
+        self._days = {}
+
+    def local_day(self, moment):
+        key = moment.replace(minute=0, second=0, microsecond=0)
+        day = self._days.get(key)
+        if day is None:
+            day = self._days[key] = pytz.utc.localize(key).astimezone(self.tz).date().isoformat()
+        return day
+
+    def writer(self, day, first_id):
+        entry = self.open.get(day)
+        if entry is not None:
+            self.open.move_to_end(day)
+            return entry
+
+        if len(self.open) >= MAX_OPEN_DAYS:
+            self.close_day(next(iter(self.open)))
+
+        folder = os.path.join(self.directory, f"date={day}")
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = os.path.join(folder, f"part-{first_id:012d}.{self.writer_class.extension}.tmp")
+        entry = self.open[day] = [self.writer_class(tmp_path, self.columns), folder, first_id, first_id]
+        return entry
+
+    def write(self, rows):
+        by_day = OrderedDict()
+        for row in rows:
+            by_day.setdefault(self.local_day(row.timestamp), []).append(row)
+        for day, day_rows in by_day.items():
+            entry = self.writer(day, day_rows[0].id)
+            entry[0].write([dict(row._mapping) for row in day_rows])
+            entry[3] = day_rows[-1].id
+
+    def close_day(self, day):
+        writer, folder, first_id, last_id = self.open.pop(day)
+        path = os.path.join(folder, f"part-{first_id:012d}-{last_id:012d}.{self.writer_class.extension}")
+        writer.close(path)
+        self.files.append(path)
+
+    def close(self):
+        while self.open:
+            self.close_day(next(iter(self.open)))
+
+
+def exported_parts(directory):
+    """Archivos exportados: [(primer id, último id, ruta)]"""
+    parts = []
+    for path in glob.glob(os.path.join(dataset_dir(directory), 'date=*', 'part-*')):
+        match = PART_PATTERN.match(os.path.basename(path))
+        if match and not path.endswith('.tmp'):
+            parts.append((int(match.group(1)), int(match.group(2)), path))
+    return parts
+
+
+def remove_parts_after(directory, last_id):
+    """
+    Borrar los archivos con filas posteriores a `last_id` (y los .tmp)
+
+    Un archivo que empieza antes de `last_id` también se borra entero y
+    esas filas se vuelven a exportar.
+
+    Returns:
+        int: Id desde el que hay que exportar para no perder filas de esos
+             archivos (<= last_id)
+    """
+    for path in glob.glob(os.path.join(dataset_dir(directory), 'date=*', '*.tmp')):
+        os.remove(path)
+
+    # Los rangos de días distintos se intercalan: al bajar el inicio pueden
+    # quedar otros archivos por encima, hasta que no quede ninguno
+    parts = exported_parts(directory)
+    start_id = last_id
+    while True:
+        stale = [part for part in parts if part[1] > start_id]
+        if not stale:
+            return start_id
+        parts = [part for part in parts if part[1] <= start_id]
+        for first_id, _, path in stale:
+            os.remove(path)
+            start_id = min(start_id, first_id - 1)
+
+
+def export_upper_id(lag_seconds):
+    """
+    Último id que se puede exportar: el anterior a la primera fila de los
+    últimos `lag_seconds`
+
+    El writer en segundo plano inserta con algo de atraso y en Postgres los
+    ids se confirman fuera de orden; no pasar de las filas recientes evita
+    que la marca salte filas que todavía no son visibles. Sólo recorre el
+    índice de timestamp de los últimos minutos.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    first_recent = db.session.query(func.min(DeliveryLog.id)).filter(
+        DeliveryLog.timestamp >= cutoff
+    ).scalar()
+    if first_recent is not None:
+        return first_recent - 1
+    return db.session.query(func.max(DeliveryLog.id)).scalar()
+
+
+def export_logs(directory=None, file_format=None, since_id=None, force=False):
+    """
+    Exportar las filas nuevas de DeliveryLog a archivos por día
+
+    Lee `delivery_logs` por lotes de EXPORT_BATCH_SIZE con paginación por id
+    (id > último id, sin OFFSET), así que la memoria no depende del total de
+    filas. Cada ejecución agrega archivos nuevos desde la marca guardada en
+    <directorio>/delivery_logs/_watermark.json, que se actualiza después de
+    cerrar todos los archivos. Antes se borran los archivos con filas
+    posteriores a la marca (de una ejecución interrumpida), así que ninguna
+    fila queda dos veces.
+
+    Args:
+        directory (str): Directorio de salida (default: EXPORT_DIR)
+        file_format (str): 'ndjson' o 'parquet' (default: EXPORT_FORMAT)
+        since_id (int): Exportar desde este id en vez de la marca
+        force (bool): Permitir un since_id anterior a la marca (borra y
+                      reemplaza los archivos desde ese id)
+
+    Returns:
+        dict: {'rows', 'files', 'last_id'}
+    """
+    config = current_app.config
+    directory = directory or config['EXPORT_DIR']
+    file_format = file_format or config.get('EXPORT_FORMAT', 'ndjson')
+    check_format(file_format)
+    batch_size = config.get('EXPORT_BATCH_SIZE', 5000)
+
+    watermark = export_watermark(directory)
+    if since_id is not None and since_id < watermark and not force:
+        raise ValueError(
+            f"--since-id {since_id} es anterior a la última exportación (id {watermark}); "
+            f"usa --force para reemplazar los archivos desde ese id"
+        )
+    os.makedirs(dataset_dir(directory), exist_ok=True)
+    last_id = remove_parts_after(directory, watermark if since_id is None else since_id)
+    upper_id = export_upper_id(config.get('EXPORT_LAG_SECONDS', 300))
+    if upper_id is None or upper_id <= last_id:
+        return {'rows': 0, 'files': [], 'last_id': last_id}
+    columns = list(DeliveryLog.__table__.columns)
+    files = DayFiles(directory, WRITERS[file_format], columns, pytz.timezone(config['TIMEZONE']))
+    exported = 0
+    try:
+        while True:
+            rows = db.session.query(*columns).filter(
+                DeliveryLog.id > last_id,
+                DeliveryLog.id <= upper_id
+            ).order_by(DeliveryLog.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            files.write(rows)
+            exported += len(rows)
+            last_id = rows[-1].id
+            # Sin transacción abierta entre lotes (Postgres no retiene versiones viejas)
+            db.session.rollback()
+    finally:
+        files.close()
+
+    write_watermark(directory, {
+        'last_id': last_id,
+        'exported_at': datetime.utcnow().isoformat(),
+        'rows': exported,
+        'format': file_format
+    })
+    current_app.logger.info(f"Export: {exported} delivery logs up to id {last_id} in {len(files.files)} files")
+    return {'rows': exported, 'files': files.files, 'last_id': last_id}
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from flask import current_app
+
+from models import db, DeliveryLog
+from services.geo import straight_line_km
+
+
+class DetourFactor:
+    """
+    Factor de desvío calle/línea recta para cotizar sin ORS
+
+    Si FALLBACK_DETOUR_FACTOR está configurado se usa tal cual. Si no, se
+    calibra con la mediana de distance_km / straight_line_km de las últimas
+    rutas reales en DeliveryLog (recalculado cada hora, por worker).
+    """
+
+    DEFAULT = 1.4
+    MIN_SAMPLES = 50
+    SAMPLE_SIZE = 2000
+    REFRESH_SECONDS = 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._samples = 0
+        self._computed_at = None
+
+    def get(self):
+        configured = current_app.config.get('FALLBACK_DETOUR_FACTOR')
+        if configured:
+            return configured
+
+        with self._lock:
+            if self._computed_at is None or time.monotonic() - self._computed_at > self.REFRESH_SECONDS:
+                self._value, self._samples = self._calibrate()
+                self._computed_at = time.monotonic()
+            return self._value
+
+    def _calibrate(self):
+        try:
+            rows = db.session.query(DeliveryLog.distance_km, DeliveryLog.straight_line_km).filter(
+                DeliveryLog.route_source.isnot(None),
+                DeliveryLog.route_source != 'fallback',
+                DeliveryLog.distance_km.isnot(None),
+                DeliveryLog.straight_line_km > 0.2
+            ).order_by(DeliveryLog.id.desc()).limit(self.SAMPLE_SIZE).all()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Detour calibration error: {str(e)}")
+            return self.DEFAULT, 0
+
+        ratios = sorted(distance / straight for distance, straight in rows)
+        if len(ratios) < self.MIN_SAMPLES:
+            return self.DEFAULT, len(ratios)
+
+        return round(max(1.0, ratios[len(ratios) // 2]), 3), len(ratios)
+
+    def get_stats(self):
+        configured = current_app.config.get('FALLBACK_DETOUR_FACTOR')
+        return {
+            'detour_factor': configured or self._value,
+            'calibrated_from': 'config' if configured else self._samples
+        }
+
+
+detour_factor = DetourFactor()
+
+
+def fallback_route(quote):
+    """
+    Ruta estimada sin ORS: línea recta x factor de desvío
+
+    Args:
+        quote (dict): Cotización con from_coords y to_coords
+
+    Returns:
+        dict: {'distance_km', 'duration_minutes'} o None si está deshabilitado
+    """
+    if current_app.config.get('FALLBACK_MODE', 'haversine') != 'haversine':
+        return None
+
+    straight_km = quote.get('straight_line_km')
+    if straight_km is None:
+        straight_km = straight_line_km(quote['from_coords'], quote['to_coords'])
+
+    distance_km = straight_km * detour_factor.get()
+    speed_kmh = current_app.config.get('FALLBACK_SPEED_KMH', 25)
+
+    quote['route_source'] = 'fallback'
+    return {
+        'distance_km': round(distance_km, 2),
+        'duration_minutes': round(distance_km / speed_kmh * 60, 1)
+    }
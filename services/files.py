@@ -0,0 +1,127 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from flask import current_app
+
+
+def write_sections(path, magic, meta, sections, arrays):
+    """
+    Guardar arrays en un archivo binario para abrirlo con mmap
+
+    Formato: magic, largo del header (uint32), header JSON y luego cada
+    sección alineada a 8 bytes. El header guarda offset y largo por sección.
+
+    Args:
+        magic (bytes): Identificador del formato
+        meta (dict): Metadatos (se guardan en el header)
+        sections (tuple): ((nombre, typecode), ...)
+        arrays (dict): {nombre: secuencia de valores}
+    """
+    offsets = {}
+    position = 0
+    for name, typecode in sections:
+        count = len(arrays[name])
+        offsets[name] = [position, count]
+        position += (count * array(typecode).itemsize + 7) // 8 * 8
+
+    meta = dict(meta, sections=offsets)
+    meta.setdefault('built_at', datetime.utcnow().isoformat())
+    header = json.dumps(meta).encode('utf-8')
+    data_start = (len(magic) + 4 + len(header) + 7) // 8 * 8
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, typecode in sections:
+            f.seek(data_start + offsets[name][0])
+            values = arrays[name]
+            if not isinstance(values, (array, memoryview)):
+                values = array(typecode, values)
+            f.write(values.tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp_path, path)
+    return meta
+
+
+def read_sections(path, magic, sections):
+    """
+    Abrir un archivo de write_sections con mmap de sólo lectura
+
+    Los arrays son vistas sobre el mmap: los workers que abren el mismo
+    archivo comparten las páginas en memoria.
+
+    Returns:
+        tuple: (meta, {nombre: memoryview}, mmap)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path}: formato desconocido")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        meta = json.loads(f.read(header_len))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    data_start = (len(magic) + 4 + header_len + 7) // 8 * 8
+    view = memoryview(buffer)
+    arrays = {}
+    for name, typecode in sections:
+        offset, count = meta['sections'][name]
+        start = data_start + offset
+        arrays[name] = view[start:start + count * array(typecode).itemsize].cast(typecode)
+
+    return meta, arrays, buffer
+
+
+class ReloadingFile:
+    """
+    Archivo precalculado cargado perezosamente por worker
+
+    La ruta sale de la configuración (`config_key`; vacía = deshabilitado).
+    Cada 30 s se revisa el mtime y, si cambió, se vuelve a cargar.
+    """
+
+    CHECK_SECONDS = 30
+
+    def __init__(self, config_key, load, label):
+        self.config_key = config_key
+        self.load = load
+        self.label = label
+        self._lock = threading.Lock()
+        self._value = None
+        self._mtime = None
+        self._checked_at = None
+
+    def get(self):
+        """Contenido vigente o None si no está configurado / no existe"""
+        path = current_app.config.get(self.config_key)
+        if not path:
+            return None
+
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.CHECK_SECONDS:
+            return self._value
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                self._value, self._mtime = None, None
+                return None
+
+            if mtime != self._mtime:
+                try:
+                    self._value = self.load(path)
+                    self._mtime = mtime
+                    current_app.logger.info(f"{self.label} loaded from {path}")
+                except Exception as e:
+                    current_app.logger.error(f"{self.label} load error: {str(e)}")
+                    self._value, self._mtime = None, None
+
+            return self._value
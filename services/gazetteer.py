@@ -0,0 +1,308 @@
+import re
+import threading
+from bisect import bisect_left
+from difflib import SequenceMatcher, get_close_matches
+
+from flask import current_app
+
+from services.cache import normalize_address
+from services.files import ReloadingFile, read_sections, write_sections
+from services.metrics import metrics
+
+MAGIC = b'GAZETTE1'
+
+SECTIONS = (
+    ('street_comuna', 'i'), ('street_lat', 'f'), ('street_lon', 'f'),
+    ('num_ptr', 'i'), ('num', 'i'), ('num_lat', 'f'), ('num_lon', 'f'),
+)
+
+# Palabras que no sirven para encontrar una calle (sí cuentan al comparar nombres)
+STOPWORDS = {'av', 'pje', 'de', 'del', 'la', 'las', 'los', 'el', 'y'}
+
+# Abreviaturas de nombres de calles (aparte de las de normalize_address)
+STREET_ABBREVIATIONS = {
+    'gral': 'general', 'pdte': 'presidente', 'pte': 'presidente', 'sta': 'santa',
+    'sto': 'santo', 'dr': 'doctor', 'cmdte': 'comandante', 'tte': 'teniente',
+    'cap': 'capitan', 'mons': 'monsenor', 'ing': 'ingeniero', 'prof': 'profesor',
+}
+
+# Un token presente en más calles que esto no se usa para buscar candidatos
+MAX_TOKEN_STREETS = 2000
+
+_NUMBER = re.compile(r'^(\d+)[a-z]?$')
+
+
+def street_key(text):
+    """Nombre de calle normalizado, con las abreviaturas expandidas"""
+    return ' '.join(STREET_ABBREVIATIONS.get(word, word) for word in normalize_address(text).split())
+
+
+def split_address(address):
+    """
+    Separar una dirección libre en calle, número y comunas candidatas
+
+    Returns:
+        tuple: (calle normalizada, número o None, [partes restantes])
+    """
+    parts = normalize_address(address).split(', ')
+    words = parts[0].split()
+
+    # El número es el primer token numérico después de al menos una palabra;
+    # lo que sigue (depto, oficina, etc.) se descarta
+    for i, word in enumerate(words[1:], start=1):
+        match = _NUMBER.match(word)
+        if match:
+            return street_key(' '.join(words[:i])), int(match.group(1)), parts[1:]
+
+    return street_key(parts[0]), None, parts[1:]
+
+
+def core_name(street_key):
+    return ' '.join(word for word in street_key.split() if word not in STOPWORDS) or street_key
+
+
+class Gazetteer:
+    """
+    Calles, números de casa y comunas de la zona de reparto (build_gazetteer.py)
+
+    Cada calle es un par (nombre, comuna) con un punto representativo y sus
+    números conocidos ordenados (num_ptr[i]..num_ptr[i+1]-1), entre los que
+    se interpola. El índice de tokens se arma al cargar (es pequeño); los
+    arrays son vistas sobre un mmap compartido entre workers.
+    """
+
+    def __init__(self, meta, arrays, buffer=None):
+        self.meta = meta
+        self.street_names = meta['street_names']
+        self.street_keys = [street_key(name) for name in self.street_names]
+        self.comuna_names = meta['comuna_names']
+        self.comuna_keys = [normalize_address(name) for name in self.comuna_names]
+        self._buffer = buffer
+
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+        self._cores = [core_name(key) for key in self.street_keys]
+        self._tokens = {}
+        for street, key in enumerate(self.street_keys):
+            for token in set(key.split()) - STOPWORDS:
+                self._tokens.setdefault(token, []).append(street)
+        self._vocabulary = {}
+        for token in self._tokens:
+            self._vocabulary.setdefault(token[0], []).append(token)
+
+    @property
+    def streets(self):
+        return len(self.street_names)
+
+    @property
+    def addresses(self):
+        return len(self.num)
+
+    def save(self, path):
+        self.meta = write_sections(path, MAGIC, self.meta, SECTIONS,
+                                   {name: getattr(self, name) for name, _ in SECTIONS})
+
+    @classmethod
+    def load(cls, path):
+        return cls(*read_sections(path, MAGIC, SECTIONS))
+
+    # ----- Búsqueda -----
+
+    def _candidates(self, street_key):
+        """Calles que comparten tokens (exactos o parecidos) con la consulta"""
+        hits = {}
+        for token in set(street_key.split()) - STOPWORDS:
+            if token.isdigit():
+                matches = [token] if token in self._tokens else []
+            elif token in self._tokens:
+                matches = [token]
+            else:
+                matches = get_close_matches(token, self._vocabulary.get(token[0], ()), n=3, cutoff=0.75)
+
+            for match in matches:
+                streets = self._tokens[match]
+                if len(streets) > MAX_TOKEN_STREETS:
+                    continue
+                for street in streets:
+                    hits[street] = hits.get(street, 0) + 1
+
+        return sorted(hits, key=hits.__getitem__, reverse=True)[:50]
+
+    def _comuna(self, parts):
+        """Índice de la comuna mencionada en la dirección (o None)"""
+        for part in parts:
+            if part in self.comuna_keys:
+                return self.comuna_keys.index(part)
+            close = get_close_matches(part, self.comuna_keys, n=1, cutoff=0.85)
+            if close:
+                return self.comuna_keys.index(close[0])
+        return None
+
+    def _locate(self, street, number):
+        """(lat, lon, factor de confianza) del número en la calle"""
+        start, end = self.num_ptr[street], self.num_ptr[street + 1]
+        if number is None or start == end:
+            factor = 0.8 if number is None else 0.75
+            return self.street_lat[street], self.street_lon[street], factor
+
+        numbers = self.num[start:end]
+        i = bisect_left(numbers, number)
+        if i < len(numbers) and numbers[i] == number:
+            return self.num_lat[start + i], self.num_lon[start + i], 1.0
+        if i == 0 or i == len(numbers):
+            # Fuera del rango conocido: el extremo más cercano
+            j = start + (0 if i == 0 else len(numbers) - 1)
+            return self.num_lat[j], self.num_lon[j], 0.85
+
+        # Entre dos números conocidos: interpolación lineal
+        a, b = start + i - 1, start + i
+        t = (number - numbers[i - 1]) / (numbers[i] - numbers[i - 1])
+        return (self.num_lat[a] + t * (self.num_lat[b] - self.num_lat[a]),
+                self.num_lon[a] + t * (self.num_lon[b] - self.num_lon[a]),
+                0.97 if numbers[i] - numbers[i - 1] <= 200 else 0.9)
+
+    def lookup(self, address):
+        """
+        Geocodificar una dirección con el gazetteer
+
+        Returns:
+            dict: {'lat', 'lon', 'formatted_address', 'confidence'} o None
+        """
+        street_key, number, parts = split_address(address)
+        if not street_key:
+            return None
+
+        candidates = self._candidates(street_key)
+        if not candidates:
+            return None
+
+        query_core = core_name(street_key)
+        comuna = self._comuna(parts)
+        scored = []
+        for street in candidates:
+            ratio = SequenceMatcher(None, query_core, self._cores[street]).ratio()
+            if comuna is None:
+                comuna_factor = 0.9
+            else:
+                comuna_factor = 1.0 if self.street_comuna[street] == comuna else 0.7
+            scored.append((ratio * comuna_factor, ratio, street))
+        scored.sort(reverse=True)
+
+        # Entre las mejores (p. ej. la misma avenida en varias comunas) gana
+        # la que tiene el número dentro de su rango conocido
+        located = []
+        for score, ratio, street in scored[:5]:
+            if score < scored[0][0] - 0.05:
+                break
+            lat, lon, number_factor = self._locate(street, number)
+            located.append((score * number_factor, ratio, number_factor, street, lat, lon))
+        located.sort(reverse=True)
+        confidence, ratio, number_factor, street, lat, lon = located[0]
+
+        # Sin comuna, otra calle igual de buena en otra comuna es ambigua
+        if comuna is None and any(other[1] == ratio and other[2] == number_factor for other in located[1:]):
+            confidence *= 0.85
+
+        comuna_index = self.street_comuna[street]
+        label = self.street_names[street] + (f" {number}" if number is not None else '')
+        if comuna_index >= 0:
+            label += f", {self.comuna_names[comuna_index]}"
+
+        return {
+            'lat': round(float(lat), 6),
+            'lon': round(float(lon), 6),
+            'formatted_address': label,
+            'confidence': round(confidence, 3)
+        }
+
+
+class GazetteerLoader(ReloadingFile):
+    """Carga perezosa del gazetteer (por worker)"""
+
+    def __init__(self):
+        super().__init__('GAZETTEER_PATH', Gazetteer.load, 'Gazetteer')
+        self._stats_lock = threading.Lock()
+        self.stats = {'local': 0, 'fallback': 0}
+
+    def lookup(self, address):
+        """Resultado local si supera GAZETTEER_MIN_CONFIDENCE; None para ir a ORS"""
+        gazetteer = self.get()
+        result = gazetteer.lookup(address) if gazetteer is not None and address else None
+        confident = result is not None and result['confidence'] >= current_app.config.get('GAZETTEER_MIN_CONFIDENCE', 0.8)
+
+        with self._stats_lock:
+            self.stats['local' if confident else 'fallback'] += 1
+        return result if confident else None
+
+    def get_stats(self):
+        gazetteer = self._value
+        if gazetteer is None:
+            return None
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update(
+            streets=gazetteer.streets,
+            addresses=gazetteer.addresses,
+            comunas=len(gazetteer.comuna_names),
+            built_at=gazetteer.meta.get('built_at')
+        )
+        return stats
+
+
+gazetteer = GazetteerLoader()
+metrics.add_collector(lambda: [
+    ('shipping_gazetteer_lookups_total', {'result': result}, count)
+    for result, count in gazetteer.stats.items()
+], stats=[gazetteer.stats])
+
+
+class GazetteerGeocoder:
+    """
+    Geocodificador en proceso (GEOCODER_PROVIDER=gazetteer)
+
+    Responde desde el gazetteer cuando la confianza alcanza
+    GAZETTEER_MIN_CONFIDENCE; el resto (y todo si no hay gazetteer) va al
+    geocodificador de respaldo, ORS, con su cache y single-flight. Los
+    resultados locales no se guardan en geocode_cache: recalcularlos es
+    más barato que leerlos de la base.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def _local(self, address):
+        # Sólo el gazetteer en memoria: la cache en la base la consulta el
+        # geocodificador de respaldo cuando el gazetteer no responde
+        return gazetteer.lookup(address)
+
+    def geocode(self, address):
+        return self._local(address) or self.fallback.geocode(address)
+
+    def geocode_pair(self, from_address, to_address):
+        from_coords = self._local(from_address)
+        to_coords = self._local(to_address)
+
+        if from_coords is None and to_coords is None:
+            return self.fallback.geocode_pair(from_address, to_address)
+        if from_coords is None:
+            from_coords = self.fallback.geocode(from_address)
+        elif to_coords is None:
+            to_coords = self.fallback.geocode(to_address)
+
+        if not from_coords or not to_coords:
+            return None, None
+        return from_coords, to_coords
+
+    def geocode_many(self, addresses):
+        by_key = {}
+        for address in addresses:
+            by_key.setdefault(normalize_address(address), address)
+
+        results = {key: self._local(address) if key else None for key, address in by_key.items()}
+        pending = [address for key, address in by_key.items() if key and results[key] is None]
+        if pending:
+            for address, coords in self.fallback.geocode_many(pending).items():
+                results[normalize_address(address)] = coords
+
+        return {address: results.get(normalize_address(address)) for address in addresses}
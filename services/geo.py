@@ -0,0 +1,47 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia en línea recta (gran círculo) en km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_many(origin, points):
+    """
+    Distancia en línea recta desde un origen a muchos puntos
+
+    Precalcula los términos del origen para que cada punto cueste sólo
+    unas pocas operaciones.
+
+    Args:
+        origin (dict): {'lat': float, 'lon': float}
+        points (list): Lista de {'lat': float, 'lon': float}
+
+    Returns:
+        list: Distancias en km, en el mismo orden
+    """
+    lat1 = math.radians(float(origin['lat']))
+    lon1 = math.radians(float(origin['lon']))
+    cos_lat1 = math.cos(lat1)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+
+    distances = []
+    for point in points:
+        lat2 = radians(float(point['lat']))
+        lon2 = radians(float(point['lon']))
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return distances
+
+
+def straight_line_km(from_coords, to_coords):
+    """haversine_km para dicts {'lat', 'lon'}"""
+    return haversine_km(
+        float(from_coords['lat']), float(from_coords['lon']),
+        float(to_coords['lat']), float(to_coords['lon'])
+    )
@@ -0,0 +1,362 @@
+import heapq
+import math
+
+from flask import current_app
+
+from services.cache import METERS_PER_DEGREE, route_cache
+from services.files import ReloadingFile, read_sections, write_sections
+
+MAGIC = b'ROADGR1\n'
+
+# Secciones del archivo: nombre -> typecode de array/memoryview
+SECTIONS = (
+    ('lat', 'f'), ('lon', 'f'),
+    ('fwd_ptr', 'i'), ('fwd_head', 'i'), ('fwd_len', 'f'), ('fwd_time', 'f'),
+    ('rev_ptr', 'i'), ('rev_tail', 'i'), ('rev_len', 'f'), ('rev_time', 'f'),
+    ('cell_ptr', 'i'),
+)
+
+
+class NodeGrid:
+    """
+    Nodos (lat, lon) numerados por celda de una grilla de `cell_m` metros
+
+    Los nodos de la celda c son cell_ptr[c]..cell_ptr[c+1]-1, así que el
+    nodo más cercano a un punto se busca revisando unas pocas celdas.
+    """
+
+    def __init__(self, meta, arrays, buffer=None):
+        self.meta = meta
+        self.nodes = meta['nodes']
+        self.cell_m = meta['cell_m']
+        self.rows = meta['rows']
+        self.cols = meta['cols']
+        self.lat0 = meta['lat0']
+        self.lon0 = meta['lon0']
+        self.dlat = self.cell_m / METERS_PER_DEGREE
+        self.dlon = self.dlat / math.cos(math.radians(self.lat0 + self.rows * self.dlat / 2))
+        self._buffer = buffer
+
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def nearest_node(self, coords, max_m=300):
+        """
+        Nodo más cercano a unas coordenadas
+
+        Returns:
+            int: Número de nodo, o None si no hay uno a menos de max_m metros
+        """
+        lat = float(coords['lat'])
+        lon = float(coords['lon'])
+        row = int(math.floor((lat - self.lat0) / self.dlat))
+        col = int(math.floor((lon - self.lon0) / self.dlon))
+        kx = math.cos(math.radians(lat))
+
+        best = None
+        best_d2 = (max_m / METERS_PER_DEGREE) ** 2
+        rings = int(math.ceil(max_m / self.cell_m))
+
+        for ring in range(rings + 1):
+            for r in range(row - ring, row + ring + 1):
+                if not 0 <= r < self.rows:
+                    continue
+                for c in range(col - ring, col + ring + 1):
+                    if not 0 <= c < self.cols or max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    cell = r * self.cols + c
+                    for node in range(self.cell_ptr[cell], self.cell_ptr[cell + 1]):
+                        d2 = (self.lat[node] - lat) ** 2 + ((self.lon[node] - lon) * kx) ** 2
+                        if d2 < best_d2:
+                            best, best_d2 = node, d2
+
+            # Un nodo en el anillo k está a menos de k celdas; más allá no hay mejor
+            if best is not None and math.sqrt(best_d2) * METERS_PER_DEGREE <= ring * self.cell_m:
+                break
+
+        return best
+
+
+class RoadGraph(NodeGrid):
+    """
+    Grafo vial compacto (CSR) para rutear dentro del proceso
+
+    Adyacencia hacia adelante (fwd_*) y hacia atrás (rev_*): largo en metros
+    y tiempo en segundos por arco. Se construye con build_road_graph.py.
+
+    Al cargarse desde disco los arrays son vistas sobre un mmap de sólo
+    lectura, así que todos los workers comparten las mismas páginas.
+    """
+
+    def __init__(self, meta, arrays, buffer=None):
+        super().__init__(meta, arrays, buffer)
+        self.edges = meta['edges']
+
+    def save(self, path):
+        self.meta = write_sections(path, MAGIC, self.meta, SECTIONS,
+                                   {name: getattr(self, name) for name, _ in SECTIONS})
+
+    @classmethod
+    def load(cls, path):
+        return cls(*read_sections(path, MAGIC, SECTIONS))
+
+    # ----- Búsquedas -----
+
+    def route(self, source, target):
+        """
+        Ruta más rápida entre dos nodos (Dijkstra bidireccional por tiempo)
+
+        Returns:
+            tuple: (segundos, metros) o None si no hay camino
+        """
+        if source == target:
+            return 0.0, 0.0
+
+        inf = math.inf
+        heappush, heappop = heapq.heappush, heapq.heappop
+        sides = (
+            (self.fwd_ptr, self.fwd_head, self.fwd_time, self.fwd_len, {source: 0.0}, {source: 0.0}, [(0.0, source)], set()),
+            (self.rev_ptr, self.rev_tail, self.rev_time, self.rev_len, {target: 0.0}, {target: 0.0}, [(0.0, target)], set()),
+        )
+        heap_f = sides[0][6]
+        heap_b = sides[1][6]
+        best = inf
+        best_len = None
+
+        while heap_f and heap_b:
+            if heap_f[0][0] + heap_b[0][0] >= best:
+                break
+
+            side = 0 if heap_f[0][0] <= heap_b[0][0] else 1
+            ptr, head, times, lengths, dist, dist_len, heap, settled = sides[side]
+            other_dist, other_len = sides[1 - side][4], sides[1 - side][5]
+
+            d, u = heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            lu = dist_len[u]
+
+            for e in range(ptr[u], ptr[u + 1]):
+                v = head[e]
+                nd = d + times[e]
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    dist_len[v] = lu + lengths[e]
+                    heappush(heap, (nd, v))
+                    if v in other_dist and nd + other_dist[v] < best:
+                        best = nd + other_dist[v]
+                        best_len = dist_len[v] + other_len[v]
+
+        if best == inf:
+            return None
+        return best, best_len
+
+    def routes_from(self, source, targets):
+        """
+        Rutas más rápidas desde un nodo a muchos (Dijkstra de origen único)
+
+        Se detiene al alcanzar todos los destinos.
+
+        Returns:
+            dict: {nodo: (segundos, metros)} para los destinos alcanzables
+        """
+        inf = math.inf
+        heappush, heappop = heapq.heappush, heapq.heappop
+        ptr, head, times, lengths = self.fwd_ptr, self.fwd_head, self.fwd_time, self.fwd_len
+
+        pending = set(targets)
+        dist = {source: 0.0}
+        dist_len = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = set()
+        results = {}
+
+        while heap and pending:
+            d, u = heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u in pending:
+                pending.discard(u)
+                results[u] = (d, dist_len[u])
+
+            lu = dist_len[u]
+            for e in range(ptr[u], ptr[u + 1]):
+                v = head[e]
+                nd = d + times[e]
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    dist_len[v] = lu + lengths[e]
+                    heappush(heap, (nd, v))
+
+        return results
+
+    def shortest_path_tree(self, source):
+        """
+        Tiempo y largo del camino más rápido desde un nodo a todos los demás
+
+        Returns:
+            tuple: (segundos, metros), listas por nodo (NaN = inalcanzable)
+        """
+        nan = math.nan
+        heappush, heappop = heapq.heappush, heapq.heappop
+        ptr, head, times, lengths = self.fwd_ptr, self.fwd_head, self.fwd_time, self.fwd_len
+
+        seconds = [math.inf] * self.nodes
+        meters = [nan] * self.nodes
+        seconds[source] = 0.0
+        meters[source] = 0.0
+        heap = [(0.0, source)]
+
+        while heap:
+            d, u = heappop(heap)
+            if d > seconds[u]:
+                continue
+            lu = meters[u]
+            for e in range(ptr[u], ptr[u + 1]):
+                v = head[e]
+                nd = d + times[e]
+                if nd < seconds[v]:
+                    seconds[v] = nd
+                    meters[v] = lu + lengths[e]
+                    heappush(heap, (nd, v))
+
+        return [value if value != math.inf else nan for value in seconds], meters
+
+
+class RoadGraphLoader(ReloadingFile):
+    """Carga perezosa del grafo (por worker), recargando si cambia el archivo"""
+
+    def __init__(self):
+        super().__init__('GRAPH_PATH', RoadGraph.load, 'Road graph')
+
+    def get_stats(self):
+        graph = self._value
+        if graph is None:
+            return None
+        return {
+            'nodes': graph.nodes,
+            'edges': graph.edges,
+            'source': graph.meta.get('source'),
+            'built_at': graph.meta.get('built_at')
+        }
+
+
+road_graph = RoadGraphLoader()
+
+
+def route_result(seconds, meters):
+    return {
+        'distance_km': round(meters / 1000, 2),
+        'duration_minutes': round(seconds / 60, 1)
+    }
+
+
+class GraphRouter:
+    """
+    Router en proceso sobre el grafo vial (ROUTER_PROVIDER=graph)
+
+    Sólo perfil de auto: el grafo se construye con velocidades de auto.
+    Usa el mismo cache de rutas que los routers HTTP.
+    """
+
+    def __init__(self):
+        self.snap_m = current_app.config.get('GRAPH_SNAP_MAX_M', 300)
+
+    def _graph(self):
+        graph = road_graph.get()
+        if graph is None:
+            current_app.logger.error("Road graph not available (GRAPH_PATH)")
+        return graph
+
+    def calculate_distance(self, from_coords, to_coords, profile='driving-car'):
+        """
+        Calcular distancia y tiempo entre dos coordenadas
+
+        Returns:
+            dict: {'distance_km': float, 'duration_minutes': float}
+        """
+        cached = route_cache.get(from_coords, to_coords, profile)
+        if cached:
+            return cached
+
+        graph = self._graph()
+        if graph is None:
+            return None
+
+        source = graph.nearest_node(from_coords, self.snap_m)
+        target = graph.nearest_node(to_coords, self.snap_m)
+        if source is None or target is None:
+            return None
+
+        found = graph.route(source, target)
+        if found is None:
+            return None
+
+        result = route_result(*found)
+        route_cache.set(from_coords, to_coords, result, profile)
+        return result
+
+    def calculate_matrix(self, from_coords, destinations, profile='driving-car', use_cache=True):
+        """
+        Distancia y tiempo desde un origen a muchos destinos (una sola búsqueda)
+
+        Returns:
+            list: {'distance_km', 'duration_minutes'} o None por destino (mismo orden)
+        """
+        if use_cache:
+            results = [route_cache.get(from_coords, to_coords, profile) for to_coords in destinations]
+        else:
+            results = [None] * len(destinations)
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        graph = self._graph() if missing else None
+        if graph is None:
+            return results
+
+        source = graph.nearest_node(from_coords, self.snap_m)
+        if source is None:
+            return results
+
+        targets = {i: graph.nearest_node(destinations[i], self.snap_m) for i in missing}
+        found = graph.routes_from(source, {node for node in targets.values() if node is not None})
+
+        for i, node in targets.items():
+            if node in found:
+                results[i] = route_result(*found[node])
+                if use_cache:
+                    route_cache.set(from_coords, destinations[i], results[i], profile)
+
+        return results
+
+    def calculate_matrix_to(self, origins, to_coords, profile='driving-car', use_cache=True):
+        """
+        Distancia y tiempo desde muchos orígenes a un destino (una búsqueda por origen)
+
+        Returns:
+            list: {'distance_km', 'duration_minutes'} o None por origen (mismo orden)
+        """
+        if use_cache:
+            results = [route_cache.get(from_coords, to_coords, profile) for from_coords in origins]
+        else:
+            results = [None] * len(origins)
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        graph = self._graph() if missing else None
+        if graph is None:
+            return results
+
+        target = graph.nearest_node(to_coords, self.snap_m)
+        if target is None:
+            return results
+
+        for i in missing:
+            source = graph.nearest_node(origins[i], self.snap_m)
+            found = graph.route(source, target) if source is not None else None
+            if found is not None:
+                results[i] = route_result(*found)
+                if use_cache:
+                    route_cache.set(origins[i], to_coords, results[i], profile)
+
+        return results
@@ -0,0 +1,169 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from models import db, DeliveryLog
+from services.metrics import metrics
+
+
+class DeliveryLogWriter:
+    """
+    Escritura de DeliveryLog en segundo plano
+
+    Las filas se encolan en memoria y un thread las inserta en bloque cada
+    LOG_BATCH_SIZE filas o cada LOG_FLUSH_INTERVAL segundos. Si la cola se
+    llena, LOG_OVERFLOW_POLICY decide si se descartan ('drop') o si el
+    request espera ('block'). Con LOG_WRITER_MODE='sync' se escribe en el
+    mismo request, como antes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._app = None
+        self._stopping = False
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _ensure_started(self):
+        # Tras un fork (gunicorn --preload) el thread no existe en el hijo
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            config = current_app.config
+            self._app = current_app._get_current_object()
+            self._queue = queue.Queue(maxsize=config.get('LOG_QUEUE_SIZE', 10000))
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='delivery-log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def write(self, rows):
+        """
+        Registrar filas de DeliveryLog
+
+        Args:
+            rows (list): dicts con las columnas de DeliveryLog
+        """
+        if not rows:
+            return
+
+        for row in rows:
+            row.setdefault('timestamp', datetime.utcnow())
+
+        if current_app.config.get('LOG_WRITER_MODE', 'async') != 'async':
+            self._insert(rows)
+            return
+
+        self._ensure_started()
+        block = current_app.config.get('LOG_OVERFLOW_POLICY', 'drop') == 'block'
+        timeout = current_app.config.get('LOG_BLOCK_TIMEOUT', 1.0)
+
+        for row in rows:
+            try:
+                self._queue.put(row, block=block, timeout=timeout if block else None)
+                self._count('queued')
+            except queue.Full:
+                self._count('dropped')
+                current_app.logger.warning("DeliveryLog queue full, dropping row")
+
+    def _insert(self, rows):
+        try:
+            with metrics.time('db_commit'):
+                db.session.execute(db.insert(DeliveryLog), rows)
+                db.session.commit()
+            self._count('written', len(rows))
+            self._count('batches')
+        except Exception as e:
+            db.session.rollback()
+            self._count('errors')
+            current_app.logger.error(f"DeliveryLog write error: {str(e)}")
+
+    def _drain(self, max_rows):
+        rows = []
+        while len(rows) < max_rows:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        config = self._app.config
+        batch_size = config.get('LOG_BATCH_SIZE', 200)
+        interval = config.get('LOG_FLUSH_INTERVAL', 1.0)
+
+        while True:
+            # Juntar hasta batch_size filas o hasta que pase el intervalo
+            rows = []
+            deadline = time.monotonic() + interval
+            while len(rows) < batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=min(remaining, 0.1)))
+                except queue.Empty:
+                    pass
+
+            if rows:
+                with self._app.app_context():
+                    self._insert(rows)
+
+            if self._stopping:
+                return
+
+    def flush(self):
+        """Escribir de inmediato todo lo encolado (al apagar el worker)"""
+        if self._pid != os.getpid() or self._queue is None:
+            return
+
+        batch_size = self._app.config.get('LOG_BATCH_SIZE', 200)
+        with self._app.app_context():
+            while True:
+                rows = self._drain(batch_size)
+                if not rows:
+                    break
+                self._insert(rows)
+
+    def shutdown(self):
+        """Detener el thread (escribiendo su bloque en curso) y vaciar la cola"""
+        self._stopping = True
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+        return stats
+
+
+delivery_log_writer = DeliveryLogWriter()
+atexit.register(delivery_log_writer.shutdown)
+
+
+def _delivery_log_metrics():
+    stats = delivery_log_writer.get_stats()
+    return [
+        ('shipping_delivery_log_rows_total', {'result': key}, stats[key])
+        for key in ('queued', 'written', 'dropped')
+    ] + [('shipping_delivery_log_pending', {}, stats['pending'])]
+
+
+metrics.add_collector(_delivery_log_metrics, stats=[delivery_log_writer.stats])
@@ -0,0 +1,320 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Contadores e histogramas acumulados de los workers que ya terminaron
+RETIRED_FILE = 'retired.json'
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nombre -> (tipo, descripción)
+METRICS = {
+    'shipping_stage_seconds': ('histogram', 'Duración de cada etapa de una cotización'),
+    'shipping_request_seconds': ('histogram', 'Duración de los requests HTTP por endpoint'),
+    'shipping_requests_total': ('counter', 'Requests HTTP por endpoint y código'),
+    'shipping_requests_in_flight': ('gauge', 'Requests HTTP en curso por endpoint'),
+    'shipping_quotes_total': ('counter', 'Cotizaciones por origen de la distancia y resultado'),
+    'shipping_ors_requests_total': ('counter', 'Llamadas a ORS/OSRM por operación y código'),
+    'shipping_ors_request_seconds': ('histogram', 'Duración de las llamadas a ORS/OSRM'),
+    'shipping_cache_lookups_total': ('counter', 'Consultas a los caches por resultado'),
+    'shipping_gazetteer_lookups_total': ('counter', 'Direcciones resueltas por el gazetteer (local) o enviadas a ORS (fallback)'),
+    'shipping_singleflight_calls_total': ('counter', 'Llamadas single-flight por resultado'),
+    'shipping_singleflight_in_flight': ('gauge', 'Llamadas single-flight en curso'),
+    'shipping_circuit_state': ('gauge', 'Estado del circuit breaker de ORS (1 = estado actual)'),
+    'shipping_circuit_opened_total': ('counter', 'Veces que se abrió el circuit breaker de ORS'),
+    'shipping_delivery_log_rows_total': ('counter', 'Filas de DeliveryLog por resultado'),
+    'shipping_delivery_log_pending': ('gauge', 'Filas de DeliveryLog en cola'),
+    'shipping_startup_seconds': ('histogram', 'Duración de cada paso del arranque de los workers'),
+}
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """
+    Métricas estilo Prometheus (contadores, gauges e histogramas)
+
+    Registrar es barato (un lock y un diccionario). Con METRICS_DIR cada
+    worker escribe su estado a `metrics-<pid>-<inicio>.json` cada
+    METRICS_FLUSH_SECONDS; /metrics suma los archivos de todos los workers.
+    Los archivos de workers que ya terminaron (o cuyo pid reutilizó un
+    worker más nuevo) se acumulan en `retired.json` y se borran: sus
+    contadores no retroceden al reciclar workers y sus gauges se descartan.
+
+    Los valores que ya se llevan en otros objetos (stats de caches, del
+    writer, etc.) se leen al momento de exportar mediante `collectors`.
+    """
+
+    def __init__(self):
+        self._collectors = []
+        self._collector_stats = []
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._flushed_at = 0.0
+        self._started = time.time()
+        self._file = f"metrics-{os.getpid()}-{int(self._started * 1000)}.json"
+
+    def reset_process(self):
+        """
+        Empezar de cero en un worker recién creado (post_fork de gunicorn)
+
+        Descarta lo heredado del proceso maestro: valores propios y los
+        contadores de los collectors (`stats` de add_collector).
+        """
+        self._reset()
+        for stats in self._collector_stats:
+            for key in stats:
+                stats[key] = 0
+
+    # ----- Registro -----
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name, delta, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def time(self, stage):
+        """Medir una etapa de la cotización (shipping_stage_seconds)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('shipping_stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def add_collector(self, collector, stats=()):
+        """
+        collector() -> [(nombre, {labels}, valor), ...], leído al exportar
+
+        `stats`: diccionarios de contadores del collector, que reset_process
+        pone en cero.
+        """
+        self._collectors.append(collector)
+        self._collector_stats.extend(stats)
+
+    # ----- Exportación -----
+
+    def snapshot(self):
+        counters = {}
+        gauges = {}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                target = gauges if METRICS[name][0] == 'gauge' else counters
+                target[(name, label_key(labels))] = value
+
+        with self._lock:
+            counters.update(self._counters)
+            gauges.update(self._gauges)
+            histograms = {key: [list(h[0]), h[1], h[2]] for key, h in self._histograms.items()}
+
+        return {
+            'pid': os.getpid(),
+            'started': self._started,
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'gauges': [[name, labels, value] for (name, labels), value in gauges.items()],
+            'histograms': [[name, labels] + h for (name, labels), h in histograms.items()]
+        }
+
+    def flush(self, directory):
+        """Escribir el estado de este worker en el directorio compartido"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self._file)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self, directory, interval):
+        if directory and time.monotonic() - self._flushed_at >= interval:
+            self.flush(directory)
+
+    def worker_snapshots(self, directory):
+        """
+        Snapshots de los demás workers vivos y acumulado de los que terminaron
+
+        Un archivo es de un worker terminado si su pid ya no existe o si hay
+        otro más nuevo con el mismo pid (pid reutilizado); esos se suman a
+        retired.json y se borran.
+        """
+        latest = {}
+        loaded = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            if os.path.basename(path) == self._file:
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            loaded.append((path, snapshot))
+            started = snapshot.get('started', 0)
+            latest[snapshot['pid']] = max(latest.get(snapshot['pid'], started), started)
+
+        snapshots = []
+        retired = []
+        for path, snapshot in loaded:
+            pid = snapshot['pid']
+            if pid == os.getpid():
+                alive = False  # archivo de un proceso anterior con nuestro pid
+            else:
+                alive = pid_alive(pid) and snapshot.get('started', 0) == latest[pid]
+            if alive:
+                snapshots.append(snapshot)
+            else:
+                retired.append(path)
+
+        if retired:
+            retire_files(directory, retired)
+        retired_snapshot = read_snapshot(os.path.join(directory, RETIRED_FILE))
+        if retired_snapshot is not None:
+            snapshots.append(retired_snapshot)
+        return snapshots
+
+    def render(self, directory=None):
+        """Texto para /metrics (todos los workers si hay directorio compartido)"""
+        snapshots = [self.snapshot()]
+        if directory:
+            snapshots.extend(self.worker_snapshots(directory))
+
+        counters, gauges, histograms = merge_snapshots(snapshots)
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = counters if kind == 'counter' else gauges if kind == 'gauge' else histograms
+            keys = sorted(key for key in samples if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = key[1]
+                if kind != 'histogram':
+                    lines.append(f"{name}{format_labels(labels)} {format_value(samples[key])}")
+                    continue
+                buckets, total, count = samples[key]
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS + (float('inf'),), buckets):
+                    cumulative += bucket
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def merge_snapshots(snapshots):
+    """Sumar snapshots: (contadores, gauges, histogramas) por (nombre, labels)"""
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snapshot['gauges']:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * (len(BUCKETS) + 1), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, gauges, histograms
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def retire_files(directory, paths):
+    """
+    Sumar los archivos de workers terminados a retired.json y borrarlos
+
+    Con un lock de archivo: si dos workers lo hacen a la vez, el segundo ya
+    no encuentra los archivos y no los suma de nuevo. Los gauges se descartan.
+    """
+    with open(os.path.join(directory, 'retired.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        path = os.path.join(directory, RETIRED_FILE)
+        snapshots = [snapshot for snapshot in map(read_snapshot, [path] + paths) if snapshot is not None]
+        for snapshot in snapshots:
+            snapshot['gauges'] = []
+        counters, _, histograms = merge_snapshots(snapshots)
+
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({
+                'pid': None,
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'gauges': [],
+                'histograms': [[name, labels] + h for (name, labels), h in histograms.items()]
+            }, f)
+        os.replace(f"{path}.tmp", path)
+        for retired in paths:
+            try:
+                os.remove(retired)
+            except FileNotFoundError:
+                pass
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+
+# Un worker recién creado con fork no hereda los valores del proceso padre
+os.register_at_fork(after_in_child=metrics._reset)
@@ -1,13 +1,259 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
 from flask import current_app
 
+from models import db
+from services.cache import geocode_cache, route_cache, normalize_address
+from services.circuit import CircuitOpenError, ors_circuit
+from services.metrics import metrics
+from services.singleflight import singleflight
+
+
+# Respuestas que se reintentan (con backoff exponencial y jitter)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_delay(config, attempt, started):
+    """
+    Espera antes del reintento `attempt` (desde 0), o None si no se reintenta
+
+    No se reintenta tras ORS_MAX_RETRIES ni si desde la primera llamada ya
+    pasó ORS_READ_TIMEOUT: una cotización nunca espera varios timeouts.
+    """
+    if attempt >= config.get('ORS_MAX_RETRIES', 2):
+        return None
+    if time.perf_counter() - started >= config.get('ORS_READ_TIMEOUT', 10):
+        return None
+    return random.uniform(0, config.get('ORS_BACKOFF_FACTOR', 0.3) * (2 ** attempt))
+
+
+# Sesión HTTP compartida por el proceso (keep-alive entre requests)
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Obtener la sesión HTTP del proceso, creándola la primera vez
+    
+    Se crea de forma perezosa para que cada worker de gunicorn tenga su
+    propio pool de conexiones (los sockets no se comparten tras el fork).
+    """
+    global _session
+    
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                config = current_app.config
+                # Sin reintentos de urllib3: los hace _request, registrando
+                # cada intento en el circuit breaker
+                adapter = HTTPAdapter(
+                    pool_connections=2,  # ORS público y, si se usa, ORS local
+                    pool_maxsize=config.get('ORS_POOL_SIZE', 10),
+                    max_retries=0
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    
+    return _session
+
+
+# Pool de threads del proceso para geocodificar en paralelo
+_executor = None
+
+
+def get_executor():
+    """Obtener el pool de threads del proceso, creándolo la primera vez"""
+    global _executor
+    
+    if _executor is None:
+        with _session_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('ORS_GEOCODE_WORKERS', 8),
+                    thread_name_prefix='ors-geocode'
+                )
+    
+    return _executor
+
+
+class ORSStats:
+    """Latencia y códigos de estado por operación (por worker)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+    
+    def record(self, operation, elapsed_ms, status=None):
+        metrics.inc('shipping_ors_requests_total', operation=operation,
+                    status=status if status is not None else 'error')
+        metrics.observe('shipping_ors_request_seconds', elapsed_ms / 1000, operation=operation)
+        
+        with self._lock:
+            op = self._ops.setdefault(operation, {
+                'calls': 0,
+                'errors': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'last_ms': 0.0,
+                'status_codes': {}
+            })
+            op['calls'] += 1
+            op['total_ms'] += elapsed_ms
+            op['max_ms'] = max(op['max_ms'], elapsed_ms)
+            op['last_ms'] = elapsed_ms
+            
+            code = str(status) if status is not None else 'error'
+            op['status_codes'][code] = op['status_codes'].get(code, 0) + 1
+            if status is None or status >= 400:
+                op['errors'] += 1
+    
+    def get_stats(self):
+        with self._lock:
+            result = {}
+            for name, op in self._ops.items():
+                result[name] = {
+                    'calls': op['calls'],
+                    'errors': op['errors'],
+                    'avg_ms': round(op['total_ms'] / op['calls'], 1) if op['calls'] else None,
+                    'max_ms': round(op['max_ms'], 1),
+                    'last_ms': round(op['last_ms'], 1),
+                    'status_codes': dict(op['status_codes'])
+                }
+            return result
+
+
+ors_stats = ORSStats()
+
+
+def parse_geocode_response(data, address):
+    """Convertir respuesta de /geocode/search a {'lat', 'lon', 'formatted_address'}"""
+    if data.get('features'):
+        feature = data['features'][0]
+        coords = feature['geometry']['coordinates']
+        
+        return {
+            'lon': coords[0],
+            'lat': coords[1],
+            'formatted_address': feature['properties'].get('label', address)
+        }
+    
+    return None
+
+
+def parse_route_response(data):
+    """Convertir respuesta de /directions a {'distance_km', 'duration_minutes'}"""
+    if data.get('routes'):
+        route = data['routes'][0]
+        summary = route['summary']
+        
+        # Distancia en metros, convertir a km
+        distance_km = summary['distance'] / 1000
+        
+        # Duración en segundos, convertir a minutos
+        duration_minutes = summary['duration'] / 60
+        
+        return {
+            'distance_km': round(distance_km, 2),
+            'duration_minutes': round(duration_minutes, 1)
+        }
+    
+    return None
+
+
+def parse_matrix_response(data, count):
+    """Convertir respuesta de /matrix (una fila) a lista de {'distance_km', 'duration_minutes'}"""
+    distances = (data.get('distances') or [[]])[0]
+    durations = (data.get('durations') or [[]])[0]
+    
+    results = []
+    for i in range(count):
+        distance = distances[i] if i < len(distances) else None
+        duration = durations[i] if i < len(durations) else None
+        
+        # ORS retorna null cuando no hay ruta
+        if distance is None or duration is None:
+            results.append(None)
+        else:
+            results.append({
+                'distance_km': round(distance / 1000, 2),
+                'duration_minutes': round(duration / 60, 1)
+            })
+    
+    return results
+
+
+def parse_matrix_sources(data, count):
+    """Convertir respuesta de /matrix con muchos orígenes y un destino (una columna)"""
+    column = {
+        key: [[row[0] if row else None for row in (data.get(key) or [])]]
+        for key in ('distances', 'durations')
+    }
+    return parse_matrix_response(column, count)
+
 
 class OpenRouteService:
     """Cliente para OpenRouteService API"""
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None, circuit=None):
         self.api_key = api_key or current_app.config.get('ORS_API_KEY')
-        self.base_url = current_app.config.get('ORS_BASE_URL', 'https://api.openrouteservice.org/v2')
+        self.base_url = base_url or current_app.config.get('ORS_BASE_URL', 'https://api.openrouteservice.org/v2')
+        self.circuit = circuit or ors_circuit
+        self.session = get_session()
+        self.timeout = (
+            current_app.config.get('ORS_CONNECT_TIMEOUT', 3),
+            current_app.config.get('ORS_READ_TIMEOUT', 10)
+        )
+    
+    def _request(self, operation, method, url, **kwargs):
+        """
+        Ejecutar request HTTP con la sesión compartida y registrar latencia
+        
+        Reintenta 429/5xx y errores de conexión con backoff y jitter; un
+        timeout de lectura no se reintenta (ORS puede seguir calculando y el
+        worker quedaría bloqueado varias veces el timeout). Cada intento
+        cuenta para el circuit breaker.
+        """
+        config = current_app.config
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            # Circuito abierto: fallar de inmediato en vez de esperar el timeout
+            if not self.circuit.allow():
+                raise CircuitOpenError(f"ORS circuit {self.circuit.name} open, {operation} skipped")
+            
+            start = time.perf_counter()
+            status = None
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                status = response.status_code
+            except requests.exceptions.ConnectionError:
+                # ConnectTimeout incluido; ReadTimeout no es ConnectionError
+                delay = retry_delay(config, attempt, started)
+                if delay is None:
+                    raise
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                ors_stats.record(operation, elapsed_ms, status)
+                self.circuit.record(elapsed_ms, status)
+                current_app.logger.debug(f"ORS {operation}: {status} in {elapsed_ms:.0f} ms")
+            
+            if status is not None:
+                if status not in RETRY_STATUSES:
+                    return response
+                delay = retry_delay(config, attempt, started)
+                if delay is None:
+                    return response
+            
+            time.sleep(delay)
+            attempt += 1
     
     def geocode(self, address):
         """
@@ -19,6 +265,29 @@ class OpenRouteService:
         Returns:
             dict: {'lat': float, 'lon': float, 'formatted_address': str}
         """
+        cached = geocode_cache.get(address)
+        if cached:
+            return cached
+        
+        return self._geocode_and_cache(address)
+    
+    def _geocode_and_cache(self, address):
+        """Geocodificar contra ORS y guardar el resultado en cache (una vez por dirección en curso)"""
+        return singleflight.do(
+            f"geocode:{normalize_address(address)}",
+            lambda: self._fetch_geocode(address),
+            recheck=lambda: geocode_cache.get(address, record_stats=False)
+        )
+    
+    def _fetch_geocode(self, address):
+        result = self._geocode_remote(address)
+        if result:
+            geocode_cache.set(address, result)
+        
+        return result
+    
+    def _geocode_remote(self, address):
+        """Geocodificar contra la API de OpenRouteService (sin cache)"""
         url = f"{self.base_url}/geocode/search"
         
         headers = {
@@ -33,22 +302,10 @@ class OpenRouteService:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = self._request('geocode', 'GET', url, headers=headers, params=params)
             response.raise_for_status()
             
-            data = response.json()
-            
-            if data.get('features'):
-                feature = data['features'][0]
-                coords = feature['geometry']['coordinates']
-                
-                return {
-                    'lon': coords[0],
-                    'lat': coords[1],
-                    'formatted_address': feature['properties'].get('label', address)
-                }
-            
-            return None
+            return parse_geocode_response(response.json(), address)
             
         except Exception as e:
             current_app.logger.error(f"Geocoding error: {str(e)}")
@@ -66,6 +323,26 @@ class OpenRouteService:
         Returns:
             dict: {'distance_km': float, 'duration_minutes': float}
         """
+        cached = route_cache.get(from_coords, to_coords, profile)
+        if cached:
+            return cached
+        
+        # Rutas idénticas en curso comparten una sola llamada a ORS
+        return singleflight.do(
+            f"route:{route_cache.make_key(from_coords, to_coords, profile)}",
+            lambda: self._fetch_route(from_coords, to_coords, profile),
+            recheck=lambda: route_cache.get(from_coords, to_coords, profile, record_stats=False)
+        )
+    
+    def _fetch_route(self, from_coords, to_coords, profile):
+        result = self._route_remote(from_coords, to_coords, profile)
+        if result:
+            route_cache.set(from_coords, to_coords, result, profile)
+        
+        return result
+    
+    def _route_remote(self, from_coords, to_coords, profile='driving-car'):
+        """Calcular ruta contra la API de OpenRouteService (sin cache)"""
         url = f"{self.base_url}/directions/{profile}"
         
         headers = {
@@ -82,32 +359,73 @@ class OpenRouteService:
         }
         
         try:
-            response = requests.post(url, json=body, headers=headers, timeout=10)
+            response = self._request('directions', 'POST', url, json=body, headers=headers)
             response.raise_for_status()
             
-            data = response.json()
-            
-            if data.get('routes'):
-                route = data['routes'][0]
-                summary = route['summary']
-                
-                # Distancia en metros, convertir a km
-                distance_km = summary['distance'] / 1000
-                
-                # Duración en segundos, convertir a minutos
-                duration_minutes = summary['duration'] / 60
-                
-                return {
-                    'distance_km': round(distance_km, 2),
-                    'duration_minutes': round(duration_minutes, 1)
-                }
-            
-            return None
+            return parse_route_response(response.json())
             
         except Exception as e:
             current_app.logger.error(f"Distance calculation error: {str(e)}")
             return None
     
+    def geocode_pair(self, from_address, to_address):
+        """
+        Geocodificar dos direcciones en paralelo
+        
+        Las direcciones que ya están en cache se resuelven en el thread
+        actual; sólo las restantes van al pool. Si una falla, la otra se
+        cancela (o se abandona si ya está en curso) sin esperar su respuesta.
+        
+        Returns:
+            tuple: (from_coords, to_coords), ambos None si alguna falla
+        """
+        results = {
+            'from': geocode_cache.get(from_address),
+            'to': geocode_cache.get(to_address)
+        }
+        
+        # Misma dirección normalizada: geocodificar una sola vez
+        if normalize_address(from_address) == normalize_address(to_address):
+            coords = results['from'] or self._geocode_and_cache(from_address)
+            return (coords, dict(coords)) if coords else (None, None)
+        
+        pending = {key: address for key, address in (('from', from_address), ('to', to_address))
+                   if not results[key]}
+        
+        if len(pending) == 1:
+            key, address = pending.popitem()
+            results[key] = self._geocode_and_cache(address)
+        elif pending:
+            app = current_app._get_current_object()
+            
+            def run(address):
+                with app.app_context():
+                    return self._geocode_and_cache(address)
+            
+            # Liberar la conexión de este request mientras esperamos a los
+            # threads del pool, que también necesitan una
+            db.session.close()
+            
+            executor = get_executor()
+            futures = {executor.submit(run, address): key for key, address in pending.items()}
+            
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    current_app.logger.error(f"Geocoding error: {str(e)}")
+                    results[futures[future]] = None
+                
+                if not results[futures[future]]:
+                    for other in futures:
+                        other.cancel()
+                    return None, None
+        
+        if not results['from'] or not results['to']:
+            return None, None
+        
+        return results['from'], results['to']
+    
     def calculate_from_addresses(self, from_address, to_address, profile='driving-car'):
         """
         Calcular distancia desde direcciones (geocodifica primero)
@@ -125,14 +443,9 @@ class OpenRouteService:
                 'to_coords': dict
             }
         """
-        # Geocodificar origen
-        from_coords = self.geocode(from_address)
-        if not from_coords:
-            return None
-        
-        # Geocodificar destino
-        to_coords = self.geocode(to_address)
-        if not to_coords:
+        # Geocodificar origen y destino en paralelo
+        from_coords, to_coords = self.geocode_pair(from_address, to_address)
+        if not from_coords or not to_coords:
             return None
         
         # Calcular distancia
@@ -143,3 +456,169 @@ class OpenRouteService:
             result['to_coords'] = to_coords
         
         return result
+    
+    def geocode_many(self, addresses):
+        """
+        Geocodificar muchas direcciones, deduplicando por dirección normalizada
+        
+        Args:
+            addresses (list): Direcciones libres (pueden repetirse)
+            
+        Returns:
+            dict: {dirección: coords o None} para cada dirección de entrada
+        """
+        by_key = {}
+        for address in addresses:
+            by_key.setdefault(normalize_address(address), address)
+        
+        results = {}
+        pending = {}
+        for key, address in by_key.items():
+            cached = geocode_cache.get(address) if key else None
+            if cached or not key:
+                results[key] = cached
+            else:
+                pending[key] = address
+        
+        if pending:
+            app = current_app._get_current_object()
+            
+            def run(address):
+                with app.app_context():
+                    return self._geocode_and_cache(address)
+            
+            # Liberar la conexión de este request mientras esperamos a los
+            # threads del pool, que también necesitan una
+            db.session.close()
+            
+            executor = get_executor()
+            futures = {executor.submit(run, address): key for key, address in pending.items()}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    current_app.logger.error(f"Geocoding error: {str(e)}")
+                    results[futures[future]] = None
+        
+        return {address: results.get(normalize_address(address)) for address in addresses}
+    
+    def calculate_matrix(self, from_coords, destinations, profile='driving-car', use_cache=True):
+        """
+        Calcular distancia y tiempo desde un origen a muchos destinos
+        
+        Usa el cache de rutas y, para el resto, la API /matrix de ORS en
+        bloques de ORS_MATRIX_CHUNK destinos por llamada.
+        
+        Args:
+            from_coords (dict): {'lat': float, 'lon': float}
+            destinations (list): Lista de {'lat': float, 'lon': float}
+            profile (str): Perfil de ruta
+            use_cache (bool): Consultar y poblar el cache de rutas
+            
+        Returns:
+            list: {'distance_km', 'duration_minutes'} o None por destino (mismo orden)
+        """
+        if use_cache:
+            results = [route_cache.get(from_coords, to_coords, profile) for to_coords in destinations]
+        else:
+            results = [None] * len(destinations)
+        missing = [i for i, result in enumerate(results) if result is None]
+        chunk_size = current_app.config.get('ORS_MATRIX_CHUNK', 49)
+        
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            routes = self._matrix_remote(from_coords, [destinations[i] for i in chunk], profile)
+            
+            for i, route in zip(chunk, routes):
+                results[i] = route
+                if route and use_cache:
+                    route_cache.set(from_coords, destinations[i], route, profile)
+        
+        return results
+    
+    def calculate_matrix_to(self, origins, to_coords, profile='driving-car', use_cache=True):
+        """
+        Calcular distancia y tiempo desde muchos orígenes a un destino
+        
+        Igual que calculate_matrix, pero con los orígenes como `sources` de
+        /matrix (p. ej. varias tiendas candidatas para una misma dirección).
+        
+        Returns:
+            list: {'distance_km', 'duration_minutes'} o None por origen (mismo orden)
+        """
+        if use_cache:
+            results = [route_cache.get(from_coords, to_coords, profile) for from_coords in origins]
+        else:
+            results = [None] * len(origins)
+        missing = [i for i, result in enumerate(results) if result is None]
+        chunk_size = current_app.config.get('ORS_MATRIX_CHUNK', 49)
+        
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            routes = self._matrix_to_remote([origins[i] for i in chunk], to_coords, profile)
+            
+            for i, route in zip(chunk, routes):
+                results[i] = route
+                if route and use_cache:
+                    route_cache.set(origins[i], to_coords, route, profile)
+        
+        return results
+    
+    def _matrix_to_remote(self, origins, to_coords, profile='driving-car'):
+        """Una llamada a /matrix (destino único). Retorna lista alineada con origins"""
+        url = f"{self.base_url}/matrix/{profile}"
+        
+        headers = {
+            'Authorization': self.api_key,
+            'Content-Type': 'application/json'
+        }
+        
+        body = {
+            'locations': [[coords['lon'], coords['lat']] for coords in origins] + [
+                [to_coords['lon'], to_coords['lat']]
+            ],
+            'sources': list(range(len(origins))),
+            'destinations': [len(origins)],
+            'metrics': ['distance', 'duration'],
+            'units': 'm'
+        }
+        
+        try:
+            response = self._request('matrix', 'POST', url, json=body, headers=headers)
+            response.raise_for_status()
+            
+            return parse_matrix_sources(response.json(), len(origins))
+            
+        except Exception as e:
+            current_app.logger.error(f"Matrix calculation error: {str(e)}")
+            return [None] * len(origins)
+    
+    def _matrix_remote(self, from_coords, destinations, profile='driving-car'):
+        """Una llamada a /matrix (origen único). Retorna lista alineada con destinations"""
+        url = f"{self.base_url}/matrix/{profile}"
+        
+        headers = {
+            'Authorization': self.api_key,
+            'Content-Type': 'application/json'
+        }
+        
+        # OpenRouteService espera [lon, lat] no [lat, lon]
+        body = {
+            'locations': [[from_coords['lon'], from_coords['lat']]] + [
+                [coords['lon'], coords['lat']] for coords in destinations
+            ],
+            'sources': [0],
+            'destinations': list(range(1, len(destinations) + 1)),
+            'metrics': ['distance', 'duration'],
+            'units': 'm'
+        }
+        
+        try:
+            response = self._request('matrix', 'POST', url, json=body, headers=headers)
+            response.raise_for_status()
+            
+            return parse_matrix_response(response.json(), len(destinations))
+            
+        except Exception as e:
+            current_app.logger.error(f"Matrix calculation error: {str(e)}")
+            return [None] * len(destinations)
@@ -0,0 +1,213 @@
+import asyncio
+import time
+
+import httpx
+
+from services.cache import geocode_cache, route_cache, normalize_address
+from services.circuit import CircuitOpenError, ors_circuit
+from services.openroute import RETRY_STATUSES, ors_stats, parse_geocode_response, parse_route_response, retry_delay
+from services.singleflight import AsyncSingleFlight, singleflight
+
+
+def call_in_context(app, fn, *args, **kwargs):
+    """Ejecutar una función síncrona dentro de un app context de Flask"""
+    with app.app_context():
+        return fn(*args, **kwargs)
+
+
+class AsyncOpenRouteService:
+    """
+    Cliente asíncrono para OpenRouteService API (modo ASGI)
+
+    Comparte los caches y las métricas con el cliente síncrono. Las
+    operaciones que tocan la base de datos (caches) se ejecutan en threads
+    para no bloquear el event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.api_key = config.get('ORS_API_KEY')
+        self.base_url = config.get('ORS_BASE_URL', 'https://api.openrouteservice.org/v2')
+        self.flights = AsyncSingleFlight(singleflight)
+
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                config.get('ORS_READ_TIMEOUT', 10),
+                connect=config.get('ORS_CONNECT_TIMEOUT', 3)
+            ),
+            limits=httpx.Limits(
+                max_connections=config.get('ORS_ASYNC_MAX_CONNECTIONS', 100),
+                max_keepalive_connections=config.get('ORS_POOL_SIZE', 10)
+            ),
+            headers={
+                'Authorization': self.api_key or '',
+                'Content-Type': 'application/json'
+            }
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """Ejecutar código síncrono (DB, caches) en un thread con app context"""
+        return await asyncio.to_thread(call_in_context, self.app, fn, *args, **kwargs)
+
+    async def _request(self, operation, method, url, **kwargs):
+        """Request HTTP con reintentos (429/5xx y conexión, no timeouts de lectura) y backoff con jitter"""
+        config = self.app.config
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            # Circuito abierto: fallar de inmediato en vez de esperar el timeout
+            with self.app.app_context():
+                if not ors_circuit.allow():
+                    raise CircuitOpenError(f"ORS circuit open, {operation} skipped")
+
+            start = time.perf_counter()
+            status = None
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                status = response.status_code
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                delay = retry_delay(config, attempt, started)
+                if delay is None:
+                    raise
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                ors_stats.record(operation, elapsed_ms, status)
+                with self.app.app_context():
+                    ors_circuit.record(elapsed_ms, status)
+
+            if status is not None:
+                if status not in RETRY_STATUSES:
+                    return response
+                delay = retry_delay(config, attempt, started)
+                if delay is None:
+                    return response
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def geocode(self, address):
+        """
+        Geocodificar dirección a coordenadas
+
+        Returns:
+            dict: {'lat': float, 'lon': float, 'formatted_address': str}
+        """
+        cached = await self.run_sync(geocode_cache.get, address)
+        if cached:
+            return cached
+
+        # Direcciones idénticas en curso comparten una sola llamada a ORS
+        return await self.flights.do(
+            f"geocode:{normalize_address(address)}",
+            lambda: self._geocode_and_cache(address)
+        )
+
+    async def _geocode_and_cache(self, address):
+        params = {
+            'text': address,
+            'boundary.country': 'CL',  # Limitar a Chile
+            'size': 1  # Solo el mejor resultado
+        }
+
+        try:
+            response = await self._request('geocode', 'GET', f"{self.base_url}/geocode/search", params=params)
+            response.raise_for_status()
+            result = parse_geocode_response(response.json(), address)
+        except Exception as e:
+            self.app.logger.error(f"Geocoding error: {str(e)}")
+            return None
+
+        if result:
+            await self.run_sync(geocode_cache.set, address, result)
+
+        return result
+
+    async def calculate_distance(self, from_coords, to_coords, profile='driving-car'):
+        """
+        Calcular distancia y tiempo entre dos coordenadas
+
+        Returns:
+            dict: {'distance_km': float, 'duration_minutes': float}
+        """
+        cached = await self.run_sync(route_cache.get, from_coords, to_coords, profile)
+        if cached:
+            return cached
+
+        key = await self.run_sync(route_cache.make_key, from_coords, to_coords, profile)
+        return await self.flights.do(
+            f"route:{key}",
+            lambda: self._route_and_cache(from_coords, to_coords, profile)
+        )
+
+    async def _route_and_cache(self, from_coords, to_coords, profile):
+        # OpenRouteService espera [lon, lat] no [lat, lon]
+        body = {
+            'coordinates': [
+                [from_coords['lon'], from_coords['lat']],
+                [to_coords['lon'], to_coords['lat']]
+            ]
+        }
+
+        try:
+            response = await self._request('directions', 'POST', f"{self.base_url}/directions/{profile}", json=body)
+            response.raise_for_status()
+            result = parse_route_response(response.json())
+        except Exception as e:
+            self.app.logger.error(f"Distance calculation error: {str(e)}")
+            return None
+
+        if result:
+            await self.run_sync(route_cache.set, from_coords, to_coords, result, profile)
+
+        return result
+
+    async def geocode_pair(self, from_address, to_address):
+        """
+        Geocodificar dos direcciones en paralelo; si una falla se cancela la otra
+
+        Returns:
+            tuple: (from_coords, to_coords), ambos None si alguna falla
+        """
+        if normalize_address(from_address) == normalize_address(to_address):
+            coords = await self.geocode(from_address)
+            return (coords, dict(coords)) if coords else (None, None)
+
+        tasks = [
+            asyncio.create_task(self.geocode(from_address)),
+            asyncio.create_task(self.geocode(to_address))
+        ]
+        for next_done in asyncio.as_completed(tasks):
+            if not await next_done:
+                for task in tasks:
+                    task.cancel()
+                return None, None
+
+        return tasks[0].result(), tasks[1].result()
+
+    async def calculate_from_addresses(self, from_address, to_address, profile='driving-car'):
+        """
+        Calcular distancia desde direcciones (geocodifica ambas en paralelo)
+
+        Returns:
+            dict: {
+                'distance_km': float,
+                'duration_minutes': float,
+                'from_coords': dict,
+                'to_coords': dict
+            }
+        """
+        from_coords, to_coords = await self.geocode_pair(from_address, to_address)
+        if not from_coords or not to_coords:
+            return None
+
+        result = await self.calculate_distance(from_coords, to_coords, profile)
+
+        if result:
+            result['from_coords'] = from_coords
+            result['to_coords'] = to_coords
+
+        return result
@@ -0,0 +1,216 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+from services.cache import route_cache
+from services.circuit import CircuitOpenError, osrm_circuit
+from services.openroute import ors_stats
+from services.singleflight import singleflight
+
+# Perfiles de ORS -> perfiles de OSRM (osrm-routed sirve el perfil con que se
+# construyó el grafo; el nombre en la URL es informativo)
+OSRM_PROFILES = {
+    'driving-car': 'driving',
+    'driving-hgv': 'driving',
+    'cycling-regular': 'cycling',
+    'foot-walking': 'foot'
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_osrm_session():
+    """Sesión HTTP del proceso para el OSRM local (sin reintentos: está en el mismo host)"""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=current_app.config.get('ORS_POOL_SIZE', 10))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+
+    return _session
+
+
+def coords_path(points):
+    """Lista de {'lat', 'lon'} -> 'lon,lat;lon,lat;...' (formato de OSRM)"""
+    return ';'.join(f"{float(p['lon']):.6f},{float(p['lat']):.6f}" for p in points)
+
+
+class OSRMRouter:
+    """
+    Router contra un OSRM local (osrm-routed en el mismo host o red)
+
+    Sólo rutea: la geocodificación la sigue haciendo el geocodificador
+    configurado. Usa el mismo cache de rutas que el cliente ORS.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or current_app.config.get('OSRM_BASE_URL', 'http://localhost:5000')).rstrip('/')
+        self.session = get_osrm_session()
+        self.timeout = current_app.config.get('OSRM_TIMEOUT', 2)
+
+    def _get(self, operation, url, params):
+        # Circuito abierto: fallar de inmediato (y cotizar en modo degradado)
+        if not osrm_circuit.allow():
+            raise CircuitOpenError(f"OSRM circuit open, {operation} skipped")
+
+        start = time.perf_counter()
+        status = None
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            status = response.status_code
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            ors_stats.record(operation, elapsed_ms, status)
+            osrm_circuit.record(elapsed_ms, status)
+
+    def calculate_distance(self, from_coords, to_coords, profile='driving-car'):
+        """
+        Calcular distancia y tiempo entre dos coordenadas
+
+        Returns:
+            dict: {'distance_km': float, 'duration_minutes': float}
+        """
+        cached = route_cache.get(from_coords, to_coords, profile)
+        if cached:
+            return cached
+
+        return singleflight.do(
+            f"route:{route_cache.make_key(from_coords, to_coords, profile)}",
+            lambda: self._fetch_route(from_coords, to_coords, profile),
+            recheck=lambda: route_cache.get(from_coords, to_coords, profile, record_stats=False)
+        )
+
+    def _fetch_route(self, from_coords, to_coords, profile):
+        url = f"{self.base_url}/route/v1/{OSRM_PROFILES.get(profile, 'driving')}/{coords_path([from_coords, to_coords])}"
+
+        try:
+            response = self._get('osrm_route', url, {'overview': 'false'})
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            current_app.logger.error(f"OSRM route error: {str(e)}")
+            return None
+
+        if data.get('code') != 'Ok' or not data.get('routes'):
+            return None
+
+        route = data['routes'][0]
+        result = {
+            'distance_km': round(route['distance'] / 1000, 2),
+            'duration_minutes': round(route['duration'] / 60, 1)
+        }
+        route_cache.set(from_coords, to_coords, result, profile)
+        return result
+
+    def calculate_matrix(self, from_coords, destinations, profile='driving-car', use_cache=True):
+        """
+        Distancia y tiempo desde un origen a muchos destinos (/table de OSRM)
+
+        Returns:
+            list: {'distance_km', 'duration_minutes'} o None por destino (mismo orden)
+        """
+        if use_cache:
+            results = [route_cache.get(from_coords, to_coords, profile) for to_coords in destinations]
+        else:
+            results = [None] * len(destinations)
+        missing = [i for i, result in enumerate(results) if result is None]
+        chunk_size = current_app.config.get('OSRM_TABLE_CHUNK', 500)
+
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            routes = self._table(from_coords, [destinations[i] for i in chunk], profile)
+
+            for i, route in zip(chunk, routes):
+                results[i] = route
+                if route and use_cache:
+                    route_cache.set(from_coords, destinations[i], route, profile)
+
+        return results
+
+    def calculate_matrix_to(self, origins, to_coords, profile='driving-car', use_cache=True):
+        """
+        Distancia y tiempo desde muchos orígenes a un destino (/table de OSRM)
+
+        Returns:
+            list: {'distance_km', 'duration_minutes'} o None por origen (mismo orden)
+        """
+        if use_cache:
+            results = [route_cache.get(from_coords, to_coords, profile) for from_coords in origins]
+        else:
+            results = [None] * len(origins)
+        missing = [i for i, result in enumerate(results) if result is None]
+        chunk_size = current_app.config.get('OSRM_TABLE_CHUNK', 500)
+
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            routes = self._table_to([origins[i] for i in chunk], to_coords, profile)
+
+            for i, route in zip(chunk, routes):
+                results[i] = route
+                if route and use_cache:
+                    route_cache.set(origins[i], to_coords, route, profile)
+
+        return results
+
+    def _table(self, from_coords, destinations, profile):
+        url = f"{self.base_url}/table/v1/{OSRM_PROFILES.get(profile, 'driving')}/{coords_path([from_coords] + destinations)}"
+        params = {'sources': '0', 'annotations': 'distance,duration'}
+
+        data = self._table_request(url, params)
+        if data is None:
+            return [None] * len(destinations)
+
+        distances = (data.get('distances') or [[]])[0][1:]
+        durations = (data.get('durations') or [[]])[0][1:]
+        return table_routes(distances, durations, len(destinations))
+
+    def _table_to(self, origins, to_coords, profile):
+        url = f"{self.base_url}/table/v1/{OSRM_PROFILES.get(profile, 'driving')}/{coords_path(origins + [to_coords])}"
+        params = {
+            'sources': ';'.join(str(i) for i in range(len(origins))),
+            'destinations': str(len(origins)),
+            'annotations': 'distance,duration'
+        }
+
+        data = self._table_request(url, params)
+        if data is None:
+            return [None] * len(origins)
+
+        distances = [row[0] if row else None for row in data.get('distances') or []]
+        durations = [row[0] if row else None for row in data.get('durations') or []]
+        return table_routes(distances, durations, len(origins))
+
+    def _table_request(self, url, params):
+        try:
+            response = self._get('osrm_table', url, params)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            current_app.logger.error(f"OSRM table error: {str(e)}")
+            return None
+
+
+def table_routes(distances, durations, count):
+    """Fila o columna de /table -> lista de {'distance_km', 'duration_minutes'} o None"""
+    results = []
+    for i in range(count):
+        distance = distances[i] if i < len(distances) else None
+        duration = durations[i] if i < len(durations) else None
+        if distance is None or duration is None:
+            results.append(None)
+        else:
+            results.append({
+                'distance_km': round(distance / 1000, 2),
+                'duration_minutes': round(duration / 60, 1)
+            })
+    return results
@@ -0,0 +1,150 @@
+from flask import current_app
+
+from models import ShippingService, ShippingRate, PriceSurcharge, TrafficFactor
+from services.cache import snap_coords
+
+# Surcharge sin efecto: (fijo CLP, CLP por km, porcentaje)
+NO_SURCHARGE = (0, 0, 0.0)
+
+
+def load_rules():
+    """
+    Reglas de precio vigentes en la base, como dict serializable
+
+    Es el mismo formato que aceptan RateTable.from_rules y replay_pricing.py
+    (--rules), así que sirve para exportar las reglas actuales, editarlas y
+    comparar.
+    """
+    services = ShippingService.query.filter_by(active=True).order_by(ShippingService.id).all()
+    rates = ShippingRate.query.filter_by(active=True).order_by(ShippingRate.id).all()
+    surcharges = PriceSurcharge.query.filter_by(active=True).order_by(PriceSurcharge.id).all()
+    factors = TrafficFactor.query.order_by(TrafficFactor.hour, TrafficFactor.zone).all()
+
+    return {
+        'services': [{
+            'id': service.id,
+            'name': service.name,
+            'code': service.code,
+            'start_hour': service.start_hour,
+            'end_hour': service.end_hour
+        } for service in services],
+        'rates': [{
+            'id': rate.id,
+            'service_id': rate.service_id,
+            'min_km': rate.min_km,
+            'max_km': rate.max_km,
+            'min_minutes': rate.min_minutes,
+            'max_minutes': rate.max_minutes,
+            'price': rate.price
+        } for rate in rates],
+        'surcharges': [{
+            'service_id': surcharge.service_id,
+            'start_hour': surcharge.start_hour,
+            'end_hour': surcharge.end_hour,
+            'amount': surcharge.amount or 0,
+            'per_km': surcharge.per_km or 0,
+            'percent': surcharge.percent or 0
+        } for surcharge in surcharges],
+        'traffic': [{
+            'hour': factor.hour,
+            'zone': factor.zone,
+            'factor': factor.factor
+        } for factor in factors]
+    }
+
+
+def covers_hour(start_hour, end_hour, hour):
+    if start_hour <= end_hour:
+        return start_hour <= hour < end_hour
+    return hour >= start_hour or hour < end_hour
+
+
+def valid_hours(hour, maximum):
+    return isinstance(hour, int) and 0 <= hour <= maximum
+
+
+def compile_surcharges(surcharges, service_id):
+    """
+    Recargos de un servicio sumados por hora del día
+
+    Returns:
+        tuple: 24 tuplas (fijo, por km, porcentaje), o None si no tiene recargos
+    """
+    by_hour = [list(NO_SURCHARGE) for _ in range(24)]
+    found = False
+    for surcharge in surcharges:
+        if surcharge.get('service_id') not in (None, service_id):
+            continue
+        if not valid_hours(surcharge.get('start_hour'), 23) or not valid_hours(surcharge.get('end_hour'), 24):
+            # Una fila mal cargada no debe dejar sin precios a los demás servicios
+            current_app.logger.warning(f"Ignoring surcharge with invalid hours: {surcharge}")
+            continue
+        found = True
+        for hour in range(24):
+            if covers_hour(surcharge['start_hour'], surcharge['end_hour'], hour):
+                by_hour[hour][0] += surcharge.get('amount') or 0
+                by_hour[hour][1] += surcharge.get('per_km') or 0
+                by_hour[hour][2] += surcharge.get('percent') or 0
+    return tuple(tuple(values) for values in by_hour) if found else None
+
+
+def apply_surcharge(price, surcharge, distance_km):
+    amount, per_km, percent = surcharge
+    return int(round(price + amount + per_km * distance_km + price * percent / 100))
+
+
+def zone_key(coords, zone_m):
+    """
+    Celda de `zone_m` metros de unas coordenadas ('metros:fila:columna')
+
+    El tamaño va en la clave: una celda de otra grilla nunca coincide con
+    una de la grilla actual.
+    """
+    row, col = snap_coords(coords, zone_m)
+    return f"{zone_m:g}:{row}:{col}"
+
+
+class TrafficModel:
+    """
+    Factores de tráfico por hora y zona compilados
+
+    La duración del router (sin tráfico) se multiplica por el factor de la
+    zona del destino a esa hora, o por el de la hora (zona '') si la zona no
+    tiene uno propio, o por 1.
+    """
+
+    def __init__(self, factors, zone_m):
+        self.zone_m = zone_m
+        self.by_hour = [1.0] * 24
+        self.by_zone = {}
+        grid = f"{zone_m:g}:"
+        other_grid = 0
+        for entry in factors:
+            if not valid_hours(entry.get('hour'), 23) or not entry.get('factor'):
+                current_app.logger.warning(f"Ignoring traffic factor with invalid hour or factor: {entry}")
+                continue
+            if entry.get('zone'):
+                # Zonas aprendidas con otro TRAFFIC_ZONE_M: sus celdas no son las de ahora
+                if not entry['zone'].startswith(grid):
+                    other_grid += 1
+                    continue
+                self.by_zone[(entry['hour'], entry['zone'])] = entry['factor']
+            else:
+                self.by_hour[entry['hour']] = entry['factor']
+        if other_grid:
+            current_app.logger.warning(
+                f"Ignoring {other_grid} traffic zone factors not learned with TRAFFIC_ZONE_M={zone_m:g}; "
+                f"run learn_traffic.py again"
+            )
+
+    def factor(self, to_coords, hour):
+        if self.by_zone and to_coords:
+            factor = self.by_zone.get((hour, zone_key(to_coords, self.zone_m)))
+            if factor is not None:
+                return factor
+        return self.by_hour[hour]
+
+    def adjust(self, duration_minutes, to_coords, hour):
+        if duration_minutes is None:
+            return None
+        return round(duration_minutes * self.factor(to_coords, hour), 1)
@@ -0,0 +1,113 @@
+from flask import current_app
+
+from services.circuit import ors_local_circuit
+from services.gazetteer import GazetteerGeocoder, gazetteer
+from services.graph import GraphRouter
+from services.openroute import OpenRouteService
+from services.osrm import OSRMRouter
+
+
+class DistanceProvider:
+    """
+    Geocodificador + router detrás de una sola interfaz
+
+    Es la interfaz que usan los endpoints y los scripts (la misma que expone
+    OpenRouteService):
+
+        geocode(address), geocode_pair(from, to), geocode_many(addresses)
+        calculate_distance(from_coords, to_coords, profile)
+        calculate_matrix(from_coords, destinations, profile, use_cache)
+        calculate_matrix_to(origins, to_coords, profile, use_cache)
+        calculate_from_addresses(from, to, profile)
+
+    Permite geocodificar con un proveedor y rutear con otro (p. ej. ORS
+    público para direcciones y un OSRM local para distancias).
+    """
+
+    def __init__(self, geocoder, router):
+        self.geocoder = geocoder
+        self.router = router
+
+    def geocode(self, address):
+        return self.geocoder.geocode(address)
+
+    def geocode_pair(self, from_address, to_address):
+        return self.geocoder.geocode_pair(from_address, to_address)
+
+    def geocode_many(self, addresses):
+        return self.geocoder.geocode_many(addresses)
+
+    def calculate_distance(self, from_coords, to_coords, profile='driving-car'):
+        return self.router.calculate_distance(from_coords, to_coords, profile)
+
+    def calculate_matrix(self, from_coords, destinations, profile='driving-car', use_cache=True):
+        return self.router.calculate_matrix(from_coords, destinations, profile, use_cache)
+
+    def calculate_matrix_to(self, origins, to_coords, profile='driving-car', use_cache=True):
+        return self.router.calculate_matrix_to(origins, to_coords, profile, use_cache)
+
+    def calculate_from_addresses(self, from_address, to_address, profile='driving-car'):
+        from_coords, to_coords = self.geocode_pair(from_address, to_address)
+        if not from_coords or not to_coords:
+            return None
+
+        result = self.calculate_distance(from_coords, to_coords, profile)
+
+        if result:
+            result['from_coords'] = from_coords
+            result['to_coords'] = to_coords
+
+        return result
+
+
+# Implementaciones disponibles (GEOCODER_PROVIDER / ROUTER_PROVIDER)
+GEOCODERS = {
+    'ors': lambda config: OpenRouteService(),
+    'gazetteer': lambda config: GazetteerGeocoder(OpenRouteService()),
+}
+
+# Parte en proceso de cada geocodificador (sin el respaldo ORS), para asgi.py
+LOCAL_GEOCODERS = {
+    'gazetteer': gazetteer.lookup,
+}
+
+ROUTERS = {
+    'ors': lambda config: OpenRouteService(),
+    'ors-local': lambda config: OpenRouteService(base_url=config['ORS_LOCAL_URL'], circuit=ors_local_circuit),
+    'osrm': lambda config: OSRMRouter(),
+    'graph': lambda config: GraphRouter(),
+}
+
+
+def get_provider():
+    """
+    Proveedor de geocodificación y rutas según la configuración
+
+    Returns:
+        OpenRouteService o DistanceProvider (misma interfaz)
+    """
+    config = current_app.config
+    geocoder_name = config.get('GEOCODER_PROVIDER', 'ors')
+    router_name = config.get('ROUTER_PROVIDER', 'ors')
+
+    if geocoder_name not in GEOCODERS:
+        raise ValueError(f"GEOCODER_PROVIDER desconocido: {geocoder_name}")
+    if router_name not in ROUTERS:
+        raise ValueError(f"ROUTER_PROVIDER desconocido: {router_name}")
+
+    # Caso habitual: ORS hace todo, sin capa intermedia
+    if geocoder_name == 'ors' and router_name == 'ors':
+        return OpenRouteService()
+
+    return DistanceProvider(GEOCODERS[geocoder_name](config), ROUTERS[router_name](config))
+
+
+def local_geocode(address):
+    """
+    Geocodificar sólo con el geocodificador en proceso (GEOCODER_PROVIDER)
+
+    Returns:
+        dict: Coordenadas, o None si no responde o si el geocodificador es ORS
+    """
+    lookup = LOCAL_GEOCODERS.get(current_app.config.get('GEOCODER_PROVIDER', 'ors'))
+    return lookup(address) if lookup is not None else None
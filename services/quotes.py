@@ -0,0 +1,258 @@
+from flask import current_app
+
+from services.geo import straight_line_km
+from services.coverage import coverage_index
+from services.distance_field import distance_field
+from services.log_writer import delivery_log_writer
+from services.metrics import metrics
+from services.rate_table import rate_table_cache
+
+
+def parse_quote_request(data):
+    """
+    Extraer origen, destino y referencia del payload de Jumpseller
+
+    Args:
+        data (dict): Body JSON de /shipping/rates
+
+    Returns:
+        dict: {
+            'order_ref': str,
+            'from_address': str,
+            'to_address': str,
+            'from_coords': dict o None,
+            'to_coords': dict o None,
+            'straight_line_km': float o None,
+            'route_source': str o None,
+            'store_code': str o None
+        }
+    """
+    request_data = (data or {}).get('request', {})
+
+    from_location = request_data.get('from', {})
+    to_location = request_data.get('to', {})
+
+    quote = {
+        'order_ref': request_data.get('request_reference', ''),
+        'from_address': from_location.get('address', 'Origen'),
+        'to_address': to_location.get('address', 'Destino'),
+        'from_coords': None,
+        'to_coords': None,
+        'straight_line_km': None,
+        'route_source': None,
+        'store_code': None
+    }
+
+    # Si vienen coordenadas en ambos extremos, se usan directamente (las del
+    # destino se usan solas al cotizar desde la tabla de tiendas)
+    if to_location.get('latitude'):
+        quote['to_coords'] = {
+            'lat': to_location['latitude'],
+            'lon': to_location['longitude']
+        }
+    if from_location.get('latitude') and to_location.get('latitude'):
+        quote['from_coords'] = {
+            'lat': from_location['latitude'],
+            'lon': from_location['longitude']
+        }
+
+    return quote
+
+
+def error_response(order_ref, message):
+    """Respuesta de Jumpseller sin tarifas"""
+    return {
+        "reference_id": order_ref,
+        "rates": [],
+        "error": message
+    }
+
+
+def _delivery_log(quote, distance_km, duration_minutes, **extra):
+    """Fila de DeliveryLog (dict) para el writer en segundo plano"""
+    from_coords = quote['from_coords']
+    to_coords = quote['to_coords']
+
+    row = dict(
+        from_address=quote['from_address'],
+        to_address=quote['to_address'],
+        from_lat=from_coords['lat'] if from_coords else None,
+        from_lon=from_coords['lon'] if from_coords else None,
+        to_lat=to_coords['lat'] if to_coords else None,
+        to_lon=to_coords['lon'] if to_coords else None,
+        distance_km=distance_km,
+        duration_minutes=duration_minutes,
+        service_code=None,
+        calculated_price=None,
+        straight_line_km=quote.get('straight_line_km'),
+        rejected_by=None,
+        route_source=quote.get('route_source'),
+        store_code=quote.get('store_code'),
+        order_reference=quote['order_ref']
+    )
+    row.update(extra)
+    return row
+
+
+def precomputed_route(from_coords, to_coords, table=None):
+    """
+    Ruta desde los datos precalculados de la tienda, sin rutear
+
+    Primero el campo de distancias (exacto por nodo del grafo) y luego el
+    índice de cobertura (sólo lejos de límites de tramo).
+
+    Returns:
+        tuple: (ruta, 'field' | 'coverage') o (None, None)
+    """
+    route = distance_field.lookup(from_coords, to_coords)
+    if route:
+        return route, 'field'
+
+    route = coverage_index.lookup(from_coords, to_coords, table or rate_table_cache.get())
+    if route:
+        return route, 'coverage'
+
+    return None, None
+
+
+def local_route(quote):
+    """
+    Resolver la ruta sin ORS cuando hay un índice local que la conozca
+
+    Returns:
+        dict: {'distance_km', 'duration_minutes'} o None (consultar ORS)
+    """
+    route, source = precomputed_route(quote['from_coords'], quote['to_coords'])
+    if route:
+        quote['route_source'] = source
+    return route
+
+
+def out_of_coverage_message(distance_km, straight_line=False):
+    max_distance = current_app.config['MAX_DELIVERY_DISTANCE_KM']
+    if straight_line:
+        return f"Fuera del área de cobertura (máximo {max_distance} km, {distance_km:.1f} km en línea recta)"
+    return f"Fuera del área de cobertura (máximo {max_distance} km, solicitado {distance_km:.1f} km)"
+
+
+def straight_line_precheck(quote):
+    """
+    Rechazar sin llamar a ORS si la distancia en línea recta ya supera el máximo
+
+    La distancia haversine es una cota inferior de la distancia por calle,
+    así que todo lo que la supere queda fuera de cobertura con seguridad.
+    Requiere quote['from_coords'] y quote['to_coords'].
+
+    Returns:
+        dict: Respuesta de rechazo para Jumpseller, o None si hay que rutear
+    """
+    straight_km = straight_line_km(quote['from_coords'], quote['to_coords'])
+    quote['straight_line_km'] = round(straight_km, 2)
+
+    if not current_app.config.get('PREFILTER_ENABLED', True):
+        return None
+
+    if straight_km > current_app.config['MAX_DELIVERY_DISTANCE_KM']:
+        metrics.inc('shipping_quotes_total', source='haversine', result='out_of_range')
+
+        # Guardar log de consulta rechazada (sin distancia por calle)
+        delivery_log_writer.write([
+            _delivery_log(quote, None, None, rejected_by='haversine')
+        ])
+        return error_response(quote['order_ref'], out_of_coverage_message(straight_km, straight_line=True))
+
+    return None
+
+
+def find_rates(distance_km, table=None, hour=None, duration_minutes=None):
+    """
+    Servicios disponibles con tarifa para una distancia (sin SQL)
+
+    Args:
+        duration_minutes (float): Duración ya ajustada por tráfico, para los
+            tramos por duración
+
+    Returns:
+        list: [(CompiledService, Band, precio con recargos), ...]
+    """
+    if table is None:
+        table = rate_table_cache.get()
+    if hour is None:
+        hour = table.current_hour()
+
+    matches = []
+    for service in table.available_services(hour):
+        # Buscar tarifa aplicable para esta distancia
+        band = service.find_rate(distance_km, duration_minutes)
+        if band:
+            matches.append((service, band, service.price(band, distance_km, hour)))
+    return matches
+
+
+def format_rate(service, band, price, distance_km, duration_minutes):
+    """Tarifa en el formato de Jumpseller"""
+    return {
+        "rate_id": f"{service.code}-{band.rate_id}",
+        "rate_description": f"{service.name} - {distance_km:.1f} km (≈{duration_minutes:.0f} min)",
+        "service_name": service.name,
+        "service_code": service.code,
+        "total_price": str(price)
+    }
+
+
+def price_route(quote, route):
+    """
+    Calcular tarifas para una ruta ya resuelta y registrar la consulta
+
+    Args:
+        quote (dict): Resultado de parse_quote_request (con coordenadas)
+        route (dict): {'distance_km': float, 'duration_minutes': float}
+
+    Returns:
+        dict: Respuesta para Jumpseller
+    """
+    order_ref = quote['order_ref']
+    distance_km = route['distance_km']
+    duration_minutes = route['duration_minutes']
+
+    source = quote.get('route_source') or 'unknown'
+
+    # Validar distancia máxima (7 km)
+    if distance_km > current_app.config['MAX_DELIVERY_DISTANCE_KM']:
+        metrics.inc('shipping_quotes_total', source=source, result='out_of_range')
+
+        # Guardar log de consulta rechazada
+        delivery_log_writer.write([
+            _delivery_log(quote, distance_km, duration_minutes, rejected_by='route')
+        ])
+
+        return error_response(order_ref, out_of_coverage_message(distance_km))
+
+    # Servicios activos y disponibles (tabla compilada, sin SQL); la duración
+    # del router se ajusta por tráfico para los tramos por duración y la
+    # descripción, pero el log guarda la original
+    rates_response = []
+    logs = []
+    with metrics.time('rate_lookup'):
+        table = rate_table_cache.get()
+        hour = table.current_hour()
+        traffic_minutes = table.traffic.adjust(duration_minutes, quote['to_coords'], hour)
+        matches = find_rates(distance_km, table, hour, traffic_minutes)
+    metrics.inc('shipping_quotes_total', source=source, result='priced' if matches else 'no_rates')
+
+    for service, band, price in matches:
+        rates_response.append(format_rate(service, band, price, distance_km, traffic_minutes))
+
+        # Guardar log exitoso
+        logs.append(_delivery_log(
+            quote, distance_km, duration_minutes,
+            service_code=service.code,
+            calculated_price=price
+        ))
+
+    delivery_log_writer.write(logs)
+
+    return {
+        "reference_id": order_ref,
+        "rates": rates_response
+    }
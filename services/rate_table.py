@@ -0,0 +1,251 @@
+import hashlib
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+import pytz
+from flask import current_app
+
+from models import db, CacheVersion
+from services.pricing import TrafficModel, apply_surcharge, compile_surcharges, load_rules
+
+RATE_TABLE_VERSION = 'rate_table'
+
+Band = namedtuple('Band', ['rate_id', 'min_km', 'max_km', 'price', 'min_minutes', 'max_minutes'],
+                  defaults=(None, None))
+
+
+class CompiledService(namedtuple('CompiledService', [
+    'id', 'name', 'code', 'start_hour', 'end_hour', 'band_mins', 'bands', 'surcharges', 'duration_bands',
+    'overlapping'
+], defaults=(None, False, False))):
+    """Servicio activo con sus tarifas activas ordenadas por min_km y sus recargos por hora"""
+
+    def is_available_at(self, hour):
+        """Misma regla que ShippingService.is_available_now, con la hora ya calculada"""
+        if self.start_hour is None or self.end_hour is None:
+            return True
+        return self.start_hour <= hour < self.end_hour
+
+    def find_rate(self, distance_km, duration_minutes=None):
+        """
+        Buscar la tarifa con min_km <= distancia < max_km (búsqueda binaria)
+
+        Los tramos con rango de duración sólo aplican si la duración (ya
+        ajustada por tráfico) cae dentro de él, y tienen prioridad sobre los
+        tramos sólo por distancia que también apliquen. Si varios tramos
+        aplican gana el de menor id, igual que la consulta original.
+
+        Returns:
+            Band o None
+        """
+        index = bisect_right(self.band_mins, distance_km) - 1
+        if not self.overlapping:
+            # Tramos disjuntos: sólo el de la búsqueda binaria puede aplicar
+            if index >= 0:
+                band = self.bands[index]
+                if distance_km < band.max_km and band_covers_duration(band, duration_minutes):
+                    return band
+            return None
+
+        # Tramos superpuestos: revisar todos los que empiezan antes de la distancia
+        by_distance = by_duration = None
+        while index >= 0:
+            band = self.bands[index]
+            if distance_km < band.max_km:
+                if band.min_minutes is None and band.max_minutes is None:
+                    if by_distance is None or band.rate_id < by_distance.rate_id:
+                        by_distance = band
+                elif band_covers_duration(band, duration_minutes):
+                    if by_duration is None or band.rate_id < by_duration.rate_id:
+                        by_duration = band
+            index -= 1
+        return by_duration or by_distance
+
+    def price(self, band, distance_km, hour):
+        """Precio del tramo con los recargos de esa hora"""
+        if self.surcharges is None:
+            return band.price
+        return apply_surcharge(band.price, self.surcharges[hour], distance_km)
+
+
+def band_covers_duration(band, duration_minutes):
+    if band.min_minutes is None and band.max_minutes is None:
+        return True
+    if duration_minutes is None:
+        return False
+    if band.min_minutes is not None and duration_minutes < band.min_minutes:
+        return False
+    return band.max_minutes is None or duration_minutes < band.max_minutes
+
+
+class RateTable:
+    """Servicios y tarifas activas compilados en memoria (inmutable)"""
+
+    def __init__(self, services, timezone, version, traffic=None):
+        self.services = tuple(services)
+        self.tz = pytz.timezone(timezone)
+        self.version = version
+        self.traffic = traffic or TrafficModel([], 2000)
+
+        # Tramos por duración o recargos por km: el precio cambia con cualquier
+        # diferencia en la ruta (el índice de cobertura no alcanza)
+        self.needs_exact_route = any(
+            service.duration_bands or any(surcharge[1] for surcharge in service.surcharges or ())
+            for service in self.services
+        )
+
+        # Respuesta de /shipping/services ya serializada para cada hora del día
+        self._services_by_hour = [self._services_body(hour) for hour in range(24)]
+        self._services_current = None
+
+    @classmethod
+    def compile(cls, timezone, version):
+        return cls.from_rules(load_rules(), timezone, version)
+
+    @classmethod
+    def from_rules(cls, rules, timezone, version=0, zone_m=None):
+        """
+        Compilar reglas de precio (formato de services.pricing.load_rules)
+
+        Así se compila tanto la tabla de la base como un archivo de reglas
+        alternativo para replay_pricing.py.
+        """
+        bands_by_service = {}
+        for rate in rules.get('rates', []):
+            bands_by_service.setdefault(rate['service_id'], []).append(Band(
+                rate['id'], rate['min_km'], rate['max_km'], rate['price'],
+                rate.get('min_minutes'), rate.get('max_minutes')
+            ))
+
+        surcharges = rules.get('surcharges', [])
+        compiled = []
+        for service in rules.get('services', []):
+            bands = tuple(sorted(bands_by_service.get(service['id'], []), key=lambda b: (b.min_km, b.rate_id)))
+            compiled.append(CompiledService(
+                id=service['id'],
+                name=service['name'],
+                code=service['code'],
+                start_hour=service.get('start_hour'),
+                end_hour=service.get('end_hour'),
+                band_mins=tuple(b.min_km for b in bands),
+                bands=bands,
+                surcharges=compile_surcharges(surcharges, service['id']),
+                duration_bands=any(b.min_minutes is not None or b.max_minutes is not None for b in bands),
+                overlapping=any(b.min_km < prev.max_km for prev, b in zip(bands, bands[1:]))
+            ))
+
+        if zone_m is None:
+            zone_m = current_app.config.get('TRAFFIC_ZONE_M', 2000)
+        return cls(compiled, timezone, version, TrafficModel(rules.get('traffic', []), zone_m))
+
+    def current_hour(self):
+        return datetime.now(self.tz).hour
+
+    def available_services(self, hour=None):
+        """Servicios disponibles a la hora indicada (por defecto, la actual)"""
+        if hour is None:
+            hour = self.current_hour()
+        return [service for service in self.services if service.is_available_at(hour)]
+
+    def _services_body(self, hour):
+        # Mismo JSON que jsonify (claves ordenadas, compacto)
+        body = current_app.json.dumps({"services": [
+            {"service_name": service.name, "service_code": service.code}
+            for service in self.available_services(hour)
+        ]}, separators=(',', ':')).encode('utf-8') + b'\n'
+        return body, hashlib.sha1(body).hexdigest()[:16]
+
+    def _services_at(self, now):
+        """Respuesta vigente en `now` (epoch) y hasta cuándo sigue igual"""
+        local = datetime.fromtimestamp(now, self.tz)
+        body, etag = self._services_by_hour[local.hour]
+
+        # La disponibilidad sólo cambia al empezar una hora: se avanza de hora
+        # en hora (en tiempo absoluto, por los cambios de horario) hasta que
+        # la respuesta cambie
+        changes_at = now - local.minute * 60 - local.second - local.microsecond / 1e6
+        for _ in range(24):
+            changes_at += 3600
+            if self._services_by_hour[datetime.fromtimestamp(changes_at, self.tz).hour][1] != etag:
+                break
+
+        return body, etag, changes_at
+
+    def services_response(self):
+        """
+        Body JSON de /shipping/services para este momento
+
+        Returns:
+            tuple: (body bytes, etag, segundos hasta el próximo cambio de horario)
+        """
+        now = time.time()
+        current = self._services_current
+        if current is None or now >= current[2]:
+            current = self._services_current = self._services_at(now)
+        body, etag, changes_at = current
+        return body, etag, changes_at - now
+
+
+class RateTableCache:
+    """
+    Tabla de tarifas compilada por worker
+
+    Se recompila cuando cambia la versión `rate_table` en `cache_versions`,
+    que Flask-Admin incrementa al guardar servicios o tarifas. La versión se
+    consulta como máximo cada RATE_TABLE_CHECK_SECONDS segundos.
+    """
+
+    version_name = RATE_TABLE_VERSION
+    label = 'Rate table'
+
+    def __init__(self):
+        self._table = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Obtener la tabla vigente, recompilando si cambió la versión"""
+        table = self._table
+        interval = current_app.config.get('RATE_TABLE_CHECK_SECONDS', 10)
+        if table is not None and time.monotonic() - self._checked_at < interval:
+            return table
+
+        with self._lock:
+            table = self._table
+            if table is not None and time.monotonic() - self._checked_at < interval:
+                return table
+
+            try:
+                version = CacheVersion.get(self.version_name)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"{self.label} version error: {str(e)}")
+                version = table.version if table is not None else 0
+
+            if table is None or table.version != version:
+                table = self.compile(version)
+                self._table = table
+
+            self._checked_at = time.monotonic()
+            return table
+
+    def compile(self, version):
+        return RateTable.compile(current_app.config['TIMEZONE'], version)
+
+    def invalidate(self):
+        """Descartar la tabla local y avisar a los demás workers"""
+        with self._lock:
+            self._table = None
+            self._checked_at = 0.0
+
+        try:
+            CacheVersion.bump(self.version_name)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"{self.label} invalidation error: {str(e)}")
+
+
+rate_table_cache = RateTableCache()
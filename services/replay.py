@@ -0,0 +1,214 @@
+import glob
+import gzip
+import json
+from datetime import datetime
+from statistics import median
+
+import pytz
+
+from models import db, DeliveryLog
+from services.pricing import zone_key
+from services.quotes import find_rates
+
+LOG_COLUMNS = (
+    'id', 'timestamp', 'from_address', 'to_address', 'to_lat', 'to_lon', 'distance_km',
+    'duration_minutes', 'service_code', 'calculated_price', 'rejected_by', 'route_source',
+    'order_reference'
+)
+
+
+def iter_log_rows(since=None, until=None, archives=()):
+    """
+    Filas de DeliveryLog (dicts) de los archivos NDJSON indicados y de la base
+
+    Los archivos son los de LOG_ARCHIVE_DIR (delivery_logs-AAAA-MM.ndjson.gz)
+    o cualquier NDJSON con las mismas columnas, p. ej. viajes reales
+    exportados desde la app de reparto.
+    """
+    for pattern in archives:
+        for path in sorted(glob.glob(pattern)):
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+                    if (since is None or row['timestamp'] >= since) and (until is None or row['timestamp'] < until):
+                        yield row
+
+    query = db.session.query(*[getattr(DeliveryLog, name) for name in LOG_COLUMNS])
+    if since is not None:
+        query = query.filter(DeliveryLog.timestamp >= since)
+    if until is not None:
+        query = query.filter(DeliveryLog.timestamp < until)
+    for row in query.order_by(DeliveryLog.id).yield_per(5000):
+        yield dict(row._mapping)
+
+
+def group_quotes(rows):
+    """
+    Juntar las filas de una misma cotización (una por servicio tarifado)
+
+    Las filas de una cotización se escriben juntas, así que basta comparar
+    cada fila con la anterior.
+
+    Yields:
+        dict: {'timestamp', 'to_coords', 'distance_km', 'duration_minutes',
+               'route_source', 'rejected_by', 'prices': {servicio: precio}}
+    """
+    current = None
+    current_key = None
+    for row in rows:
+        key = (row.get('order_reference'), row.get('from_address'), row.get('to_address'),
+               row.get('distance_km'), row.get('duration_minutes'), row.get('rejected_by'))
+        if current is None or key != current_key:
+            if current is not None:
+                yield current
+            current_key = key
+            current = {
+                'timestamp': row['timestamp'],
+                'to_coords': {'lat': row['to_lat'], 'lon': row['to_lon']} if row.get('to_lat') is not None else None,
+                'distance_km': row.get('distance_km'),
+                'duration_minutes': row.get('duration_minutes'),
+                'route_source': row.get('route_source'),
+                'rejected_by': row.get('rejected_by'),
+                'prices': {}
+            }
+        if row.get('service_code') and row.get('calculated_price') is not None:
+            current['prices'][row['service_code']] = row['calculated_price']
+    if current is not None:
+        yield current
+
+
+class LocalHours:
+    """Hora local de timestamps UTC, calculada una vez por hora UTC"""
+
+    def __init__(self, tz):
+        self.tz = tz
+        self._cache = {}
+
+    def __call__(self, moment):
+        key = moment.replace(minute=0, second=0, microsecond=0)
+        hour = self._cache.get(key)
+        if hour is None:
+            hour = self._cache[key] = pytz.utc.localize(key).astimezone(self.tz).hour
+        return hour
+
+
+def learn_traffic_factors(quotes, timezone, zone_m, min_samples=20, prior=50,
+                          exclude_sources=('fallback',), min_km=0.5):
+    """
+    Factores de tráfico por hora y por hora y zona desde cotizaciones históricas
+
+    El factor es la mediana del ritmo (minutos por km) de la hora/zona dividida
+    por la mediana de todo el historial, acercado a 1 cuando hay pocas filas:
+    1 + (crudo - 1) * n / (n + prior). Sólo se guardan los grupos con al
+    menos `min_samples` filas.
+
+    Returns:
+        tuple: (ritmo típico en min/km, [{'hour', 'zone', 'factor', 'samples'}])
+    """
+    local_hour = LocalHours(pytz.timezone(timezone))
+    paces = {}
+    everything = []
+    for quote in quotes:
+        distance_km, duration = quote['distance_km'], quote['duration_minutes']
+        if not distance_km or distance_km < min_km or not duration:
+            continue
+        if quote['route_source'] in exclude_sources:
+            continue
+
+        pace = duration / distance_km
+        hour = local_hour(quote['timestamp'])
+        everything.append(pace)
+        paces.setdefault((hour, ''), []).append(pace)
+        if quote['to_coords']:
+            paces.setdefault((hour, zone_key(quote['to_coords'], zone_m)), []).append(pace)
+
+    if not everything:
+        return None, []
+
+    baseline = median(everything)
+    factors = []
+    for (hour, zone), values in sorted(paces.items()):
+        if len(values) < min_samples:
+            continue
+        raw = median(values) / baseline
+        factors.append({
+            'hour': hour,
+            'zone': zone,
+            'factor': round(1 + (raw - 1) * len(values) / (len(values) + prior), 3),
+            'samples': len(values)
+        })
+    return baseline, factors
+
+
+def new_summary():
+    return {'quotes': 0, 'priced': 0, 'no_rates': 0, 'out_of_range': 0, 'cheapest_total': 0,
+            'changed': 0, 'delta_total': 0, 'by_service': {}}
+
+
+def add_result(summary, prices, logged):
+    summary['quotes'] += 1
+    if not prices:
+        return
+    summary['priced'] += 1
+    cheapest = min(prices.values())
+    summary['cheapest_total'] += cheapest
+    for code, price in prices.items():
+        count, total = summary['by_service'].get(code, (0, 0))
+        summary['by_service'][code] = (count + 1, total + price)
+
+    if logged != prices:
+        summary['changed'] += 1
+    if logged:
+        summary['delta_total'] += cheapest - min(logged.values())
+
+
+def replay_quotes(quotes, tables, timezone, max_distance_km):
+    """
+    Re-tarifar cotizaciones históricas con uno o más juegos de reglas
+
+    Cada cotización se tarifa con la distancia y duración del router que
+    quedaron en el log; la duración se ajusta con los factores de tráfico de
+    cada juego de reglas. Las rechazadas en línea recta no tienen distancia
+    y se omiten.
+
+    Args:
+        tables (dict): {nombre: RateTable}
+
+    Returns:
+        dict: {'historial' y cada nombre: resumen}
+    """
+    local_hour = LocalHours(pytz.timezone(timezone))
+    summaries = {name: new_summary() for name in ['historial'] + list(tables)}
+
+    for quote in quotes:
+        distance_km = quote['distance_km']
+        if distance_km is None:
+            continue
+
+        logged = quote['prices']
+        add_result(summaries['historial'], logged, logged)
+        if distance_km > max_distance_km:
+            for name in tables:
+                summaries[name]['quotes'] += 1
+                summaries[name]['out_of_range'] += 1
+            summaries['historial']['out_of_range'] += 1
+            continue
+
+        hour = local_hour(quote['timestamp'])
+        for name, table in tables.items():
+            duration = table.traffic.adjust(quote['duration_minutes'], quote['to_coords'], hour)
+            prices = {
+                service.code: price
+                for service, _, price in find_rates(distance_km, table, hour, duration)
+            }
+            if not prices:
+                summaries[name]['no_rates'] += 1
+            add_result(summaries[name], prices, logged)
+
+    historial = summaries['historial']
+    historial['no_rates'] = historial['quotes'] - historial['priced'] - historial['out_of_range']
+    return summaries
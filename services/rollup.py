@@ -0,0 +1,216 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytz
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, DeliveryLog, DeliveryLogRollup
+from services.export import export_watermark
+
+# Dimensiones de los resúmenes (columnas de DeliveryLogRollup)
+DIMENSIONS = ('service_code', 'distance_band_km', 'calculated_price', 'rejected_by', 'route_source')
+
+HOUR = timedelta(hours=1)
+
+
+def floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_watermark():
+    """Primera hora sin resumir (UTC), o None si todavía no hay resúmenes"""
+    last = db.session.query(func.max(DeliveryLogRollup.period_start)).filter(
+        DeliveryLogRollup.period == 'hour'
+    ).scalar()
+    return last + HOUR if last else None
+
+
+def local_day_start(moment, tz):
+    """Medianoche local (en UTC, sin tzinfo) del día que contiene `moment` (UTC)"""
+    local = pytz.utc.localize(moment).astimezone(tz)
+    midnight = tz.localize(datetime(local.year, local.month, local.day))
+    return midnight.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def next_local_day_start(day_start, tz):
+    # +25 h y volver a la medianoche: correcto también en días de 23 o 25 horas
+    return local_day_start(day_start + timedelta(hours=25), tz)
+
+
+def replace_rollups(period, period_start, rows):
+    DeliveryLogRollup.query.filter_by(period=period, period_start=period_start).delete()
+    if rows:
+        db.session.execute(db.insert(DeliveryLogRollup), [
+            dict(zip(DIMENSIONS, row[:len(DIMENSIONS)]),
+                 period=period,
+                 period_start=period_start,
+                 quotes=row[-3],
+                 distance_km_sum=row[-2] or 0,
+                 duration_minutes_sum=row[-1] or 0)
+            for row in rows
+        ])
+
+
+def rollup_hour(hour):
+    """Recalcular el resumen de una hora (UTC) desde las filas de DeliveryLog"""
+    # floor: CAST a entero redondea en Postgres y trunca en SQLite
+    band = db.cast(func.floor(DeliveryLog.distance_km), db.Integer)
+    dimensions = (
+        DeliveryLog.service_code, band, DeliveryLog.calculated_price,
+        DeliveryLog.rejected_by, DeliveryLog.route_source
+    )
+    rows = db.session.query(
+        *dimensions,
+        func.count(DeliveryLog.id),
+        func.sum(DeliveryLog.distance_km),
+        func.sum(DeliveryLog.duration_minutes)
+    ).filter(
+        DeliveryLog.timestamp >= hour,
+        DeliveryLog.timestamp < hour + HOUR
+    ).group_by(*dimensions).all()
+
+    replace_rollups('hour', hour, rows)
+    return len(rows)
+
+
+def rollup_day(day_start, tz):
+    """Recalcular el resumen de un día local sumando sus resúmenes por hora"""
+    dimensions = [getattr(DeliveryLogRollup, name) for name in DIMENSIONS]
+    rows = db.session.query(
+        *dimensions,
+        func.sum(DeliveryLogRollup.quotes),
+        func.sum(DeliveryLogRollup.distance_km_sum),
+        func.sum(DeliveryLogRollup.duration_minutes_sum)
+    ).filter(
+        DeliveryLogRollup.period == 'hour',
+        DeliveryLogRollup.period_start >= day_start,
+        DeliveryLogRollup.period_start < next_local_day_start(day_start, tz)
+    ).group_by(*dimensions).all()
+
+    replace_rollups('day', day_start, rows)
+
+
+def rollup_logs(since=None):
+    """
+    Resumir las horas completas pendientes de DeliveryLog
+
+    Parte de la última hora resumida menos ROLLUP_LOOKBACK_HOURS (el writer
+    en segundo plano puede insertar filas con algo de atraso) y avanza hasta
+    la hora actual, saltando las horas sin filas. Cada hora se recalcula
+    entera, así que repetir el job no duplica nada.
+
+    Args:
+        since (datetime): Recalcular desde esta hora (UTC) en vez de la marca
+
+    Returns:
+        dict: {'hours': horas resumidas, 'days': días actualizados}
+    """
+    config = current_app.config
+    tz = pytz.timezone(config['TIMEZONE'])
+    end = floor_hour(datetime.utcnow())
+
+    if since is None:
+        watermark = rollup_watermark()
+        if watermark is None:
+            since = db.session.query(func.min(DeliveryLog.timestamp)).scalar()
+            if since is None:
+                return {'hours': 0, 'days': 0}
+        else:
+            since = watermark - HOUR * config.get('ROLLUP_LOOKBACK_HOURS', 2)
+
+    hours = 0
+    days = set()
+    hour = floor_hour(since)
+    while hour < end:
+        first = db.session.query(func.min(DeliveryLog.timestamp)).filter(
+            DeliveryLog.timestamp >= hour,
+            DeliveryLog.timestamp < end
+        ).scalar()
+        if first is None:
+            break
+
+        hour = floor_hour(first)
+        rollup_hour(hour)
+        db.session.commit()
+        days.add(local_day_start(hour, tz))
+        hours += 1
+        hour += HOUR
+
+    for day_start in sorted(days):
+        rollup_day(day_start, tz)
+    db.session.commit()
+
+    return {'hours': hours, 'days': len(days)}
+
+
+def archive_rows(rows, directory):
+    """Agregar filas a los archivos mensuales delivery_logs-AAAA-MM.ndjson.gz"""
+    os.makedirs(directory, exist_ok=True)
+    columns = [column.name for column in DeliveryLog.__table__.columns]
+
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row.timestamp.strftime('%Y-%m'), []).append(row)
+
+    for month, month_rows in by_month.items():
+        # Cada append es un miembro gzip nuevo; gzip los lee como un solo archivo
+        with gzip.open(os.path.join(directory, f"delivery_logs-{month}.ndjson.gz"), 'at', encoding='utf-8') as f:
+            for row in month_rows:
+                record = {name: getattr(row, name) for name in columns}
+                record['timestamp'] = row.timestamp.isoformat()
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def apply_retention():
+    """
+    Borrar de DeliveryLog las filas más antiguas que LOG_RETENTION_DAYS
+
+    Desactivada con LOG_RETENTION_DAYS=0 (el default). Sólo se borran horas
+    ya resumidas (y, con EXPORT_DIR, filas ya exportadas). Con
+    LOG_ARCHIVE_DIR las filas se guardan antes en archivos mensuales
+    comprimidos (si el job se interrumpe entre archivar y borrar, algunas
+    filas pueden quedar repetidas en el archivo).
+
+    Returns:
+        int: Filas borradas
+    """
+    config = current_app.config
+    retention_days = config.get('LOG_RETENTION_DAYS', 0)
+    if not retention_days:
+        return 0
+
+    watermark = rollup_watermark()
+    if watermark is None:
+        return 0
+    cutoff = min(floor_hour(datetime.utcnow() - timedelta(days=retention_days)), watermark)
+
+    archive_dir = config.get('LOG_ARCHIVE_DIR')
+    batch_size = config.get('LOG_RETENTION_BATCH', 5000)
+    deleted = 0
+
+    conditions = [DeliveryLog.timestamp < cutoff]
+    if config.get('EXPORT_DIR'):
+        # Nunca borrar filas que todavía no se exportaron
+        conditions.append(DeliveryLog.id <= export_watermark(config['EXPORT_DIR']))
+
+    while True:
+        rows = DeliveryLog.query.filter(
+            *conditions
+        ).order_by(DeliveryLog.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        if archive_dir:
+            archive_rows(rows, archive_dir)
+        DeliveryLog.query.filter(
+            DeliveryLog.id.in_([row.id for row in rows])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(rows)
+
+    if deleted:
+        current_app.logger.info(f"Retention: deleted {deleted} delivery logs before {cutoff}")
+    return deleted
@@ -0,0 +1,128 @@
+from flask import current_app
+from sqlalchemy import create_engine, event, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from models import db
+
+
+def configure_database(app):
+    """
+    Ajustes por conexión según el motor (llamar después de db.init_app)
+
+    SQLite: journal WAL y synchronous=NORMAL, para que las lecturas de las
+    cotizaciones no esperen a las escrituras del historial.
+    """
+    with app.app_context():
+        engine = db.engine
+
+    if engine.dialect.name != 'sqlite' or not app.config.get('SQLITE_WAL', True):
+        return
+    if engine.url.database in (None, '', ':memory:'):
+        return
+
+    @event.listens_for(engine, 'connect')
+    def sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+def upgrade_schema():
+    """
+    Crear tablas nuevas y agregar columnas e índices nuevos a tablas existentes
+
+    db.create_all() no modifica tablas que ya existen; aquí se agregan con
+    ALTER TABLE las columnas (nullable) que falten respecto de los modelos, y
+    con CREATE INDEX los índices que falten (en Postgres, CONCURRENTLY: la
+    tabla sigue aceptando escrituras mientras se construye el índice).
+    Debe ejecutarse dentro de un app context.
+
+    Returns:
+        list: Columnas e índices agregados ('tabla.columna', 'tabla.índice')
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or column.primary_key:
+                continue
+
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append(f'{table.name}.{column.name}')
+            current_app.logger.info(f"Schema: added column {table.name}.{column.name}")
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+
+            create_index(index)
+            added.append(f'{table.name}.{index.name}')
+            current_app.logger.info(f"Schema: added index {table.name}.{index.name}")
+
+    return added
+
+
+def create_index(index):
+    statement = str(CreateIndex(index).compile(dialect=db.engine.dialect))
+    if db.engine.dialect.name != 'postgresql':
+        with db.engine.begin() as conn:
+            conn.execute(text(statement))
+        return
+
+    # CREATE INDEX CONCURRENTLY no puede ir dentro de una transacción
+    statement = statement.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(statement))
+
+
+def copy_database(source_uri, batch_size=1000):
+    """
+    Copiar todas las tablas desde otra base de datos (p. ej. SQLite → Postgres)
+
+    Las tablas de destino deben existir (upgrade_schema) y estar vacías. En
+    Postgres se ajustan las secuencias de los id al máximo copiado.
+
+    Returns:
+        dict: {tabla: filas copiadas}
+    """
+    source = create_engine(source_uri)
+    source_tables = set(inspect(source).get_table_names())
+    copied = {}
+
+    with source.connect() as src, db.engine.begin() as dst:
+        for table in db.metadata.sorted_tables:
+            if table.name not in source_tables:
+                continue
+            if dst.execute(select(table).limit(1)).first() is not None:
+                raise ValueError(f"La tabla {table.name} de destino no está vacía")
+
+            # Sólo las columnas que existen en el origen (esquemas más antiguos)
+            source_columns = {column['name'] for column in inspect(source).get_columns(table.name)}
+            columns = [column for column in table.columns if column.name in source_columns]
+
+            count = 0
+            result = src.execution_options(yield_per=batch_size).execute(select(*columns))
+            for rows in result.partitions():
+                dst.execute(table.insert(), [dict(row._mapping) for row in rows])
+                count += len(rows)
+            copied[table.name] = count
+
+            if db.engine.dialect.name == 'postgresql' and 'id' in table.columns and count:
+                dst.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT MAX(id) FROM {table.name}))"
+                ))
+
+    source.dispose()
+    return copied
@@ -0,0 +1,195 @@
+import asyncio
+import copy
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+from services.metrics import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicación de llamadas idénticas en curso (single-flight)
+
+    Si llega una llamada con la misma clave mientras otra está en curso,
+    espera y comparte su resultado en vez de repetir la llamada a ORS. El
+    líder vuelve a consultar el cache (`recheck`) antes de llamar, por si
+    otra llamada terminó justo después de que el caller lo consultara.
+
+    Con SINGLEFLIGHT_SHARED=true, el thread líder además toma un lock de
+    archivo de la clave (uno de SINGLEFLIGHT_LOCK_STRIPES), de modo que los
+    workers del mismo host también se turnan: quien entra después vuelve a
+    consultar el cache (`recheck`) y normalmente encuentra el resultado que
+    dejó el otro worker. Si el lock no se libera dentro del timeout de ORS,
+    llama sin coalescer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'executed': 0, 'coalesced': 0, 'recheck_hits': 0, 'shared_hits': 0, 'lock_timeouts': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def do(self, key, fn, recheck=None):
+        """
+        Ejecutar fn() una sola vez por clave entre llamadas concurrentes
+
+        Args:
+            key (str): Clave normalizada de la llamada
+            fn (callable): Función que hace la llamada real
+            recheck (callable): Consulta al cache antes de llamar a fn()
+
+        Returns:
+            Copia del resultado de fn()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = self._run_leader(key, fn, recheck)
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _run_leader(self, key, fn, recheck):
+        if recheck is not None:
+            result = recheck()
+            if result:
+                self._count('recheck_hits')
+                return result
+
+        if not current_app.config.get('SINGLEFLIGHT_SHARED', False):
+            return fn()
+
+        with shared_lock(key) as acquired:
+            if not acquired:
+                # Otro worker lleva más que el timeout de ORS con esta clave
+                self._count('lock_timeouts')
+                return fn()
+            if recheck is not None:
+                result = recheck()
+                if result:
+                    self._count('shared_hits')
+                    return result
+            return fn()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+@contextmanager
+def shared_lock(key):
+    """
+    Lock exclusivo entre procesos del mismo host (flock)
+
+    Las claves se reparten en SINGLEFLIGHT_LOCK_STRIPES archivos fijos, así
+    que el directorio no crece; dos claves del mismo archivo sólo se turnan.
+    Espera como máximo el timeout de ORS (conexión + lectura).
+
+    Yields:
+        bool: True si se obtuvo el lock, False si se agotó la espera
+    """
+    config = current_app.config
+    lock_dir = config.get('SINGLEFLIGHT_LOCK_DIR', '/tmp/shipping-singleflight')
+    os.makedirs(lock_dir, exist_ok=True)
+    stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % config.get('SINGLEFLIGHT_LOCK_STRIPES', 64)
+    deadline = time.monotonic() + config.get('ORS_CONNECT_TIMEOUT', 3) + config.get('ORS_READ_TIMEOUT', 10)
+
+    with open(os.path.join(lock_dir, f'stripe-{stripe}.lock'), 'w') as f:
+        acquired = False
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.02)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class AsyncSingleFlight:
+    """
+    Single-flight para el cliente asíncrono (dentro de un event loop)
+
+    La llamada real corre en su propia tarea: si el request que la inició
+    se cancela, los demás que la esperan igual reciben el resultado.
+    """
+
+    def __init__(self, stats_owner):
+        self._calls = {}
+        self._stats_owner = stats_owner
+
+    async def do(self, key, coro_fn):
+        task = self._calls.get(key)
+        leader = task is None
+
+        if leader:
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = task
+
+            def forget(done, key=key):
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            task.add_done_callback(forget)
+            self._stats_owner._count('executed')
+        else:
+            self._stats_owner._count('coalesced')
+
+        return copy.deepcopy(await asyncio.shield(task))
+
+
+singleflight = SingleFlight()
+
+
+def _singleflight_metrics():
+    stats = singleflight.get_stats()
+    in_flight = stats.pop('in_flight')
+    return [('shipping_singleflight_calls_total', {'result': key}, value) for key, value in stats.items()] + [
+        ('shipping_singleflight_in_flight', {}, in_flight)
+    ]
+
+
+metrics.add_collector(_singleflight_metrics, stats=[singleflight.stats])
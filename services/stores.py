@@ -0,0 +1,152 @@
+from collections import namedtuple
+
+from flask import current_app
+
+from models import Store
+from services.geo import haversine_km_many
+from services.quotes import find_rates, precomputed_route
+from services.rate_table import RateTableCache, rate_table_cache
+
+STORES_VERSION = 'stores'
+
+CompiledStore = namedtuple('CompiledStore', ['code', 'name', 'address', 'coords'])
+
+
+class StoreTable:
+    """Tiendas activas en memoria (por worker)"""
+
+    def __init__(self, stores, version=0):
+        self.stores = stores
+        self.version = version
+
+    @classmethod
+    def compile(cls, version=0):
+        stores = [
+            CompiledStore(store.code, store.name, store.address or store.name,
+                          {'lat': store.lat, 'lon': store.lon})
+            for store in Store.query.filter_by(active=True).order_by(Store.id).all()
+        ]
+        return cls(stores, version)
+
+    def candidates(self, to_coords, max_km, limit):
+        """
+        Preselección espacial: tiendas a menos de `max_km` en línea recta
+
+        La línea recta es una cota inferior de la distancia por calle, así
+        que las tiendas descartadas nunca podrían despachar al destino.
+
+        Returns:
+            tuple: ([CompiledStore] más cercanas primero, hasta `limit`;
+                    la tienda más cercana aunque quede fuera de rango)
+        """
+        if not self.stores:
+            return [], None
+
+        distances = haversine_km_many(to_coords, [store.coords for store in self.stores])
+        ranked = sorted(zip(distances, range(len(self.stores))))
+        nearest = self.stores[ranked[0][1]]
+        within = [self.stores[i] for distance, i in ranked if distance <= max_km]
+        return within[:limit], nearest
+
+
+class StoreTableCache(RateTableCache):
+    """
+    Tiendas activas compiladas por worker
+
+    Se recargan cuando cambia la versión `stores` en `cache_versions`
+    (Flask-Admin la incrementa al guardar una tienda).
+    """
+
+    version_name = STORES_VERSION
+    label = 'Store table'
+
+    def compile(self, version):
+        return StoreTable.compile(version)
+
+
+store_table_cache = StoreTableCache()
+
+
+def stores_enabled():
+    """Cotizar desde las tiendas de la tabla `stores` (STORE_SELECTION != 'off' y hay tiendas activas)"""
+    if current_app.config.get('STORE_SELECTION', 'off') == 'off':
+        return False
+    return bool(store_table_cache.get().stores)
+
+
+def use_store(quote, store):
+    quote['from_coords'] = dict(store.coords)
+    quote['from_address'] = store.address
+    quote['store_code'] = store.code
+
+
+def route_rank(route, to_coords, table, hour):
+    """
+    Clave de orden de una ruta candidata (menor = mejor)
+
+    STORE_SELECTION=price: la tarifa más barata disponible para la distancia
+    (a igual precio, la más rápida); duration: la más rápida. Las rutas fuera
+    de cobertura o sin tarifa quedan al final, la más corta primero.
+    """
+    distance_km = route['distance_km']
+    duration_minutes = table.traffic.adjust(route['duration_minutes'], to_coords, hour)
+    prices = [price for _, _, price in find_rates(distance_km, table, hour, duration_minutes)]
+    if distance_km > current_app.config['MAX_DELIVERY_DISTANCE_KM'] or not prices:
+        return (1, distance_km, duration_minutes)
+
+    if current_app.config.get('STORE_SELECTION') == 'duration':
+        return (0, duration_minutes, min(prices))
+    return (0, min(prices), duration_minutes)
+
+
+def select_store(ors, quote):
+    """
+    Elegir la tienda desde la que se cotiza el destino
+
+    Preselecciona hasta STORE_CANDIDATES tiendas por línea recta, resuelve
+    sus rutas con los datos precalculados (tienda principal) y las demás con
+    una sola llamada a /matrix (muchos orígenes, un destino), y se queda con
+    la mejor según STORE_SELECTION. Deja la tienda elegida como origen de
+    `quote` (si no hay candidatas, la más cercana: el pre-filtro en línea
+    recta la rechaza).
+
+    Args:
+        ors: Proveedor de geocodificación y rutas (get_provider())
+        quote (dict): Con quote['to_coords']
+
+    Returns:
+        dict: Ruta de la tienda elegida, o None para rutear como siempre
+              desde quote['from_coords'] (sin candidatas o sin respuesta)
+    """
+    config = current_app.config
+    to_coords = quote['to_coords']
+    candidates, nearest = store_table_cache.get().candidates(
+        to_coords, config['MAX_DELIVERY_DISTANCE_KM'], config.get('STORE_CANDIDATES', 5)
+    )
+    use_store(quote, candidates[0] if candidates else nearest)
+    if not candidates:
+        return None
+
+    table = rate_table_cache.get()
+    routes = []
+    remote = []
+    for store in candidates:
+        route, source = precomputed_route(store.coords, to_coords, table)
+        if route:
+            routes.append((store, route, source))
+        else:
+            remote.append(store)
+
+    if remote:
+        matrix = ors.calculate_matrix_to([store.coords for store in remote], to_coords)
+        router = config.get('ROUTER_PROVIDER', 'ors')
+        routes.extend((store, route, router) for store, route in zip(remote, matrix) if route)
+
+    if not routes:
+        return None
+
+    hour = table.current_hour()
+    store, route, source = min(routes, key=lambda item: route_rank(item[1], to_coords, table, hour))
+    use_store(quote, store)
+    quote['route_source'] = source
+    return route
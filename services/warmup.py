@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from models import db, DeliveryLog
+from services.cache import geocode_cache
+from services.coverage import coverage_index
+from services.distance_field import distance_field
+from services.fallback import detour_factor
+from services.gazetteer import gazetteer
+from services.graph import road_graph
+from services.metrics import metrics
+from services.openroute import get_session
+from services.osrm import get_osrm_session
+from services.rate_table import rate_table_cache
+from services.stores import store_table_cache
+
+# Archivos precalculados (mmap): abiertos en el maestro, sus páginas se
+# comparten entre workers
+PRELOADED_FILES = (coverage_index, road_graph, distance_field, gazetteer)
+
+
+class StartupStats:
+    """Duración de cada paso del arranque (maestro y worker) para /health"""
+
+    def __init__(self):
+        self.preloaded = False
+        self.master = {}
+        self.worker = {}
+
+    def get_stats(self):
+        return {
+            'preloaded': self.preloaded,
+            'master_seconds': dict(self.master),
+            'worker_seconds': dict(self.worker),
+            'pid': os.getpid()
+        }
+
+
+startup = StartupStats()
+
+
+def run_step(timings, name, step):
+    """Ejecutar un paso del arranque midiendo su duración; un error no impide arrancar"""
+    start = time.perf_counter()
+    try:
+        step()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Warm-up {name} error: {str(e)}")
+    timings[name] = round(time.perf_counter() - start, 4)
+
+
+def load_shared(timings):
+    """Mappers, tarifas, tiendas, archivos precalculados y factor de desvío"""
+    run_step(timings, 'mappers', configure_mappers)
+    run_step(timings, 'rate_table', rate_table_cache.get)
+    run_step(timings, 'stores', store_table_cache.get)
+    for loader in PRELOADED_FILES:
+        run_step(timings, loader.config_key.lower().replace('_path', ''), loader.get)
+    run_step(timings, 'detour_factor', detour_factor.get)
+
+
+def preload(app):
+    """
+    Cargar en el proceso maestro de gunicorn lo que comparten los workers
+
+    Con preload_app los workers nacen por fork con todo esto ya en memoria
+    (copy-on-write) en vez de cargarlo cada uno. Nada que abra sockets o
+    threads se crea aquí: las conexiones a la base se cierran antes del
+    fork y las de ORS se abren en cada worker (warm_worker).
+
+    Returns:
+        dict: {paso: segundos}
+    """
+    timings = {}
+    start = time.perf_counter()
+    with app.app_context():
+        load_shared(timings)
+        db.session.remove()
+        db.engine.dispose()
+    timings['total'] = round(time.perf_counter() - start, 4)
+
+    startup.preloaded = True
+    startup.master = timings
+    return timings
+
+
+def open_connections(session, url, count, timeout):
+    """Abrir `count` conexiones keep-alive en paralelo (quedan en el pool de la sesión)"""
+    logger = current_app.logger
+
+    def connect():
+        try:
+            session.head(url, timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Warm-up connection to {url} failed: {str(e)}")
+
+    threads = [threading.Thread(target=connect) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def warm_connections():
+    """Conexiones a ORS/OSRM según los proveedores configurados"""
+    config = current_app.config
+    count = min(config.get('WARMUP_CONNECTIONS', 2), config.get('ORS_POOL_SIZE', 10))
+    if count <= 0:
+        return
+
+    geocoder = config.get('GEOCODER_PROVIDER', 'ors')
+    router = config.get('ROUTER_PROVIDER', 'ors')
+    targets = []
+    if geocoder in ('ors', 'gazetteer') or router == 'ors':
+        targets.append((get_session(), config['ORS_BASE_URL']))
+    if router == 'ors-local':
+        targets.append((get_session(), config['ORS_LOCAL_URL']))
+    if router == 'osrm':
+        targets.append((get_osrm_session(), config['OSRM_BASE_URL']))
+
+    timeout = (config.get('ORS_CONNECT_TIMEOUT', 3), config.get('ORS_READ_TIMEOUT', 10))
+    for session, url in targets:
+        open_connections(session, url, count, timeout)
+
+
+def recent_addresses(limit):
+    """Direcciones distintas (origen y destino) de las cotizaciones más recientes"""
+    addresses = {}
+    rows = db.session.query(DeliveryLog.from_address, DeliveryLog.to_address).order_by(
+        DeliveryLog.id.desc()
+    ).limit(limit).all()
+    for from_address, to_address in rows:
+        for address in (from_address, to_address):
+            if address:
+                addresses.setdefault(address, None)
+    return list(addresses)
+
+
+def warm_geocode_cache():
+    limit = current_app.config.get('WARMUP_RECENT_LOGS', 500)
+    if limit > 0:
+        geocode_cache.preload(recent_addresses(limit))
+
+
+def warm_worker(app):
+    """
+    Preparar un worker recién creado antes de que reciba requests
+
+    Conexión propia a la base, conexiones keep-alive a ORS y LRU de
+    geocodificación con las direcciones de las cotizaciones recientes. Sin
+    preload_app también carga aquí lo que preload() habría dejado listo.
+
+    Returns:
+        dict: {paso: segundos}
+    """
+    timings = {}
+    start = time.perf_counter()
+    with app.app_context():
+        # Por si quedó alguna conexión heredada del maestro: no usarla
+        db.engine.dispose(close=False)
+        run_step(timings, 'database', lambda: db.session.execute(text('SELECT 1')))
+        if not startup.preloaded:
+            load_shared(timings)
+        run_step(timings, 'connections', warm_connections)
+        run_step(timings, 'geocode_cache', warm_geocode_cache)
+        db.session.remove()
+    timings['total'] = round(time.perf_counter() - start, 4)
+
+    startup.worker = timings
+    for step, seconds in timings.items():
+        metrics.observe('shipping_startup_seconds', seconds, step=step)
+    return timings
@@ -0,0 +1,41 @@
+"""
+Actualizar el esquema de la base de datos sin borrar datos
+
+Crea las tablas, columnas e índices que falten (seed_data.py además
+repuebla servicios y tarifas). Con --copy-from copia antes todos los datos
+desde otra base, para pasar de SQLite a Postgres:
+
+    DATABASE_URI=postgresql+psycopg2://envio:clave@db/envio \\
+        python upgrade_db.py --copy-from sqlite:////app/instance/shipping.db
+"""
+import argparse
+import sys
+
+from app import app
+from services.rate_table import rate_table_cache
+from services.schema import copy_database, upgrade_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Actualizar el esquema de la base de datos')
+    parser.add_argument('--copy-from', metavar='URI', help='Copiar los datos desde otra base (destino vacío)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Filas por inserción al copiar')
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(f"🗄️  {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+        added = upgrade_schema()
+        print(f"🔧 Agregados: {', '.join(added)}" if added else "✅ Esquema al día")
+
+        if args.copy_from:
+            try:
+                copied = copy_database(args.copy_from, args.batch_size)
+            except ValueError as e:
+                sys.exit(f"❌ {e}")
+            for table, count in copied.items():
+                print(f"   {table:<20} {count:>8} filas")
+            rate_table_cache.invalidate()
+
+
+if __name__ == '__main__':
+    main()